@@ -1,37 +1,105 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+import codecs
+import gzip
 import hashlib
 import hmac
 import json
 import logging
+import mimetypes
+import mmap
 import os
+import random
 import re
+import secrets
+import sqlite3
+import threading
 import time
 import uuid
-from contextlib import contextmanager
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, TypedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
 
+import httpx
 from fastapi import FastAPI, File, HTTPException, Request, UploadFile
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, Response
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from pydantic import BaseModel, Field
-from sqlalchemy import Boolean, Column, Float, Integer, String, Text
+from sqlalchemy import Boolean, Column, Float, Index, Integer, String, Text, func, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
 
 from db import AuthSession, Base, ChatSession, LoginAttempt, SessionLocal, engine
 
-app = FastAPI()
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; uploads are then stored as-is.
+    Image = None
+    ImageOps = None
+
+try:
+    import redis
+except ImportError:  # Only needed for RATE_LIMIT_BACKEND=redis.
+    redis = None
+
+try:
+    import brotli
+except ImportError:  # Optional; static assets then get .gz siblings only.
+    brotli = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the app's background resources.
+
+    The hooks live next to the resources they manage further down; they are
+    looked up when the server starts, after the whole module has loaded.
+    Shutdown runs in reverse so the webhook queue drains while the database
+    and client are still available.
+    """
+    await capture_dashboard_loop()
+    await open_openai_client()
+    await start_webhook_writer()
+    await start_maintenance()
+    try:
+        yield
+    finally:
+        await stop_maintenance()
+        await stop_webhook_writer()
+        await close_image_pool()
+        await close_openai_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 BASE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BASE_DIR / "static"
 UPLOADS_DIR = STATIC_DIR / "uploads"
+# Partial uploads land outside the static mount so they are never served.
+UPLOADS_TMP_DIR = BASE_DIR / ".upload_tmp"
 
 STATIC_DIR.mkdir(parents=True, exist_ok=True)
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-
-app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+UPLOADS_TMP_DIR.mkdir(parents=True, exist_ok=True)
 
 
 # -------------------------
@@ -57,16 +125,59 @@ def env_bool(name: str, default: bool) -> bool:
     return raw.strip().lower() in {"1", "true", "yes", "on"}
 
 
+def env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
 COOKIE_SECURE = env_bool("COOKIE_SECURE", True)
 MAX_HISTORY = 8
 MAX_MESSAGE_LENGTH = 1500
 MAX_UPLOAD_BYTES = 8 * 1024 * 1024  # 8 MB
+UPLOAD_CHUNK_BYTES = 64 * 1024
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024  # multipart boundaries and part headers
+COMPACT_IMAGE_MAX_SIDE = env_int("COMPACT_IMAGE_MAX_SIDE", 1568)
+COMPACT_IMAGE_QUALITY = env_int("COMPACT_IMAGE_QUALITY", 80)
+COMPACT_IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_WORKERS = env_int("IMAGE_WORKERS", 2)
+UPLOAD_RETENTION_GRACE_SECONDS = env_int("UPLOAD_RETENTION_GRACE_SECONDS", 24 * 3600)
+CHAT_IMAGE_INLINE = env_bool("CHAT_IMAGE_INLINE", True)
+CHAT_IMAGE_INLINE_MAX_BYTES = env_int("CHAT_IMAGE_INLINE_MAX_BYTES", 4 * 1024 * 1024)
+IMAGE_MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
 STATE_CLEANUP_INTERVAL_SECONDS = 15 * 60
-_last_cleanup_at = 0.0
+STATE_CLEANUP_JITTER_SECONDS = 60
+STATE_CLEANUP_BATCH_SIZE = env_int("STATE_CLEANUP_BATCH_SIZE", 500)
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+SESSION_CACHE_MAX_ENTRIES = env_int("SESSION_CACHE_MAX_ENTRIES", 5000)
+# Only safe when a single worker serves every request; see get_session.
+SESSION_MEMORY_CACHE = env_bool("SESSION_MEMORY_CACHE", False)
 
 DEFAULT_SECURITY_PORTAL_URL = os.getenv("BITDEFENDER_PORTAL_URL", "")
 DEFAULT_IDENTITY_PORTAL_URL = os.getenv("NORTON_PORTAL_URL", "")
 DEFAULT_SUPPORT_URL = os.getenv("PARABLE_SUPPORT_URL", "https://calendar.app.google/3ySUu9E6ogv41mgEA")
+VENDOR_REFERENCE_CACHE_TTL_SECONDS = env_int("VENDOR_REFERENCE_CACHE_TTL_SECONDS", 300)
+VENDOR_REFERENCE_CACHE_MAX_ENTRIES = env_int("VENDOR_REFERENCE_CACHE_MAX_ENTRIES", 20000)
 
 
 def now_ts() -> float:
@@ -90,6 +201,94 @@ def format_ts_value(value: Optional[float]) -> Optional[int]:
         return None
 
 
+# -------------------------
+# In-process caches
+# -------------------------
+class LRUTTLCache:
+    """Thread-safe, size-bounded LRU map whose entries also expire.
+
+    Entries default to ``ttl_seconds`` but callers may pass an explicit
+    ``expires_at`` when the backing record carries its own expiry. When
+    ``max_bytes`` is set, callers pass each entry's ``size`` and the cache
+    also evicts to stay under that total.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, max_bytes: Optional[int] = None) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._data: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _drop(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def get(self, key: str) -> Any:
+        now = now_ts()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, _ = entry
+            if expires_at <= now:
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None, size: int = 0) -> None:
+        if expires_at is None:
+            expires_at = now_ts() + self.ttl_seconds
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def prune(self) -> int:
+        now = now_ts()
+        with self._lock:
+            expired = [key for key, (expires_at, _, _) in self._data.items() if expires_at <= now]
+            for key in expired:
+                self._drop(key)
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
 # -------------------------
 # Database context manager
 # -------------------------
@@ -111,6 +310,7 @@ def get_db():
 # -------------------------
 class VendorAccount(Base):
     __tablename__ = "vendor_accounts"
+    __table_args__ = (Index("ix_vendor_accounts_vendor_external_account_id", "vendor", "external_account_id"),)
 
     id = Column(Integer, primary_key=True)
     sid = Column(String(128), index=True, nullable=False)
@@ -136,6 +336,8 @@ class DeviceHealthSnapshot(Base):
     last_seen_at = Column(Float, nullable=True)
     created_at = Column(Float, nullable=False, default=now_ts)
 
+    __table_args__ = (Index("ix_device_health_snapshots_sid_created_at", sid, created_at.desc()),)
+
 
 class IdentityHealthSnapshot(Base):
     __tablename__ = "identity_health_snapshots"
@@ -150,6 +352,8 @@ class IdentityHealthSnapshot(Base):
     last_checked_at = Column(Float, nullable=True)
     created_at = Column(Float, nullable=False, default=now_ts)
 
+    __table_args__ = (Index("ix_identity_health_snapshots_sid_created_at", sid, created_at.desc()),)
+
 
 class VendorAlert(Base):
     __tablename__ = "vendor_alerts"
@@ -163,6 +367,11 @@ class VendorAlert(Base):
     resolved = Column(Boolean, nullable=False, default=False)
     created_at = Column(Float, nullable=False, default=now_ts)
 
+    __table_args__ = (
+        Index("ix_vendor_alerts_sid_resolved_severity", "sid", "resolved", "severity"),
+        Index("ix_vendor_alerts_sid_resolved_vendor", "sid", "resolved", "vendor"),
+    )
+
 
 class VendorSyncLog(Base):
     __tablename__ = "vendor_sync_logs"
@@ -176,49 +385,274 @@ class VendorSyncLog(Base):
     created_at = Column(Float, nullable=False, default=now_ts)
 
 
+class UploadReference(Base):
+    __tablename__ = "upload_references"
+
+    id = Column(Integer, primary_key=True)
+    sid = Column(String(128), index=True, nullable=False)
+    filename = Column(String(100), index=True, nullable=False)
+    created_at = Column(Float, nullable=False, default=now_ts)
+
+
+class DashboardState(Base):
+    """Latest dashboard-relevant state per sid, maintained on every write.
+
+    Derived entirely from vendor_accounts, the snapshot tables and
+    vendor_alerts, so a missing row can always be rebuilt from them.
+    """
+
+    __tablename__ = "dashboard_states"
+
+    sid = Column(String(128), primary_key=True)
+    device_vendor = Column(String(50), nullable=True)
+    device_status = Column(String(50), nullable=True)
+    device_covered_devices = Column(Integer, nullable=False, default=0)
+    device_threats_found = Column(Integer, nullable=False, default=0)
+    device_definitions_current = Column(Boolean, nullable=True)
+    device_last_seen_at = Column(Float, nullable=True)
+    device_created_at = Column(Float, nullable=True)
+    identity_vendor = Column(String(50), nullable=True)
+    identity_monitoring_active = Column(Boolean, nullable=True)
+    identity_alerts_open = Column(Integer, nullable=False, default=0)
+    identity_risk_summary = Column(String(255), nullable=True)
+    identity_id_lock_status = Column(String(50), nullable=True)
+    identity_last_checked_at = Column(Float, nullable=True)
+    identity_created_at = Column(Float, nullable=True)
+    open_alerts_json = Column(Text, nullable=False, default="{}")
+    accounts_json = Column(Text, nullable=False, default="{}")
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(Float, nullable=False, default=now_ts, onupdate=now_ts)
+
+    # Every UPDATE is guarded by the version it read, so two writers racing on
+    # the JSON counters fail with StaleDataError instead of losing a count.
+    __mapper_args__ = {"version_id_col": version}
+
+
 # Create DB tables after all imported and local models exist
 Base.metadata.create_all(bind=engine)
 
 
+def ensure_indexes() -> None:
+    # create_all only builds indexes alongside new tables, so add any index
+    # declared after a table already existed.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+ensure_indexes()
+
+
+QUERY_PLAN_PROBE_SID = "__query_plan_probe__"
+
+
+def dashboard_plan_queries() -> Dict[str, Any]:
+    """The per-sid dashboard reads that must stay on an index."""
+    sid = QUERY_PLAN_PROBE_SID
+    return {
+        "dashboard_state": select(DashboardState).where(DashboardState.sid == sid),
+        "latest_device_snapshot": (
+            select(DeviceHealthSnapshot)
+            .where(DeviceHealthSnapshot.sid == sid)
+            .order_by(DeviceHealthSnapshot.created_at.desc())
+            .limit(1)
+        ),
+        "latest_identity_snapshot": (
+            select(IdentityHealthSnapshot)
+            .where(IdentityHealthSnapshot.sid == sid)
+            .order_by(IdentityHealthSnapshot.created_at.desc())
+            .limit(1)
+        ),
+        "open_alert_counts": (
+            select(VendorAlert.vendor, VendorAlert.severity, func.count(VendorAlert.id))
+            .where(VendorAlert.sid == sid, VendorAlert.resolved == False)
+            .group_by(VendorAlert.vendor, VendorAlert.severity)
+        ),
+        "open_critical_alerts": select(func.count(VendorAlert.id)).where(
+            VendorAlert.sid == sid,
+            VendorAlert.resolved == False,
+            VendorAlert.severity == "critical",
+        ),
+        "open_vendor_alerts": select(func.count(VendorAlert.id)).where(
+            VendorAlert.sid == sid,
+            VendorAlert.resolved == False,
+            VendorAlert.vendor == "norton",
+        ),
+    }
+
+
+# The index each dashboard read must use. A SEARCH on some other index (the
+# single-column sid index, say) still avoids a scan but reads every alert the
+# sid has ever had, so the name is checked too.
+DASHBOARD_PLAN_INDEXES: Dict[str, Tuple[str, ...]] = {
+    "dashboard_state": ("sqlite_autoindex_dashboard_states_1",),
+    "latest_device_snapshot": ("ix_device_health_snapshots_sid_created_at",),
+    "latest_identity_snapshot": ("ix_identity_health_snapshots_sid_created_at",),
+    "open_alert_counts": ("ix_vendor_alerts_sid_resolved_vendor", "ix_vendor_alerts_sid_resolved_severity"),
+    "open_critical_alerts": ("ix_vendor_alerts_sid_resolved_severity",),
+    "open_vendor_alerts": ("ix_vendor_alerts_sid_resolved_vendor",),
+}
+
+
+def plan_problems(details: List[str], indexes: Tuple[str, ...] = ()) -> List[str]:
+    problems = []
+    for detail in details:
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            problems.append(detail)
+        elif "USE TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append(detail)
+    if indexes and not any(f"INDEX {index} " in f"{detail} " for detail in details for index in indexes):
+        problems.append(f"expected {' or '.join(indexes)}; plan was {'; '.join(details)}")
+    return problems
+
+
+def check_dashboard_query_plans(bind=None) -> Dict[str, List[str]]:
+    """Run EXPLAIN QUERY PLAN on the dashboard reads; return any that scan
+    or do not use their DASHBOARD_PLAN_INDEXES entry.
+
+    SQLite only; other engines are skipped and report no problems. Exercised
+    by tests/test_query_plans.py.
+    """
+    bind = bind if bind is not None else engine
+    if bind.dialect.name != "sqlite":
+        return {}
+
+    failures: Dict[str, List[str]] = {}
+    with bind.connect() as conn:
+        for name, stmt in dashboard_plan_queries().items():
+            compiled = stmt.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True})
+            rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).fetchall()
+            problems = plan_problems([str(row[-1]) for row in rows], DASHBOARD_PLAN_INDEXES.get(name, ()))
+            if problems:
+                failures[name] = problems
+    return failures
+
+
 # -------------------------
 # Cleanup / misc helpers
 # -------------------------
-def maybe_cleanup_state() -> None:
-    global _last_cleanup_at
+def delete_in_batches(model, *criteria) -> int:
+    """Delete matching rows a batch at a time, committing between batches.
+
+    Keeps each write transaction short so chat and login writes are never
+    stuck behind one large DELETE.
+    """
+    pk = model.__mapper__.primary_key[0]
+    total = 0
+    while True:
+        with get_db() as db:
+            ids = [row[0] for row in db.query(pk).filter(*criteria).limit(STATE_CLEANUP_BATCH_SIZE).all()]
+            if ids:
+                db.query(model).filter(pk.in_(ids)).delete(synchronize_session=False)
+        total += len(ids)
+        if len(ids) < STATE_CLEANUP_BATCH_SIZE:
+            return total
 
-    now = now_ts()
-    if now - _last_cleanup_at < STATE_CLEANUP_INTERVAL_SECONDS:
-        return
 
-    _last_cleanup_at = now
+def cleanup_expired_auth(now: float) -> int:
+    removed = delete_in_batches(AuthSession, AuthSession.expires_at <= now)
+    _auth_cache.prune()
+    return removed
 
-    with get_db() as db:
-        expired_auth = db.query(AuthSession).filter(AuthSession.expires_at <= now).delete()
-        expired_lockouts = db.query(LoginAttempt).filter(
-            LoginAttempt.locked_until != None,
-            LoginAttempt.locked_until <= now,
-        ).delete()
-        stale_sessions = db.query(ChatSession).filter(
-            ChatSession.last_seen <= now - 7 * 24 * 3600
-        ).delete()
-
-    for bucket in (_chat_rate_windows, _upload_rate_windows, _login_rate_windows):
-        stale_keys: List[str] = []
-        for key, timestamps in bucket.items():
-            fresh = [ts for ts in timestamps if now - ts <= 3600]
-            if fresh:
-                bucket[key] = fresh
-            else:
-                stale_keys.append(key)
-        for key in stale_keys:
-            bucket.pop(key, None)
 
-    logger.info(
-        "State cleanup complete | expired_auth=%s expired_lockouts=%s stale_sessions=%s",
-        expired_auth,
-        expired_lockouts,
-        stale_sessions,
+def cleanup_expired_lockouts(now: float) -> int:
+    return delete_in_batches(
+        LoginAttempt,
+        LoginAttempt.locked_until != None,
+        LoginAttempt.locked_until <= now,
+    )
+
+
+def cleanup_stale_sessions(now: float) -> int:
+    removed = delete_in_batches(ChatSession, ChatSession.last_seen <= now - SESSION_TTL_SECONDS)
+    _session_cache.prune()
+    return removed
+
+
+def cleanup_rate_windows(now: float) -> int:
+    removed = _rate_limit_backend.prune(now, RATE_KEY_IDLE_SECONDS)
+    if _fallback_rate_limit_backend is not _rate_limit_backend:
+        removed += _fallback_rate_limit_backend.prune(now, RATE_KEY_IDLE_SECONDS)
+    return removed
+
+
+# -------------------------
+# Background maintenance
+# -------------------------
+# Each job takes the pass start time and returns how many items it removed.
+# Jobs defined further down the module are wrapped so they resolve at call time.
+MAINTENANCE_JOBS: List[Tuple[str, Callable[[float], int]]] = [
+    ("expired_auth", cleanup_expired_auth),
+    ("expired_lockouts", cleanup_expired_lockouts),
+    ("stale_sessions", cleanup_stale_sessions),
+    ("rate_windows", cleanup_rate_windows),
+    ("tts_cache", lambda now: cleanup_tts_cache(now)),
+    ("uploads", lambda now: cleanup_unreferenced_uploads(now)),
+]
+
+_maintenance_stats: Dict[str, Dict[str, Any]] = {}
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def run_maintenance_job(name: str, job: Callable[[float], int], now: float) -> Optional[int]:
+    stats = _maintenance_stats.setdefault(
+        name,
+        {"runs": 0, "failures": 0, "last_run_at": None, "last_duration_ms": None, "last_removed": None},
     )
+    started = time.perf_counter()
+    removed: Optional[int] = None
+    try:
+        removed = job(now)
+    except Exception:
+        stats["failures"] += 1
+        logger.exception("Maintenance job failed | job=%s", name)
+    stats["runs"] += 1
+    stats["last_run_at"] = int(now)
+    stats["last_duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    stats["last_removed"] = removed
+    return removed
+
+
+async def run_maintenance_pass() -> None:
+    now = now_ts()
+    results: List[str] = []
+    for name, job in MAINTENANCE_JOBS:
+        removed = await run_in_threadpool(run_maintenance_job, name, job, now)
+        results.append(f"{name}={removed}")
+    logger.info("State cleanup complete | %s", " ".join(results))
+
+
+async def maintenance_loop() -> None:
+    # Start inside the first jitter window so several workers booting
+    # together don't all sweep at once.
+    delay = random.uniform(0, STATE_CLEANUP_JITTER_SECONDS)
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await run_maintenance_pass()
+        except Exception:
+            logger.exception("Maintenance pass failed")
+        delay = STATE_CLEANUP_INTERVAL_SECONDS + random.uniform(
+            -STATE_CLEANUP_JITTER_SECONDS, STATE_CLEANUP_JITTER_SECONDS
+        )
+
+
+async def start_maintenance() -> None:
+    global _maintenance_task
+
+    _maintenance_task = asyncio.create_task(maintenance_loop())
+
+
+async def stop_maintenance() -> None:
+    global _maintenance_task
+
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
 
 
 def is_api_path(path: str) -> bool:
@@ -290,11 +724,54 @@ def safe_json_dumps(data: Any) -> str:
 # -------------------------
 # OpenAI client
 # -------------------------
-def get_client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set")
-    return OpenAI(api_key=api_key)
+# One client per process so chat and TTS share a keep-alive connection pool
+# instead of paying a fresh TLS handshake on every request.
+OPENAI_TIMEOUT_SECONDS = env_float("OPENAI_TIMEOUT_SECONDS", 60.0)
+OPENAI_CONNECT_TIMEOUT_SECONDS = env_float("OPENAI_CONNECT_TIMEOUT_SECONDS", 10.0)
+OPENAI_MAX_CONNECTIONS = env_int("OPENAI_MAX_CONNECTIONS", 200)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = env_int("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 50)
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = env_float("OPENAI_KEEPALIVE_EXPIRY_SECONDS", 30.0)
+OPENAI_MAX_RETRIES = env_int("OPENAI_MAX_RETRIES", 2)
+
+_openai_client: Optional[AsyncOpenAI] = None
+
+
+def build_openai_client(api_key: str) -> AsyncOpenAI:
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=OPENAI_MAX_RETRIES)
+
+
+def get_client() -> AsyncOpenAI:
+    global _openai_client
+
+    if _openai_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY is not set")
+        _openai_client = build_openai_client(api_key)
+    return _openai_client
+
+
+async def open_openai_client() -> None:
+    if os.getenv("OPENAI_API_KEY"):
+        get_client()
+    else:
+        logger.warning("OPENAI_API_KEY is not set; chat and voice will fail until it is")
+
+
+async def close_openai_client() -> None:
+    global _openai_client
+
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
 
 
 # -------------------------
@@ -311,35 +788,82 @@ class Session(TypedDict):
     last_seen: float
 
 
+# Write-through cache of ChatSession rows, used only with
+# SESSION_MEMORY_CACHE. Entries expire on the same schedule as the
+# cleanup_stale_sessions maintenance job.
+_session_cache = LRUTTLCache(SESSION_CACHE_MAX_ENTRIES, SESSION_TTL_SECONDS)
+
+
+def copy_session(sess: Session) -> Session:
+    # Callers mutate the returned history before saving, so never hand out
+    # the cached list itself.
+    return {
+        "platform": sess.get("platform"),
+        "history": list(sess.get("history", [])),
+        "last_seen": sess.get("last_seen", now_ts()),
+    }
+
+
 def get_session(sid: str) -> Session:
+    """Load a chat session, creating its row on first use.
+
+    With SESSION_MEMORY_CACHE on, a hit is served from this worker's memory
+    without touching the database. That is only correct for single-worker
+    deployments: with several workers, a save handled elsewhere goes unseen
+    here and the next save_session would overwrite it. It is off by default,
+    so every read goes to the database.
+    """
+    if SESSION_MEMORY_CACHE:
+        cached = _session_cache.get(sid)
+        if cached is not None:
+            return copy_session(cached)
+
     with get_db() as db:
         record = db.query(ChatSession).filter(ChatSession.sid == sid).first()
         if record:
             history = json.loads(record.history_json or "[]")
-            return {"platform": record.platform, "history": history, "last_seen": record.last_seen}
+            sess: Session = {"platform": record.platform, "history": history, "last_seen": record.last_seen}
+        else:
+            sess = {"platform": None, "history": [], "last_seen": now_ts()}
+            db.add(ChatSession(sid=sid, platform=None, history_json="[]", last_seen=sess["last_seen"]))
 
-        db.add(ChatSession(sid=sid, platform=None, history_json="[]", last_seen=now_ts()))
-        return {"platform": None, "history": [], "last_seen": now_ts()}
+    if SESSION_MEMORY_CACHE:
+        _session_cache.set(sid, copy_session(sess), expires_at=sess["last_seen"] + SESSION_TTL_SECONDS)
+    return sess
 
 
 def save_session(sid: str, sess: Session) -> None:
+    now = now_ts()
+    saved = copy_session(sess)
+    saved["last_seen"] = now
+    history_json = json.dumps(saved["history"])
+
     with get_db() as db:
-        record = db.query(ChatSession).filter(ChatSession.sid == sid).first()
-        history_json = json.dumps(sess.get("history", []))
-        if record:
-            record.platform = sess.get("platform")
-            record.history_json = history_json
-            record.last_seen = now_ts()
-        else:
+        updated = (
+            db.query(ChatSession)
+            .filter(ChatSession.sid == sid)
+            .update(
+                {
+                    ChatSession.platform: saved["platform"],
+                    ChatSession.history_json: history_json,
+                    ChatSession.last_seen: now,
+                },
+                synchronize_session=False,
+            )
+        )
+        if not updated:
             db.add(
                 ChatSession(
                     sid=sid,
-                    platform=sess.get("platform"),
+                    platform=saved["platform"],
                     history_json=history_json,
-                    last_seen=now_ts(),
+                    last_seen=now,
                 )
             )
 
+    if SESSION_MEMORY_CACHE:
+        _session_cache.set(sid, saved, expires_at=now + SESSION_TTL_SECONDS)
+
 
 # -------------------------
 # Auth config
@@ -353,6 +877,8 @@ if not APP_USERNAME or not APP_PASSWORD:
 MAX_LOGIN_ATTEMPTS = 3
 LOCKOUT_SECONDS = 30 * 60
 AUTH_TTL_SECONDS = 60 * 60 * 24 * 7
+AUTH_CACHE_TTL_SECONDS = env_int("AUTH_CACHE_TTL_SECONDS", 60)
+AUTH_CACHE_MAX_ENTRIES = env_int("AUTH_CACHE_MAX_ENTRIES", 10000)
 
 # Pre-hash credentials for constant-time comparison
 _APP_USERNAME_HASH = hashlib.sha256(APP_USERNAME.encode()).digest()
@@ -378,34 +904,258 @@ UPLOAD_RATE_LIMIT_WINDOW_SECONDS = 10 * 60
 LOGIN_RATE_LIMIT_COUNT = 10
 LOGIN_RATE_LIMIT_WINDOW_SECONDS = 15 * 60
 MAX_RATE_KEYS = 10000
+RATE_KEY_IDLE_SECONDS = 3600
+
+
+class SlidingWindowBucket:
+    """Sliding-window request log per key, with lazy expiry.
+
+    Each key holds a deque of at most ``max_count`` timestamps. A check pops
+    the expired ones off the front and appends on success, so it is
+    amortized O(1). Keys are kept in LRU order: at MAX_RATE_KEYS the least
+    recently used key is evicted, and the maintenance sweep only walks idle
+    keys from the cold end.
+    """
+
+    def __init__(self, max_keys: int = MAX_RATE_KEYS) -> None:
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._keys: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, max_count: int, window_seconds: int, now: float) -> Tuple[bool, int]:
+        with self._lock:
+            history = self._keys.get(key)
+            if history is None:
+                history = deque()
+                self._keys[key] = history
+                if len(self._keys) > self.max_keys:
+                    self._keys.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._keys.move_to_end(key)
+
+            cutoff = now - window_seconds
+            while history and history[0] < cutoff:
+                history.popleft()
+
+            if len(history) >= max_count:
+                return False, max(1, int(window_seconds - (now - history[0])))
+
+            history.append(now)
+            return True, 0
+
+    def prune(self, now: float, idle_seconds: float) -> int:
+        removed = 0
+        with self._lock:
+            while self._keys:
+                key, history = next(iter(self._keys.items()))
+                if history and now - history[-1] <= idle_seconds:
+                    break
+                self._keys.popitem(last=False)
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"keys": len(self._keys), "evictions": self.evictions}
+
+
+CHAT_RATE_BUCKET = "chat"
+UPLOAD_RATE_BUCKET = "upload"
+LOGIN_RATE_BUCKET = "login"
+
+
+class RateLimitBackend(ABC):
+    """Storage for rate_limit_check.
+
+    ``hit`` records one request for ``key`` in ``bucket`` when it fits in
+    the window and returns (allowed, retry_after_seconds). Backends other
+    than memory share state across worker processes, so the limits hold
+    however many workers run.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def hit(self, bucket: str, key: str, max_count: int, window_seconds: int, now: float) -> Tuple[bool, int]:
+        ...
+
+    def prune(self, now: float, idle_seconds: float) -> int:
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Per-process buckets. Correct only with a single worker."""
+
+    name = "memory"
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, SlidingWindowBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, bucket: str) -> SlidingWindowBucket:
+        with self._lock:
+            if bucket not in self._buckets:
+                self._buckets[bucket] = SlidingWindowBucket()
+            return self._buckets[bucket]
+
+    def hit(self, bucket: str, key: str, max_count: int, window_seconds: int, now: float) -> Tuple[bool, int]:
+        return self._bucket(bucket).hit(key, max_count, window_seconds, now)
+
+    def prune(self, now: float, idle_seconds: float) -> int:
+        with self._lock:
+            buckets = list(self._buckets.values())
+        return sum(bucket.prune(now, idle_seconds) for bucket in buckets)
 
-_chat_rate_windows: Dict[str, List[float]] = {}
-_upload_rate_windows: Dict[str, List[float]] = {}
-_login_rate_windows: Dict[str, List[float]] = {}
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {"backend": self.name, **{name: bucket.stats() for name, bucket in buckets.items()}}
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """Sliding-window log in a SQLite file shared by every worker on the host.
+
+    Each check is one BEGIN IMMEDIATE transaction, so concurrent workers
+    serialize on the write lock and can never both take the last slot.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_events (bucket TEXT NOT NULL, key TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_events_bucket_key_ts ON rate_events (bucket, key, ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_events_ts ON rate_events (ts)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; created lazily so forked workers never
+        # share a handle.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def hit(self, bucket: str, key: str, max_count: int, window_seconds: int, now: float) -> Tuple[bool, int]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM rate_events WHERE bucket = ? AND key = ? AND ts < ?",
+                (bucket, key, now - window_seconds),
+            )
+            count, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(ts) FROM rate_events WHERE bucket = ? AND key = ?",
+                (bucket, key),
+            ).fetchone()
+            if count >= max_count:
+                conn.execute("COMMIT")
+                return False, max(1, int(window_seconds - (now - oldest)))
+            conn.execute("INSERT INTO rate_events (bucket, key, ts) VALUES (?, ?, ?)", (bucket, key, now))
+            conn.execute("COMMIT")
+            return True, 0
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def prune(self, now: float, idle_seconds: float) -> int:
+        cursor = self._conn().execute("DELETE FROM rate_events WHERE ts < ?", (now - idle_seconds,))
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        (events,) = self._conn().execute("SELECT COUNT(*) FROM rate_events").fetchone()
+        return {"backend": self.name, "events": events}
+
+
+_REDIS_SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local max_count = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', '(' .. tostring(now - window))
+if redis.call('ZCARD', key) >= max_count then
+  local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+  return {0, oldest[2]}
+end
+redis.call('ZADD', key, now, ARGV[4])
+redis.call('EXPIRE', key, math.ceil(window))
+return {1, '0'}
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Sliding-window log in a Redis sorted set, updated by one Lua script.
+
+    Works with any client exposing ``register_script``, so a local stand-in
+    such as fakeredis can replace a real server.
+    """
+
+    name = "redis"
+
+    def __init__(self, client: Any, prefix: str = "parable:rl") -> None:
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_REDIS_SLIDING_WINDOW_LUA)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimitBackend":
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        return cls(redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0))
+
+    def hit(self, bucket: str, key: str, max_count: int, window_seconds: int, now: float) -> Tuple[bool, int]:
+        allowed, oldest = self._script(
+            keys=[f"{self.prefix}:{bucket}:{key}"],
+            args=[now, window_seconds, max_count, f"{now}:{uuid.uuid4().hex}"],
+        )
+        if int(allowed):
+            return True, 0
+        return False, max(1, int(window_seconds - (now - float(oldest))))
+
+
+def build_rate_limit_backend() -> RateLimitBackend:
+    kind = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower()
+    if kind == "sqlite":
+        return SQLiteRateLimitBackend(os.getenv("RATE_LIMIT_SQLITE_PATH", str(BASE_DIR / "rate_limits.sqlite3")))
+    if kind == "redis":
+        return RedisRateLimitBackend.from_url(os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0"))
+    if kind != "memory":
+        logger.warning("Unknown RATE_LIMIT_BACKEND=%s; using memory", kind)
+    return MemoryRateLimitBackend()
+
+
+_rate_limit_backend = build_rate_limit_backend()
+# Used only when the shared backend errors, so limits still apply per process.
+_fallback_rate_limit_backend = (
+    _rate_limit_backend if isinstance(_rate_limit_backend, MemoryRateLimitBackend) else MemoryRateLimitBackend()
+)
 
 
 def rate_limit_check(
-    bucket: Dict[str, List[float]],
+    bucket: str,
     key: str,
     max_count: int,
     window_seconds: int,
 ) -> Tuple[bool, int]:
+    """Blocking: the SQLite and Redis backends wait on I/O, so async handlers
+    call this through run_in_threadpool."""
     now = now_ts()
-    history = bucket.get(key, [])
-    history = [ts for ts in history if now - ts <= window_seconds]
-
-    if len(history) >= max_count:
-        retry_after = max(1, int(window_seconds - (now - history[0])))
-        bucket[key] = history
-        return False, retry_after
-
-    # Prevent unbounded growth from many unique keys
-    if key not in bucket and len(bucket) >= MAX_RATE_KEYS:
-        return False, 60
-
-    history.append(now)
-    bucket[key] = history
-    return True, 0
+    try:
+        return _rate_limit_backend.hit(bucket, key, max_count, window_seconds, now)
+    except Exception as exc:
+        logger.warning("Rate limit backend error | backend=%s error=%s", _rate_limit_backend.name, exc)
+        return _fallback_rate_limit_backend.hit(bucket, key, max_count, window_seconds, now)
 
 
 def get_login_key(request: Request, sid: str) -> str:
@@ -470,13 +1220,32 @@ def get_sid(request: Request) -> str:
 # -------------------------
 # Logged-in helpers
 # -------------------------
+# Positive-only cache of authed sids. Entries never outlive the AuthSession
+# row's expires_at, and negatives are not cached so a login on another worker
+# is seen immediately. A logout only clears this worker's entry, though: other
+# workers keep treating the sid as authed for up to AUTH_CACHE_TTL_SECONDS.
+_auth_cache = LRUTTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL_SECONDS)
+
+
+def _cache_sid_authed(sid: str, expires_at: float) -> None:
+    _auth_cache.set(sid, True, expires_at=min(expires_at, now_ts() + AUTH_CACHE_TTL_SECONDS))
+
+
 def _sid_is_authed(sid: str) -> bool:
+    if _auth_cache.get(sid):
+        return True
+
     with get_db() as db:
         record = db.query(AuthSession).filter(
             AuthSession.sid == sid,
             AuthSession.expires_at > now_ts(),
         ).first()
-        return record is not None
+        expires_at = record.expires_at if record else None
+
+    if expires_at is None:
+        return False
+    _cache_sid_authed(sid, expires_at)
+    return True
 
 
 def is_logged_in(request: Request, sid: str) -> bool:
@@ -492,9 +1261,11 @@ def mark_sid_authed(sid: str) -> None:
             record.expires_at = expires
         else:
             db.add(AuthSession(sid=sid, expires_at=expires))
+    _cache_sid_authed(sid, expires)
 
 
 def unmark_sid_authed(sid: str) -> None:
+    _auth_cache.pop(sid)
     with get_db() as db:
         db.query(AuthSession).filter(AuthSession.sid == sid).delete()
 
@@ -575,6 +1346,8 @@ def upsert_vendor_account(
         db.add(record)
 
     if external_account_id is not None:
+        forget_vendor_reference(vendor, record.external_account_id)
+        forget_vendor_reference(vendor, external_account_id)
         record.external_account_id = external_account_id
     if portal_url is not None:
         record.portal_url = portal_url
@@ -599,9 +1372,35 @@ def create_sync_log(db, sid: Optional[str], vendor: str, event_type: str, succes
     )
 
 
+# external_account_id -> sid for webhook routing. Only hits are cached, and
+# upsert_vendor_account drops both the old and new id when an account is
+# re-linked; the TTL bounds staleness from writes on other workers.
+_vendor_reference_cache = LRUTTLCache(VENDOR_REFERENCE_CACHE_MAX_ENTRIES, VENDOR_REFERENCE_CACHE_TTL_SECONDS)
+
+
+def vendor_reference_key(vendor: str, external_account_id: str) -> str:
+    return f"{vendor}:{external_account_id}"
+
+
+def forget_vendor_reference(vendor: str, external_account_id: Optional[str]) -> None:
+    if external_account_id:
+        _vendor_reference_cache.pop(vendor_reference_key(vendor, external_account_id))
+
+
+def cached_vendor_reference(vendor: str, external_account_id: str) -> Optional[str]:
+    return _vendor_reference_cache.get(vendor_reference_key(vendor, external_account_id))
+
+
+def remember_vendor_reference(vendor: str, external_account_id: str, sid: str) -> None:
+    _vendor_reference_cache.set(vendor_reference_key(vendor, external_account_id), sid)
+
+
 def find_sid_for_vendor_reference(db, vendor: str, external_account_id: Optional[str]) -> Optional[str]:
     if not external_account_id:
         return None
+    cached = cached_vendor_reference(vendor, external_account_id)
+    if cached:
+        return cached
     account = (
         db.query(VendorAccount)
         .filter(
@@ -610,168 +1409,1026 @@ def find_sid_for_vendor_reference(db, vendor: str, external_account_id: Optional
         )
         .first()
     )
-    return account.sid if account else None
+    if not account:
+        return None
+    remember_vendor_reference(vendor, external_account_id, account.sid)
+    return account.sid
 
 
-def build_security_summary_for_sid(sid: str) -> Dict[str, Any]:
-    with get_db() as db:
-        vendor_account = get_vendor_account(db, sid, "bitdefender") or get_vendor_account(db, sid, "norton")
-        latest = (
-            db.query(DeviceHealthSnapshot)
-            .filter(DeviceHealthSnapshot.sid == sid)
-            .order_by(DeviceHealthSnapshot.created_at.desc())
-            .first()
+# -------------------------
+# Materialized dashboard state
+# -------------------------
+def open_alert_key(vendor: str, severity: str) -> str:
+    return f"{vendor}:{severity}"
+
+
+def apply_vendor_account_to_state(state: DashboardState, account: VendorAccount) -> None:
+    accounts = json.loads(state.accounts_json or "{}")
+    accounts[account.vendor] = {
+        "subscription_active": account.subscription_active,
+        "portal_url": account.portal_url,
+    }
+    state.accounts_json = json.dumps(accounts)
+
+
+def apply_device_snapshot_to_state(state: DashboardState, row: Dict[str, Any]) -> None:
+    if state.device_created_at is not None and row["created_at"] < state.device_created_at:
+        return
+    state.device_vendor = row["vendor"]
+    state.device_status = row["status"]
+    state.device_covered_devices = row["covered_devices"]
+    state.device_threats_found = row["threats_found"]
+    state.device_definitions_current = row["definitions_current"]
+    state.device_last_seen_at = row["last_seen_at"]
+    state.device_created_at = row["created_at"]
+
+
+def apply_identity_snapshot_to_state(state: DashboardState, row: Dict[str, Any]) -> None:
+    if state.identity_created_at is not None and row["created_at"] < state.identity_created_at:
+        return
+    state.identity_vendor = row["vendor"]
+    state.identity_monitoring_active = row["monitoring_active"]
+    state.identity_alerts_open = row["alerts_open"]
+    state.identity_risk_summary = row["risk_summary"]
+    state.identity_id_lock_status = row["id_lock_status"]
+    state.identity_last_checked_at = row["last_checked_at"]
+    state.identity_created_at = row["created_at"]
+
+
+def apply_alert_to_state(state: DashboardState, row: Dict[str, Any]) -> None:
+    if row["resolved"]:
+        return
+    counts = json.loads(state.open_alerts_json or "{}")
+    key = open_alert_key(row["vendor"], row["severity"])
+    counts[key] = counts.get(key, 0) + 1
+    state.open_alerts_json = json.dumps(counts)
+
+
+def apply_row_to_state(state: DashboardState, model: Any, row: Dict[str, Any]) -> None:
+    if model is DeviceHealthSnapshot:
+        apply_device_snapshot_to_state(state, row)
+    elif model is IdentityHealthSnapshot:
+        apply_identity_snapshot_to_state(state, row)
+    elif model is VendorAlert:
+        apply_alert_to_state(state, row)
+
+
+def snapshot_row(record: Any, columns: List[str]) -> Dict[str, Any]:
+    return {name: getattr(record, name) for name in columns}
+
+
+def rebuild_dashboard_state(db, sid: str) -> DashboardState:
+    """Recompute a sid's state from the source tables without saving it.
+
+    The result is transient, with version 0 and updated_at 0 so repeated reads
+    of a sid that was never written produce the same ETag.
+    """
+    state = DashboardState(
+        sid=sid,
+        device_covered_devices=0,
+        device_threats_found=0,
+        identity_alerts_open=0,
+        open_alerts_json="{}",
+        accounts_json="{}",
+        version=0,
+        updated_at=0.0,
+    )
+
+    for account in db.query(VendorAccount).filter(VendorAccount.sid == sid).order_by(VendorAccount.id.asc()):
+        apply_vendor_account_to_state(state, account)
+
+    device = (
+        db.query(DeviceHealthSnapshot)
+        .filter(DeviceHealthSnapshot.sid == sid)
+        .order_by(DeviceHealthSnapshot.created_at.desc())
+        .first()
+    )
+    if device:
+        apply_device_snapshot_to_state(
+            state,
+            snapshot_row(
+                device,
+                ["vendor", "status", "covered_devices", "threats_found", "definitions_current", "last_seen_at", "created_at"],
+            ),
         )
-        open_critical = (
-            db.query(VendorAlert)
-            .filter(
-                VendorAlert.sid == sid,
-                VendorAlert.resolved == False,
-                VendorAlert.severity == "critical",
-            )
-            .count()
+
+    identity = (
+        db.query(IdentityHealthSnapshot)
+        .filter(IdentityHealthSnapshot.sid == sid)
+        .order_by(IdentityHealthSnapshot.created_at.desc())
+        .first()
+    )
+    if identity:
+        apply_identity_snapshot_to_state(
+            state,
+            snapshot_row(
+                identity,
+                [
+                    "vendor",
+                    "monitoring_active",
+                    "alerts_open",
+                    "risk_summary",
+                    "id_lock_status",
+                    "last_checked_at",
+                    "created_at",
+                ],
+            ),
         )
 
-        if not latest:
-            return {
-                "ok": True,
-                "vendor": "Bitdefender",
-                "status": "not_connected",
-                "last_seen": None,
-                "threats_found": 0,
-                "definitions_current": None,
-                "subscription_active": vendor_account.subscription_active if vendor_account else None,
-                "covered_devices": 0,
-                "critical_alerts": open_critical,
-                "portal_url": (
-                    vendor_account.portal_url if vendor_account and vendor_account.portal_url else DEFAULT_SECURITY_PORTAL_URL
-                ),
-            }
+    counts: Dict[str, int] = {}
+    grouped = (
+        db.query(VendorAlert.vendor, VendorAlert.severity, func.count(VendorAlert.id))
+        .filter(VendorAlert.sid == sid, VendorAlert.resolved == False)
+        .group_by(VendorAlert.vendor, VendorAlert.severity)
+    )
+    for vendor, severity, count in grouped:
+        counts[open_alert_key(vendor, severity)] = count
+    state.open_alerts_json = json.dumps(counts)
+    return state
+
 
-        vendor_name = (latest.vendor or "Bitdefender").title()
-        status = normalize_status(latest.status)
-        if open_critical > 0 and status in {"protected", "unknown", "not_connected"}:
-            status = "critical"
+DASHBOARD_WRITE_ATTEMPTS = env_int("DASHBOARD_WRITE_ATTEMPTS", 5)
+DASHBOARD_STATE_INSERT_CHUNK = 50
 
+
+def insert_dashboard_states(db, states: List[DashboardState]) -> None:
+    """Insert rebuilt states, skipping any sid another writer got to first."""
+    now = now_ts()
+    rows = []
+    for state in states:
+        row = {column.name: getattr(state, column.key) for column in DashboardState.__table__.columns}
+        row.update(version=1, updated_at=now)
+        rows.append(row)
+
+    if engine.dialect.name == "postgresql":
+        make_insert = postgresql_insert
+    elif engine.dialect.name == "sqlite":
+        make_insert = sqlite_insert
+    else:
+        # No portable upsert; a duplicate raises IntegrityError and the
+        # surrounding run_dashboard_write() retries against the winner's row.
+        db.bulk_insert_mappings(DashboardState, rows)
+        return
+
+    for offset in range(0, len(rows), DASHBOARD_STATE_INSERT_CHUNK):
+        chunk = rows[offset : offset + DASHBOARD_STATE_INSERT_CHUNK]
+        db.execute(make_insert(DashboardState).values(chunk).on_conflict_do_nothing(index_elements=["sid"]))
+
+
+def load_dashboard_states(db, sids: List[str]) -> Dict[str, DashboardState]:
+    """Fetch the state row for each sid, materializing missing ones first.
+
+    For use inside run_dashboard_write(); read-only paths use
+    read_dashboard_state().
+    """
+    unique_sids = sorted(set(sids))
+    states: Dict[str, DashboardState] = {}
+    for offset in range(0, len(unique_sids), WEBHOOK_LOOKUP_CHUNK):
+        chunk = unique_sids[offset : offset + WEBHOOK_LOOKUP_CHUNK]
+        found = {state.sid: state for state in db.query(DashboardState).filter(DashboardState.sid.in_(chunk))}
+        missing = [rebuild_dashboard_state(db, sid) for sid in chunk if sid not in found]
+        if missing:
+            insert_dashboard_states(db, missing)
+            found = {state.sid: state for state in db.query(DashboardState).filter(DashboardState.sid.in_(chunk))}
+        states.update(found)
+    return states
+
+
+def load_dashboard_state(db, sid: str) -> DashboardState:
+    return load_dashboard_states(db, [sid])[sid]
+
+
+def read_dashboard_state(db, sid: str) -> DashboardState:
+    """The sid's state row, or a transient rebuild. Never writes."""
+    state = db.get(DashboardState, sid)
+    if state is None:
+        state = rebuild_dashboard_state(db, sid)
+    return state
+
+
+def is_write_conflict(exc: Exception) -> bool:
+    if isinstance(exc, StaleDataError):
+        return True
+    message = str(exc).lower()
+    if isinstance(exc, IntegrityError):
+        return "unique" in message or "duplicate" in message
+    return isinstance(exc, OperationalError) and "locked" in message
+
+
+def run_dashboard_write(write: Callable[[Any], Any]) -> Any:
+    """Run write(db) in its own transaction, retrying on a write conflict.
+
+    Conflicts come from the version check on DashboardState or from two
+    writers materializing the same sid; the retry re-reads the winner's row.
+    """
+    for attempt in range(DASHBOARD_WRITE_ATTEMPTS):
+        try:
+            with get_db() as db:
+                return write(db)
+        except Exception as exc:
+            if not is_write_conflict(exc) or attempt + 1 >= DASHBOARD_WRITE_ATTEMPTS:
+                raise
+            time.sleep(random.uniform(0.005, 0.05) * (attempt + 1))
+
+
+def pick_account(state: DashboardState, *vendors: str) -> Optional[Dict[str, Any]]:
+    accounts = json.loads(state.accounts_json or "{}")
+    for vendor in vendors:
+        if vendor in accounts:
+            return accounts[vendor]
+    return None
+
+
+def count_open_alerts(state: DashboardState, vendor: Optional[str] = None, severity: Optional[str] = None) -> int:
+    total = 0
+    for key, count in json.loads(state.open_alerts_json or "{}").items():
+        key_vendor, _, key_severity = key.partition(":")
+        if vendor is not None and key_vendor != vendor:
+            continue
+        if severity is not None and key_severity != severity:
+            continue
+        total += count
+    return total
+
+
+def security_summary_from_state(state: DashboardState) -> Dict[str, Any]:
+    vendor_account = pick_account(state, "bitdefender", "norton")
+    open_critical = count_open_alerts(state, severity="critical")
+    subscription_active = vendor_account["subscription_active"] if vendor_account else None
+    portal_url = (
+        vendor_account["portal_url"] if vendor_account and vendor_account["portal_url"] else DEFAULT_SECURITY_PORTAL_URL
+    )
+
+    if state.device_created_at is None:
         return {
             "ok": True,
-            "vendor": vendor_name,
-            "status": status,
-            "last_seen": format_ts_value(latest.last_seen_at),
-            "threats_found": int(latest.threats_found or 0),
-            "definitions_current": latest.definitions_current,
-            "subscription_active": vendor_account.subscription_active if vendor_account else None,
-            "covered_devices": int(latest.covered_devices or 0),
+            "vendor": "Bitdefender",
+            "status": "not_connected",
+            "last_seen": None,
+            "threats_found": 0,
+            "definitions_current": None,
+            "subscription_active": subscription_active,
+            "covered_devices": 0,
             "critical_alerts": open_critical,
-            "portal_url": (
-                vendor_account.portal_url if vendor_account and vendor_account.portal_url else DEFAULT_SECURITY_PORTAL_URL
-            ),
+            "portal_url": portal_url,
         }
 
+    vendor_name = (state.device_vendor or "Bitdefender").title()
+    status = normalize_status(state.device_status)
+    if open_critical > 0 and status in {"protected", "unknown", "not_connected"}:
+        status = "critical"
 
-def build_identity_summary_for_sid(sid: str) -> Dict[str, Any]:
-    with get_db() as db:
-        vendor_account = get_vendor_account(db, sid, "norton") or get_vendor_account(db, sid, "bitdefender")
-        latest = (
-            db.query(IdentityHealthSnapshot)
-            .filter(IdentityHealthSnapshot.sid == sid)
-            .order_by(IdentityHealthSnapshot.created_at.desc())
-            .first()
-        )
-        open_alerts = (
-            db.query(VendorAlert)
-            .filter(
-                VendorAlert.sid == sid,
-                VendorAlert.resolved == False,
-                VendorAlert.vendor == "norton",
-            )
-            .count()
-        )
+    return {
+        "ok": True,
+        "vendor": vendor_name,
+        "status": status,
+        "last_seen": format_ts_value(state.device_last_seen_at),
+        "threats_found": int(state.device_threats_found or 0),
+        "definitions_current": state.device_definitions_current,
+        "subscription_active": subscription_active,
+        "covered_devices": int(state.device_covered_devices or 0),
+        "critical_alerts": open_critical,
+        "portal_url": portal_url,
+    }
 
-        if not latest:
-            return {
-                "ok": True,
-                "vendor": "Norton",
-                "monitoring_active": None,
-                "alerts_open": open_alerts,
-                "risk_summary": "Not connected yet",
-                "id_lock_status": "unknown",
-                "last_checked": None,
-                "subscription_active": vendor_account.subscription_active if vendor_account else None,
-                "portal_url": (
-                    vendor_account.portal_url if vendor_account and vendor_account.portal_url else DEFAULT_IDENTITY_PORTAL_URL
-                ),
-            }
 
-        vendor_name = (latest.vendor or "Norton").title()
+def identity_summary_from_state(state: DashboardState) -> Dict[str, Any]:
+    vendor_account = pick_account(state, "norton", "bitdefender")
+    open_alerts = count_open_alerts(state, vendor="norton")
+    subscription_active = vendor_account["subscription_active"] if vendor_account else None
+    portal_url = (
+        vendor_account["portal_url"] if vendor_account and vendor_account["portal_url"] else DEFAULT_IDENTITY_PORTAL_URL
+    )
+
+    if state.identity_created_at is None:
         return {
             "ok": True,
-            "vendor": vendor_name,
-            "monitoring_active": latest.monitoring_active,
-            "alerts_open": max(int(latest.alerts_open or 0), open_alerts),
-            "risk_summary": latest.risk_summary or "No summary available",
-            "id_lock_status": latest.id_lock_status or "unknown",
-            "last_checked": format_ts_value(latest.last_checked_at),
-            "subscription_active": vendor_account.subscription_active if vendor_account else None,
-            "portal_url": (
-                vendor_account.portal_url if vendor_account and vendor_account.portal_url else DEFAULT_IDENTITY_PORTAL_URL
-            ),
+            "vendor": "Norton",
+            "monitoring_active": None,
+            "alerts_open": open_alerts,
+            "risk_summary": "Not connected yet",
+            "id_lock_status": "unknown",
+            "last_checked": None,
+            "subscription_active": subscription_active,
+            "portal_url": portal_url,
         }
 
+    vendor_name = (state.identity_vendor or "Norton").title()
+    return {
+        "ok": True,
+        "vendor": vendor_name,
+        "monitoring_active": state.identity_monitoring_active,
+        "alerts_open": max(int(state.identity_alerts_open or 0), open_alerts),
+        "risk_summary": state.identity_risk_summary or "No summary available",
+        "id_lock_status": state.identity_id_lock_status or "unknown",
+        "last_checked": format_ts_value(state.identity_last_checked_at),
+        "subscription_active": subscription_active,
+        "portal_url": portal_url,
+    }
+
 
-def build_dashboard_summary_for_sid(sid: str) -> Dict[str, Any]:
-    security = build_security_summary_for_sid(sid)
-    identity = build_identity_summary_for_sid(sid)
+def dashboard_summary_from_state(state: DashboardState) -> Dict[str, Any]:
     return {
         "ok": True,
-        "security": security,
-        "identity": identity,
+        "security": security_summary_from_state(state),
+        "identity": identity_summary_from_state(state),
         "support_url": DEFAULT_SUPPORT_URL,
     }
 
 
+def summary_changes(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Only the card fields that differ between two dashboard summaries."""
+    changes: Dict[str, Any] = {}
+    for card in ("security", "identity"):
+        before = previous.get(card) or {}
+        fields = {key: value for key, value in current[card].items() if before.get(key) != value}
+        if fields:
+            changes[card] = fields
+    return changes
+
+
 # -------------------------
-# API models
+# Dashboard push
 # -------------------------
-class ChatIn(BaseModel):
-    message: str = Field(default="", max_length=MAX_MESSAGE_LENGTH)
-    image_url: Optional[str] = None
-
+# Writers publish a sid after commit; each open /api/dashboard/stream for
+# that sid re-reads the state row and sends the fields that changed.
+DASHBOARD_STREAM_MAX_CONNECTIONS = env_int("DASHBOARD_STREAM_MAX_CONNECTIONS", 1000)
+DASHBOARD_STREAM_MAX_PER_SID = env_int("DASHBOARD_STREAM_MAX_PER_SID", 5)
+DASHBOARD_STREAM_HEARTBEAT_SECONDS = env_float("DASHBOARD_STREAM_HEARTBEAT_SECONDS", 20.0)
+DASHBOARD_STREAM_RETRY_MS = env_int("DASHBOARD_STREAM_RETRY_MS", 5000)
+
+
+class DashboardBroker:
+    """In-process fan-out of "this sid changed" notifications.
+
+    All methods run on the event loop; other threads go through
+    publish_dashboard_change(), which hops onto the loop first.
+    """
+
+    def __init__(self, max_connections: int, max_per_sid: int):
+        self.max_connections = max_connections
+        self.max_per_sid = max_per_sid
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._count = 0
+        self.published = 0
+        self.delivered = 0
+        self.rejected = 0
+
+    def subscribe(self, sid: str) -> Optional[asyncio.Queue]:
+        queues = self._subscribers.setdefault(sid, [])
+        if self._count >= self.max_connections or len(queues) >= self.max_per_sid:
+            if not queues:
+                del self._subscribers[sid]
+            self.rejected += 1
+            return None
+        # One pending notification is enough: the stream always reads the
+        # latest state, so extra wakeups would only repeat work.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        queues.append(queue)
+        self._count += 1
+        return queue
+
+    def unsubscribe(self, sid: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(sid)
+        if not queues or queue not in queues:
+            return
+        queues.remove(queue)
+        self._count -= 1
+        if not queues:
+            del self._subscribers[sid]
+
+    def publish(self, sids: List[str]) -> None:
+        for sid in set(sids):
+            self.published += 1
+            for queue in self._subscribers.get(sid, []):
+                if queue.empty():
+                    queue.put_nowait(sid)
+                    self.delivered += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self._count,
+            "sids": len(self._subscribers),
+            "max_connections": self.max_connections,
+            "published": self.published,
+            "delivered": self.delivered,
+            "rejected": self.rejected,
+        }
 
-class SpeakIn(BaseModel):
-    text: str = Field(..., min_length=1, max_length=2000)
 
+_dashboard_broker = DashboardBroker(DASHBOARD_STREAM_MAX_CONNECTIONS, DASHBOARD_STREAM_MAX_PER_SID)
+_dashboard_loop: Optional[asyncio.AbstractEventLoop] = None
 
-class LoginIn(BaseModel):
-    username: str = Field(..., min_length=1, max_length=128)
-    password: str = Field(..., min_length=1, max_length=256)
 
+async def capture_dashboard_loop() -> None:
+    global _dashboard_loop
 
-class IntegrationConnectIn(BaseModel):
-    target_sid: str = Field(..., min_length=10, max_length=128)
-    external_account_id: Optional[str] = Field(default=None, max_length=255)
-    portal_url: Optional[str] = Field(default=None, max_length=500)
-    display_name: Optional[str] = Field(default=None, max_length=255)
-    subscription_active: Optional[bool] = None
-    status: Optional[str] = Field(default=None, max_length=50)
-    covered_devices: Optional[int] = Field(default=None, ge=0, le=100000)
-    threats_found: Optional[int] = Field(default=None, ge=0, le=100000)
-    definitions_current: Optional[bool] = None
-    last_seen_at: Optional[float] = None
-    monitoring_active: Optional[bool] = None
-    alerts_open: Optional[int] = Field(default=None, ge=0, le=100000)
-    risk_summary: Optional[str] = Field(default=None, max_length=255)
-    id_lock_status: Optional[str] = Field(default=None, max_length=50)
-    last_checked_at: Optional[float] = None
+    _dashboard_loop = asyncio.get_running_loop()
+
+
+def publish_dashboard_change(sids: List[str]) -> None:
+    """Notify dashboard streams; safe to call from any thread, after commit."""
+    if _dashboard_loop is None or not sids:
+        return
+    try:
+        _dashboard_loop.call_soon_threadsafe(_dashboard_broker.publish, list(sids))
+    except RuntimeError:
+        # Loop already closed during shutdown.
+        pass
+
+
+# -------------------------
+# Webhook ingest
+# -------------------------
+# Webhooks are validated and acknowledged on the request path, then written
+# by a single background task that group-commits whatever has queued up.
+WEBHOOK_QUEUE_MAX_DEPTH = env_int("WEBHOOK_QUEUE_MAX_DEPTH", 10000)
+WEBHOOK_BATCH_SIZE = env_int("WEBHOOK_BATCH_SIZE", 200)
+WEBHOOK_RETRY_AFTER_SECONDS = 5
+WEBHOOK_DRAIN_TIMEOUT_SECONDS = 10.0
+WEBHOOK_BATCH_MAX_ITEMS = env_int("WEBHOOK_BATCH_MAX_ITEMS", 5000)
+WEBHOOK_BATCH_MAX_BYTES = env_int("WEBHOOK_BATCH_MAX_BYTES", 10 * 1024 * 1024)
+WEBHOOK_LOOKUP_CHUNK = 500
+
+
+class WebhookEvent(TypedDict):
+    vendor: str
+    sid: str
+    fields: Dict[str, Any]
+    raw: Dict[str, Any]
+    received_at: float
+
+
+_webhook_queue: Optional[asyncio.Queue] = None
+_webhook_writer_task: Optional[asyncio.Task] = None
+_webhook_stats: Dict[str, Any] = {
+    "accepted": 0,
+    "rejected_full": 0,
+    "written": 0,
+    "failed": 0,
+    "batches": 0,
+    "max_depth": 0,
+    "last_batch_size": 0,
+    "last_batch_ms": None,
+}
+
+
+def parse_bitdefender_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": normalize_status(payload.get("status"), "unknown"),
+        "threats_found": int(payload.get("threats_found") or 0),
+        "covered_devices": int(payload.get("covered_devices") or 0),
+        "definitions_current": payload.get("definitions_current"),
+        "last_seen_at": float(payload.get("last_seen_at") or now_ts()),
+        "severity": (payload.get("severity") or "info").strip().lower(),
+        "title": (payload.get("title") or "Bitdefender update").strip(),
+        "detail": payload.get("detail"),
+        "resolved": bool(payload.get("resolved", False)),
+    }
+
+
+def parse_norton_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "monitoring_active": payload.get("monitoring_active"),
+        "alerts_open": int(payload.get("alerts_open") or 0),
+        "risk_summary": payload.get("risk_summary") or "No summary available",
+        "id_lock_status": (payload.get("id_lock_status") or "unknown").strip().lower(),
+        "last_checked_at": float(payload.get("last_checked_at") or now_ts()),
+        "severity": (payload.get("severity") or "info").strip().lower(),
+        "title": (payload.get("title") or "Norton identity update").strip(),
+        "detail": payload.get("detail"),
+        "resolved": bool(payload.get("resolved", False)),
+    }
+
+
+WEBHOOK_PARSERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "bitdefender": parse_bitdefender_webhook,
+    "norton": parse_norton_webhook,
+}
+
+
+def webhook_event_rows(event: WebhookEvent) -> List[Tuple[Any, Dict[str, Any]]]:
+    vendor = event["vendor"]
+    sid = event["sid"]
+    fields = event["fields"]
+    created_at = event["received_at"]
+    rows: List[Tuple[Any, Dict[str, Any]]] = []
+
+    if vendor == "bitdefender":
+        rows.append(
+            (
+                DeviceHealthSnapshot,
+                {
+                    "sid": sid,
+                    "vendor": vendor,
+                    "status": fields["status"],
+                    "covered_devices": fields["covered_devices"],
+                    "threats_found": fields["threats_found"],
+                    "definitions_current": fields["definitions_current"],
+                    "last_seen_at": fields["last_seen_at"],
+                    "created_at": created_at,
+                },
+            )
+        )
+    else:
+        rows.append(
+            (
+                IdentityHealthSnapshot,
+                {
+                    "sid": sid,
+                    "vendor": vendor,
+                    "monitoring_active": fields["monitoring_active"],
+                    "alerts_open": fields["alerts_open"],
+                    "risk_summary": fields["risk_summary"],
+                    "id_lock_status": fields["id_lock_status"],
+                    "last_checked_at": fields["last_checked_at"],
+                    "created_at": created_at,
+                },
+            )
+        )
+
+    if fields["detail"] or fields["title"]:
+        rows.append(
+            (
+                VendorAlert,
+                {
+                    "sid": sid,
+                    "vendor": vendor,
+                    "severity": fields["severity"],
+                    "title": fields["title"],
+                    "detail": fields["detail"],
+                    "resolved": fields["resolved"],
+                    "created_at": created_at,
+                },
+            )
+        )
+
+    rows.append(
+        (
+            VendorSyncLog,
+            {
+                "sid": sid,
+                "vendor": vendor,
+                "event_type": "webhook",
+                "success": True,
+                "detail": safe_json_dumps(event["raw"]),
+                "created_at": now_ts(),
+            },
+        )
+    )
+    return rows
+
+
+def insert_webhook_events(db, events: List[WebhookEvent]) -> None:
+    # States are loaded before the new rows exist so a rebuild never counts
+    # this batch twice.
+    states = load_dashboard_states(db, [event["sid"] for event in events])
+
+    # One executemany INSERT per table instead of one per row.
+    grouped: Dict[Any, List[Dict[str, Any]]] = {}
+    for event in events:
+        for model, row in webhook_event_rows(event):
+            grouped.setdefault(model, []).append(row)
+            apply_row_to_state(states[event["sid"]], model, row)
+    for model, rows in grouped.items():
+        db.bulk_insert_mappings(model, rows)
+
+
+def commit_webhook_events(events: List[WebhookEvent]) -> List[bool]:
+    """Write events in one transaction; on failure retry them one by one.
+
+    Returns per-event success so one bad event never drops the rest.
+    """
+    try:
+        run_dashboard_write(lambda db: insert_webhook_events(db, events))
+        publish_dashboard_change([event["sid"] for event in events])
+        return [True] * len(events)
+    except Exception:
+        logger.exception("Webhook batch failed, retrying one by one | size=%s", len(events))
+
+    results: List[bool] = []
+    for event in events:
+        try:
+            run_dashboard_write(lambda db: insert_webhook_events(db, [event]))
+            results.append(True)
+        except Exception:
+            logger.exception("Webhook event dropped | vendor=%s sid=%s", event["vendor"], event["sid"])
+            results.append(False)
+    publish_dashboard_change([event["sid"] for event, ok in zip(events, results) if ok])
+    return results
+
+
+def write_webhook_batch(batch: List[WebhookEvent]) -> None:
+    started = time.perf_counter()
+    results = commit_webhook_events(batch)
+    written = sum(results)
+
+    _webhook_stats["written"] += written
+    _webhook_stats["failed"] += len(batch) - written
+    _webhook_stats["batches"] += 1
+    _webhook_stats["last_batch_size"] = len(batch)
+    _webhook_stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def get_webhook_queue() -> asyncio.Queue:
+    global _webhook_queue
+
+    if _webhook_queue is None:
+        _webhook_queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_MAX_DEPTH)
+    return _webhook_queue
+
+
+def enqueue_webhook_event(event: WebhookEvent) -> bool:
+    queue = get_webhook_queue()
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        _webhook_stats["rejected_full"] += 1
+        return False
+    _webhook_stats["accepted"] += 1
+    _webhook_stats["max_depth"] = max(_webhook_stats["max_depth"], queue.qsize())
+    return True
+
+
+def webhook_queue_stats() -> Dict[str, Any]:
+    depth = _webhook_queue.qsize() if _webhook_queue is not None else 0
+    return {**_webhook_stats, "depth": depth, "max_queue_depth": WEBHOOK_QUEUE_MAX_DEPTH}
+
+
+async def webhook_writer_loop() -> None:
+    queue = get_webhook_queue()
+    while True:
+        batch: List[WebhookEvent] = [await queue.get()]
+        # Whatever arrived while the previous batch was committing goes into
+        # this one, so batches grow with load without adding idle latency.
+        while len(batch) < WEBHOOK_BATCH_SIZE:
+            try:
+                batch.append(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        try:
+            await run_in_threadpool(write_webhook_batch, batch)
+        except Exception:
+            logger.exception("Webhook writer error | size=%s", len(batch))
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+
+async def start_webhook_writer() -> None:
+    global _webhook_writer_task
+
+    _webhook_writer_task = asyncio.create_task(webhook_writer_loop())
+
+
+async def stop_webhook_writer() -> None:
+    global _webhook_writer_task
+
+    if _webhook_writer_task is None:
+        return
+    try:
+        await asyncio.wait_for(get_webhook_queue().join(), timeout=WEBHOOK_DRAIN_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("Webhook queue not drained on shutdown | depth=%s", get_webhook_queue().qsize())
+    _webhook_writer_task.cancel()
+    try:
+        await _webhook_writer_task
+    except asyncio.CancelledError:
+        pass
+    _webhook_writer_task = None
+
+
+def resolve_webhook_sid(vendor: str, payload: Dict[str, Any]) -> str:
+    target_sid = str(payload.get("target_sid") or payload.get("sid") or "").strip()
+    if target_sid:
+        return target_sid
+    with get_db() as db:
+        return find_sid_for_vendor_reference(db, vendor, payload.get("external_account_id")) or ""
+
+
+async def accept_webhook(request: Request, vendor: str):
+    caller_sid = get_sid(request)
+    await run_in_threadpool(require_integration_access, request, caller_sid)
+    payload = await request.json()
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Webhook body must be a JSON object")
+
+    target_sid = await run_in_threadpool(resolve_webhook_sid, vendor, payload)
+    if not target_sid:
+        raise HTTPException(status_code=400, detail="target_sid or known external_account_id required")
+
+    try:
+        fields = WEBHOOK_PARSERS[vendor](payload)
+    except (TypeError, ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+
+    event: WebhookEvent = {
+        "vendor": vendor,
+        "sid": target_sid,
+        "fields": fields,
+        "raw": payload,
+        "received_at": now_ts(),
+    }
+    if not enqueue_webhook_event(event):
+        logger.warning("Webhook queue full | vendor=%s sid=%s", vendor, target_sid)
+        resp = api_error("Webhook queue is full. Please retry shortly.", 503)
+        resp.headers["Retry-After"] = str(WEBHOOK_RETRY_AFTER_SECONDS)
+        return resp
+
+    return JSONResponse({"ok": True, "queued": True}, status_code=202)
+
+
+class WebhookBatchParser:
+    """Incremental parser for an NDJSON stream or a single JSON array.
+
+    The format is picked from the first non-blank character. ``feed`` returns
+    the items completed so far as (payload, error) pairs. A bad NDJSON line
+    only fails that item; a malformed array element ends the batch, since
+    there is no reliable way to find the next element.
+    """
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._mode: Optional[str] = None
+        self._array_closed = False
+        self.broken = False
+
+    def feed(self, chunk: bytes, final: bool = False) -> List[Tuple[Any, Optional[str]]]:
+        self._buffer += self._text.decode(chunk, final=final)
+        if self._mode is None:
+            stripped = self._buffer.lstrip()
+            if not stripped:
+                return []
+            self._mode = "array" if stripped[0] == "[" else "ndjson"
+            self._buffer = stripped[1:] if self._mode == "array" else stripped
+        if self._mode == "array":
+            return self._feed_array(final)
+        return self._feed_ndjson(final)
+
+    def _feed_ndjson(self, final: bool) -> List[Tuple[Any, Optional[str]]]:
+        lines = self._buffer.split("\n")
+        self._buffer = "" if final else lines.pop()
+        items: List[Tuple[Any, Optional[str]]] = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append((json.loads(line), None))
+            except ValueError:
+                items.append((None, "Invalid JSON"))
+        return items
+
+    def _feed_array(self, final: bool) -> List[Tuple[Any, Optional[str]]]:
+        items: List[Tuple[Any, Optional[str]]] = []
+        pos = 0
+        text = self._buffer
+        while not self._array_closed and not self.broken:
+            while pos < len(text) and (text[pos].isspace() or text[pos] == ","):
+                pos += 1
+            if pos >= len(text):
+                break
+            if text[pos] == "]":
+                self._array_closed = True
+                pos += 1
+                break
+            try:
+                value, pos = self._decoder.raw_decode(text, pos)
+            except ValueError:
+                if final:
+                    items.append((None, "Invalid JSON"))
+                    self.broken = True
+                break
+            items.append((value, None))
+        self._buffer = text[pos:]
+        if final and not self._array_closed and not self.broken:
+            self.broken = True
+            items.append((None, "Unterminated JSON array"))
+        return items
+
+
+async def read_webhook_batch(request: Request) -> List[Tuple[Any, Optional[str]]]:
+    parser = WebhookBatchParser()
+    items: List[Tuple[Any, Optional[str]]] = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > WEBHOOK_BATCH_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Batch too large")
+        items.extend(parser.feed(chunk))
+        if len(items) > WEBHOOK_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Batch has more than {WEBHOOK_BATCH_MAX_ITEMS} events")
+        if parser.broken:
+            break
+    if not parser.broken:
+        items.extend(parser.feed(b"", final=True))
+    if len(items) > WEBHOOK_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch has more than {WEBHOOK_BATCH_MAX_ITEMS} events")
+    return items
+
+
+def resolve_vendor_references(vendor: str, external_ids: List[str]) -> Dict[str, str]:
+    """Map external_account_id to sid for a whole batch in a few IN queries."""
+    resolved: Dict[str, str] = {}
+    unique_ids: List[str] = []
+    for external_account_id in sorted(set(external_ids)):
+        cached = cached_vendor_reference(vendor, external_account_id)
+        if cached:
+            resolved[external_account_id] = cached
+        else:
+            unique_ids.append(external_account_id)
+    if not unique_ids:
+        return resolved
+    with get_db() as db:
+        for offset in range(0, len(unique_ids), WEBHOOK_LOOKUP_CHUNK):
+            chunk = unique_ids[offset : offset + WEBHOOK_LOOKUP_CHUNK]
+            rows = (
+                db.query(VendorAccount.external_account_id, VendorAccount.sid)
+                .filter(
+                    VendorAccount.vendor == vendor,
+                    VendorAccount.external_account_id.in_(chunk),
+                )
+                .all()
+            )
+            for external_account_id, sid in rows:
+                if external_account_id not in resolved:
+                    resolved[external_account_id] = sid
+                    remember_vendor_reference(vendor, external_account_id, sid)
+    return resolved
+
+
+def ingest_webhook_batch(vendor: str, items: List[Tuple[Any, Optional[str]]]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = [{"index": index, "ok": False} for index in range(len(items))]
+    candidates: List[Tuple[int, Dict[str, Any], Dict[str, Any]]] = []
+
+    for index, (payload, error) in enumerate(items):
+        if error:
+            results[index]["error"] = error
+            continue
+        if not isinstance(payload, dict):
+            results[index]["error"] = "Event must be a JSON object"
+            continue
+        try:
+            fields = WEBHOOK_PARSERS[vendor](payload)
+        except (TypeError, ValueError, AttributeError):
+            results[index]["error"] = "Invalid webhook payload"
+            continue
+        candidates.append((index, payload, fields))
+
+    references = resolve_vendor_references(
+        vendor,
+        [
+            str(payload.get("external_account_id"))
+            for _, payload, _ in candidates
+            if not (payload.get("target_sid") or payload.get("sid")) and payload.get("external_account_id")
+        ],
+    )
+
+    received_at = now_ts()
+    events: List[WebhookEvent] = []
+    indexes: List[int] = []
+    for index, payload, fields in candidates:
+        target_sid = str(payload.get("target_sid") or payload.get("sid") or "").strip()
+        if not target_sid and payload.get("external_account_id"):
+            target_sid = references.get(str(payload.get("external_account_id")), "")
+        if not target_sid:
+            results[index]["error"] = "target_sid or known external_account_id required"
+            continue
+        events.append(
+            {"vendor": vendor, "sid": target_sid, "fields": fields, "raw": payload, "received_at": received_at}
+        )
+        indexes.append(index)
+
+    if events:
+        for index, ok in zip(indexes, commit_webhook_events(events)):
+            results[index]["ok"] = ok
+            if not ok:
+                results[index]["error"] = "Write failed"
+    return results
+
+
+@app.post("/api/integrations/{vendor}/webhook/batch")
+async def webhook_batch_api(vendor: str, request: Request):
+    """Accept many webhook events in one request, as NDJSON or a JSON array.
+
+    Events are validated, routed and bulk-inserted synchronously, and the
+    response reports a result for every item in input order.
+    """
+    vendor = vendor.strip().lower()
+    if vendor not in WEBHOOK_PARSERS:
+        raise HTTPException(status_code=404, detail="Unknown vendor")
+
+    caller_sid = get_sid(request)
+    await run_in_threadpool(require_integration_access, request, caller_sid)
+
+    items = await read_webhook_batch(request)
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch was empty")
+
+    results = await run_in_threadpool(ingest_webhook_batch, vendor, items)
+    accepted = sum(1 for result in results if result["ok"])
+    logger.info("Webhook batch | vendor=%s items=%s accepted=%s", vendor, len(results), accepted)
+    return {
+        "ok": accepted == len(results),
+        "accepted": accepted,
+        "failed": len(results) - accepted,
+        "results": results,
+    }
+
+
+# -------------------------
+# API models
+# -------------------------
+class ChatIn(BaseModel):
+    message: str = Field(default="", max_length=MAX_MESSAGE_LENGTH)
+    image_url: Optional[str] = None
+
+
+class SpeakIn(BaseModel):
+    text: str = Field(..., min_length=1, max_length=2000)
+
+
+class LoginIn(BaseModel):
+    username: str = Field(..., min_length=1, max_length=128)
+    password: str = Field(..., min_length=1, max_length=256)
+
+
+class IntegrationConnectIn(BaseModel):
+    target_sid: str = Field(..., min_length=10, max_length=128)
+    external_account_id: Optional[str] = Field(default=None, max_length=255)
+    portal_url: Optional[str] = Field(default=None, max_length=500)
+    display_name: Optional[str] = Field(default=None, max_length=255)
+    subscription_active: Optional[bool] = None
+    status: Optional[str] = Field(default=None, max_length=50)
+    covered_devices: Optional[int] = Field(default=None, ge=0, le=100000)
+    threats_found: Optional[int] = Field(default=None, ge=0, le=100000)
+    definitions_current: Optional[bool] = None
+    last_seen_at: Optional[float] = None
+    monitoring_active: Optional[bool] = None
+    alerts_open: Optional[int] = Field(default=None, ge=0, le=100000)
+    risk_summary: Optional[str] = Field(default=None, max_length=255)
+    id_lock_status: Optional[str] = Field(default=None, max_length=50)
+    last_checked_at: Optional[float] = None
 
 
 # -------------------------
 # Middleware
 # -------------------------
+def is_upload_request(method: str, path: str) -> bool:
+    return method == "POST" and path == "/api/upload-image"
+
+
+def upload_too_large(request: Request) -> bool:
+    if not is_upload_request(request.method, request.url.path):
+        return False
+    declared = request.headers.get("content-length", "")
+    return declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+
+
+class UploadLimitMiddleware:
+    """Abort an image upload as soon as its body passes the size limit.
+
+    upload_too_large only sees a declared Content-Length. A chunked upload has
+    none, and Starlette would spool all of it before save_upload_stream gets
+    to count. Raising from receive stops the multipart parser mid-body, and
+    the HTTPException handler sends the 413.
+    """
+
+    def __init__(self, app, limit: int = MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES):
+        self.app = app
+        self.limit = limit
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not is_upload_request(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    raise HTTPException(status_code=413, detail="Image too large (max 8MB)")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadLimitMiddleware)
+
+
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
-    maybe_cleanup_state()
-    response = await call_next(request)
+    if upload_too_large(request):
+        # Reject before the multipart body is read and spooled.
+        response = api_error("Image too large (max 8MB)", 413)
+    else:
+        response = await call_next(request)
 
     response.headers["X-Content-Type-Options"] = "nosniff"
     response.headers["X-Frame-Options"] = "ALLOW-FROM https://www.parablesmartphone.com"
@@ -780,18 +2437,182 @@ async def add_security_headers(request: Request, call_next):
     response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
     response.headers["Content-Security-Policy"] = (
         "default-src 'self'; "
-        "script-src 'self' 'unsafe-inline'; "
+        "script-src 'self'; "
         "style-src 'self' 'unsafe-inline'; "
         "img-src 'self' data: blob:; "
         "media-src 'self' blob:; "
         "connect-src 'self'; "
         "frame-ancestors 'self' https://www.parablesmartphone.com https://parablesmartphone.com;"
     )
-    response.headers["Cache-Control"] = "no-store"
+    # Handlers that know their payload is cacheable set their own policy.
+    response.headers.setdefault("Cache-Control", "no-store")
 
     return response
 
 
+COMPRESSION_MIN_BYTES = env_int("COMPRESSION_MIN_BYTES", 1024)
+COMPRESSION_GZIP_LEVEL = env_int("COMPRESSION_GZIP_LEVEL", 6)
+COMPRESSION_BROTLI_QUALITY = env_int("COMPRESSION_BROTLI_QUALITY", 5)
+# Already-compressed media gains nothing; event streams must reach the
+# client unbuffered.
+COMPRESSION_SKIP_TYPES = (
+    "image/",
+    "audio/",
+    "video/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/octet-stream",
+    "text/event-stream",
+)
+
+_compression_stats: Dict[str, int] = {"responses": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def accepted_encodings(header: str) -> set:
+    accepted = set()
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+    return accepted
+
+
+def pick_compression(accept_encoding: str) -> Optional[str]:
+    accepted = accepted_encodings(accept_encoding)
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compressible_response(status: int, headers: Headers) -> bool:
+    if status < 200 or status in (204, 206, 304):
+        return False
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    return not content_type.startswith(COMPRESSION_SKIP_TYPES)
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    # An encoded body is not byte-identical to the one the handler tagged, so
+    # its strong ETag becomes weak. If-None-Match uses weak comparison, so
+    # revalidation still gets 304s from etag_matches and StaticFiles.
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class StreamCompressor:
+    """Incremental gzip/brotli encoder that flushes at each chunk boundary."""
+
+    def __init__(self, coding: str):
+        self.coding = coding
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.coding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + (self._zlib.flush() if final else self._zlib.flush(zlib.Z_SYNC_FLUSH))
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip, negotiated by Accept-Encoding.
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed bodies are encoded
+    chunk by chunk instead of buffered. Small bodies, skipped content types
+    and responses that already carry a Content-Encoding (precompressed
+    static files) pass through untouched. Encoded responses and 304s to
+    clients that negotiated an encoding carry a weak ETag.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = pick_compression(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Dict[str, Any]] = None
+        compressor: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def compressing_send(message) -> None:
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                if compressible_response(message["status"], Headers(raw=message["headers"])):
+                    start_message = message
+                else:
+                    if message["status"] == 304:
+                        # Keep the validator the client stored with the
+                        # encoded body instead of swapping in the strong one.
+                        headers = MutableHeaders(raw=message["headers"])
+                        weaken_etag(headers)
+                        headers.add_vary_header("Accept-Encoding")
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = StreamCompressor(coding)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = coding
+                headers.add_vary_header("Accept-Encoding")
+                weaken_etag(headers)
+                encoded = compressor.compress(body, final=not more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(encoded))
+                await send(start_message)
+            else:
+                encoded = compressor.compress(body, final=not more_body)
+
+            _compression_stats["bytes_in"] += len(body)
+            _compression_stats["bytes_out"] += len(encoded)
+            if not more_body:
+                _compression_stats["responses"] += 1
+            await send({"type": "http.response.body", "body": encoded, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+
+app.add_middleware(CompressionMiddleware)
+
+
 # -------------------------
 # Exception handlers
 # -------------------------
@@ -848,7 +2669,7 @@ def login_api(payload: LoginIn, request: Request):
 
     # Global per-IP login rate limit (before lockout check)
     allowed, retry_after = rate_limit_check(
-        _login_rate_windows,
+        LOGIN_RATE_BUCKET,
         client_ip,
         LOGIN_RATE_LIMIT_COUNT,
         LOGIN_RATE_LIMIT_WINDOW_SECONDS,
@@ -949,35 +2770,108 @@ def me_api(request: Request):
 # -------------------------
 # Dashboard APIs
 # -------------------------
-@app.get("/api/dashboard/security")
-def dashboard_security_api(request: Request):
+DASHBOARD_CACHE_CONTROL = "private, no-cache"
+
+
+def dashboard_etag(state: DashboardState, resource: str) -> str:
+    # Version alone could repeat if a state row is ever rebuilt, so the
+    # last write time is folded in as well.
+    token = f"{state.sid}:{state.version}:{state.updated_at!r}"
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+    return f'"{resource}-{digest}"'
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def dashboard_response(request: Request, resource: str, build: Callable[[DashboardState], Dict[str, Any]]) -> Response:
     sid = get_sid(request)
     if not is_logged_in(request, sid):
         raise HTTPException(status_code=401, detail="Login required")
 
-    resp = JSONResponse(build_security_summary_for_sid(sid))
+    with get_db() as db:
+        state = read_dashboard_state(db, sid)
+        etag = dashboard_etag(state, resource)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            resp: Response = Response(status_code=304)
+        else:
+            resp = JSONResponse(build(state))
+
+    resp.headers["ETag"] = etag
+    resp.headers["Cache-Control"] = DASHBOARD_CACHE_CONTROL
     set_sid_cookie(resp, sid)
     return resp
 
 
+@app.get("/api/dashboard/security")
+def dashboard_security_api(request: Request):
+    return dashboard_response(request, "security", security_summary_from_state)
+
+
 @app.get("/api/dashboard/identity")
 def dashboard_identity_api(request: Request):
-    sid = get_sid(request)
-    if not is_logged_in(request, sid):
-        raise HTTPException(status_code=401, detail="Login required")
-
-    resp = JSONResponse(build_identity_summary_for_sid(sid))
-    set_sid_cookie(resp, sid)
-    return resp
+    return dashboard_response(request, "identity", identity_summary_from_state)
 
 
 @app.get("/api/dashboard/summary")
 def dashboard_summary_api(request: Request):
+    return dashboard_response(request, "summary", dashboard_summary_from_state)
+
+
+@app.get("/api/dashboard/stream")
+async def dashboard_stream_api(request: Request):
+    """Push dashboard card changes for the caller's sid as Server-Sent Events.
+
+    Sends one ``summary`` event with both cards on connect, then ``update``
+    events carrying only the changed fields, plus comment heartbeats.
+    """
     sid = get_sid(request)
-    if not is_logged_in(request, sid):
+    if not await run_in_threadpool(is_logged_in, request, sid):
         raise HTTPException(status_code=401, detail="Login required")
 
-    resp = JSONResponse(build_dashboard_summary_for_sid(sid))
+    queue = _dashboard_broker.subscribe(sid)
+    if queue is None:
+        resp = JSONResponse({"ok": False, "error": "Too many live connections."}, status_code=503)
+        resp.headers["Retry-After"] = str(DASHBOARD_STREAM_RETRY_MS // 1000)
+        return resp
+
+    def read_summary() -> Dict[str, Any]:
+        with get_db() as db:
+            return dashboard_summary_from_state(read_dashboard_state(db, sid))
+
+    async def event_stream():
+        try:
+            last = await run_in_threadpool(read_summary)
+            yield f"retry: {DASHBOARD_STREAM_RETRY_MS}\n\n"
+            yield sse_event({"type": "summary", "summary": last})
+            while True:
+                try:
+                    await asyncio.wait_for(queue.get(), timeout=DASHBOARD_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+
+                current = await run_in_threadpool(read_summary)
+                changes = summary_changes(last, current)
+                last = current
+                if changes:
+                    yield sse_event({"type": "update", "changes": changes})
+        finally:
+            _dashboard_broker.unsubscribe(sid, queue)
+
+    resp = StreamingResponse(event_stream(), media_type="text/event-stream")
+    resp.headers["X-Accel-Buffering"] = "no"
     set_sid_cookie(resp, sid)
     return resp
 
@@ -987,7 +2881,8 @@ def bitdefender_connect_api(payload: IntegrationConnectIn, request: Request):
     caller_sid = get_sid(request)
     require_integration_access(request, caller_sid)
 
-    with get_db() as db:
+    def save(db) -> None:
+        state = load_dashboard_state(db, payload.target_sid)
         account = upsert_vendor_account(
             db,
             sid=payload.target_sid,
@@ -997,20 +2892,21 @@ def bitdefender_connect_api(payload: IntegrationConnectIn, request: Request):
             subscription_active=payload.subscription_active,
             display_name=payload.display_name,
         )
+        apply_vendor_account_to_state(state, account)
 
         if payload.status is not None or payload.covered_devices is not None or payload.threats_found is not None:
-            db.add(
-                DeviceHealthSnapshot(
-                    sid=payload.target_sid,
-                    vendor="bitdefender",
-                    status=normalize_status(payload.status, "unknown"),
-                    covered_devices=int(payload.covered_devices or 0),
-                    threats_found=int(payload.threats_found or 0),
-                    definitions_current=payload.definitions_current,
-                    last_seen_at=payload.last_seen_at or now_ts(),
-                    created_at=now_ts(),
-                )
-            )
+            snapshot = {
+                "sid": payload.target_sid,
+                "vendor": "bitdefender",
+                "status": normalize_status(payload.status, "unknown"),
+                "covered_devices": int(payload.covered_devices or 0),
+                "threats_found": int(payload.threats_found or 0),
+                "definitions_current": payload.definitions_current,
+                "last_seen_at": payload.last_seen_at or now_ts(),
+                "created_at": now_ts(),
+            }
+            db.add(DeviceHealthSnapshot(**snapshot))
+            apply_device_snapshot_to_state(state, snapshot)
 
         create_sync_log(
             db,
@@ -1027,6 +2923,8 @@ def bitdefender_connect_api(payload: IntegrationConnectIn, request: Request):
             ),
         )
 
+    run_dashboard_write(save)
+    publish_dashboard_change([payload.target_sid])
     return {"ok": True, "message": "Bitdefender connection saved"}
 
 
@@ -1035,7 +2933,8 @@ def norton_connect_api(payload: IntegrationConnectIn, request: Request):
     caller_sid = get_sid(request)
     require_integration_access(request, caller_sid)
 
-    with get_db() as db:
+    def save(db) -> None:
+        state = load_dashboard_state(db, payload.target_sid)
         account = upsert_vendor_account(
             db,
             sid=payload.target_sid,
@@ -1045,6 +2944,7 @@ def norton_connect_api(payload: IntegrationConnectIn, request: Request):
             subscription_active=payload.subscription_active,
             display_name=payload.display_name,
         )
+        apply_vendor_account_to_state(state, account)
 
         if (
             payload.monitoring_active is not None
@@ -1052,18 +2952,18 @@ def norton_connect_api(payload: IntegrationConnectIn, request: Request):
             or payload.risk_summary is not None
             or payload.id_lock_status is not None
         ):
-            db.add(
-                IdentityHealthSnapshot(
-                    sid=payload.target_sid,
-                    vendor="norton",
-                    monitoring_active=payload.monitoring_active,
-                    alerts_open=int(payload.alerts_open or 0),
-                    risk_summary=payload.risk_summary,
-                    id_lock_status=(payload.id_lock_status or "unknown").strip().lower(),
-                    last_checked_at=payload.last_checked_at or now_ts(),
-                    created_at=now_ts(),
-                )
-            )
+            snapshot = {
+                "sid": payload.target_sid,
+                "vendor": "norton",
+                "monitoring_active": payload.monitoring_active,
+                "alerts_open": int(payload.alerts_open or 0),
+                "risk_summary": payload.risk_summary,
+                "id_lock_status": (payload.id_lock_status or "unknown").strip().lower(),
+                "last_checked_at": payload.last_checked_at or now_ts(),
+                "created_at": now_ts(),
+            }
+            db.add(IdentityHealthSnapshot(**snapshot))
+            apply_identity_snapshot_to_state(state, snapshot)
 
         create_sync_log(
             db,
@@ -1080,145 +2980,207 @@ def norton_connect_api(payload: IntegrationConnectIn, request: Request):
             ),
         )
 
+    run_dashboard_write(save)
+    publish_dashboard_change([payload.target_sid])
     return {"ok": True, "message": "Norton connection saved"}
 
 
 @app.post("/api/integrations/bitdefender/webhook")
 async def bitdefender_webhook_api(request: Request):
-    caller_sid = get_sid(request)
-    require_integration_access(request, caller_sid)
-    payload = await request.json()
+    return await accept_webhook(request, "bitdefender")
 
-    target_sid = (payload.get("target_sid") or payload.get("sid") or "").strip()
-    if not target_sid:
-        with get_db() as db:
-            target_sid = (
-                find_sid_for_vendor_reference(db, "bitdefender", payload.get("external_account_id")) or ""
-            )
-    if not target_sid:
-        raise HTTPException(status_code=400, detail="target_sid or known external_account_id required")
 
-    status = normalize_status(payload.get("status"), "unknown")
-    threats_found = int(payload.get("threats_found") or 0)
-    covered_devices = int(payload.get("covered_devices") or 0)
-    definitions_current = payload.get("definitions_current")
-    last_seen_at = payload.get("last_seen_at") or now_ts()
-    severity = (payload.get("severity") or "info").strip().lower()
-    title = (payload.get("title") or "Bitdefender update").strip()
-    detail = payload.get("detail")
+@app.post("/api/integrations/norton/webhook")
+async def norton_webhook_api(request: Request):
+    return await accept_webhook(request, "norton")
 
-    with get_db() as db:
-        db.add(
-            DeviceHealthSnapshot(
-                sid=target_sid,
-                vendor="bitdefender",
-                status=status,
-                covered_devices=covered_devices,
-                threats_found=threats_found,
-                definitions_current=definitions_current,
-                last_seen_at=last_seen_at,
-                created_at=now_ts(),
-            )
-        )
 
-        if detail or title:
-            db.add(
-                VendorAlert(
-                    sid=target_sid,
-                    vendor="bitdefender",
-                    severity=severity,
-                    title=title,
-                    detail=detail,
-                    resolved=bool(payload.get("resolved", False)),
-                    created_at=now_ts(),
-                )
-            )
+# -------------------------
+# Image processing
+# -------------------------
+_image_pool: Optional[ProcessPoolExecutor] = None
 
-        create_sync_log(
-            db,
-            sid=target_sid,
-            vendor="bitdefender",
-            event_type="webhook",
-            success=True,
-            detail=safe_json_dumps(payload),
-        )
 
-    return {"ok": True}
+def compact_variant_name(filename: str) -> str:
+    return f"{Path(filename).stem}.c.webp"
 
 
-@app.post("/api/integrations/norton/webhook")
-async def norton_webhook_api(request: Request):
-    caller_sid = get_sid(request)
-    require_integration_access(request, caller_sid)
-    payload = await request.json()
+def make_compact_image(src_path: str, dst_path: str) -> Tuple[int, int, int]:
+    """Decode, orient, downscale and re-encode an upload as WebP.
 
-    target_sid = (payload.get("target_sid") or payload.get("sid") or "").strip()
-    if not target_sid:
-        with get_db() as db:
-            target_sid = find_sid_for_vendor_reference(db, "norton", payload.get("external_account_id")) or ""
-    if not target_sid:
-        raise HTTPException(status_code=400, detail="target_sid or known external_account_id required")
+    Runs in the image process pool. Metadata is dropped because nothing but
+    pixels is passed to save(). Returns (width, height, bytes).
+    """
+    Image.MAX_IMAGE_PIXELS = COMPACT_IMAGE_MAX_PIXELS
+    with Image.open(src_path) as img:
+        # Pillow only raises at twice MAX_IMAGE_PIXELS (it just warns below
+        # that), so enforce the cap here; open() has read the header only.
+        if img.width * img.height > COMPACT_IMAGE_MAX_PIXELS:
+            raise Image.DecompressionBombError(
+                f"{img.width}x{img.height} exceeds {COMPACT_IMAGE_MAX_PIXELS} pixels"
+            )
+        img.seek(0)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((COMPACT_IMAGE_MAX_SIDE, COMPACT_IMAGE_MAX_SIDE))
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        img.save(dst_path, "WEBP", quality=COMPACT_IMAGE_QUALITY, method=4)
+        width, height = img.size
+    return width, height, os.path.getsize(dst_path)
 
-    monitoring_active = payload.get("monitoring_active")
-    alerts_open = int(payload.get("alerts_open") or 0)
-    risk_summary = payload.get("risk_summary") or "No summary available"
-    id_lock_status = (payload.get("id_lock_status") or "unknown").strip().lower()
-    last_checked_at = payload.get("last_checked_at") or now_ts()
-    severity = (payload.get("severity") or "info").strip().lower()
-    title = (payload.get("title") or "Norton identity update").strip()
-    detail = payload.get("detail")
 
-    with get_db() as db:
-        db.add(
-            IdentityHealthSnapshot(
-                sid=target_sid,
-                vendor="norton",
-                monitoring_active=monitoring_active,
-                alerts_open=alerts_open,
-                risk_summary=risk_summary,
-                id_lock_status=id_lock_status,
-                last_checked_at=last_checked_at,
-                created_at=now_ts(),
-            )
-        )
+def get_image_pool() -> ProcessPoolExecutor:
+    global _image_pool
 
-        if detail or title:
-            db.add(
-                VendorAlert(
-                    sid=target_sid,
-                    vendor="norton",
-                    severity=severity,
-                    title=title,
-                    detail=detail,
-                    resolved=bool(payload.get("resolved", False)),
-                    created_at=now_ts(),
-                )
-            )
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=max(1, IMAGE_WORKERS))
+    return _image_pool
 
-        create_sync_log(
-            db,
-            sid=target_sid,
-            vendor="norton",
-            event_type="webhook",
-            success=True,
-            detail=safe_json_dumps(payload),
-        )
 
-    return {"ok": True}
+async def close_image_pool() -> None:
+    global _image_pool
+
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=False, cancel_futures=True)
+        _image_pool = None
+
+
+async def create_compact_variant(filename: str) -> Optional[str]:
+    if Image is None:
+        return None
+
+    compact_name = compact_variant_name(filename)
+    src_path = UPLOADS_DIR / filename
+    dst_path = UPLOADS_DIR / compact_name
+    if dst_path.is_file():
+        return compact_name
+    try:
+        loop = asyncio.get_running_loop()
+        width, height, size = await loop.run_in_executor(
+            get_image_pool(), make_compact_image, str(src_path), str(dst_path)
+        )
+    except Exception:
+        logger.warning("Compact image failed | file=%s", filename, exc_info=True)
+        dst_path.unlink(missing_ok=True)
+        return None
+
+    logger.info("Compact image ready | file=%s size=%sx%s bytes=%s", compact_name, width, height, size)
+    return compact_name
+
+
+def prefer_compact_upload(image_url: str, base: str) -> str:
+    prefix = f"{base}/static/uploads/"
+    if not image_url.startswith(prefix):
+        return image_url
+    filename = image_url[len(prefix):]
+    if not filename or "/" in filename or filename.endswith(".c.webp"):
+        return image_url
+    compact_name = compact_variant_name(filename)
+    if (UPLOADS_DIR / compact_name).is_file():
+        return prefix + compact_name
+    return image_url
+
+
+# -------------------------
+# Upload retention
+# -------------------------
+def upload_key(filename: str) -> str:
+    # "<sha256>.png" and its "<sha256>.c.webp" variant share a key.
+    return filename.split(".", 1)[0]
+
+
+def record_upload_reference(sid: str, filename: str) -> None:
+    with get_db() as db:
+        exists = (
+            db.query(UploadReference.id)
+            .filter(UploadReference.sid == sid, UploadReference.filename == filename)
+            .first()
+        )
+        if not exists:
+            db.add(UploadReference(sid=sid, filename=filename, created_at=now_ts()))
+
+
+def cleanup_unreferenced_uploads(now: float) -> int:
+    """Drop references whose ChatSession is gone, then unreferenced files.
+
+    Anything younger than UPLOAD_RETENTION_GRACE_SECONDS is kept so an upload
+    that has not reached /api/chat yet is never removed.
+    """
+    cutoff = now - UPLOAD_RETENTION_GRACE_SECONDS
+    with get_db() as db:
+        db.query(UploadReference).filter(
+            UploadReference.created_at <= cutoff,
+            UploadReference.sid.notin_(select(ChatSession.sid)),
+        ).delete(synchronize_session=False)
+        referenced = {upload_key(row.filename) for row in db.query(UploadReference.filename).distinct()}
+
+    removed = 0
+    for path in UPLOADS_DIR.iterdir():
+        if not path.is_file() or upload_key(path.name) in referenced:
+            continue
+        try:
+            if path.stat().st_mtime <= cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+# -------------------------
+# Upload endpoint
+# -------------------------
+async def save_upload_stream(file: UploadFile, ext: str) -> Tuple[str, int, bool]:
+    """Copy an upload to UPLOADS_DIR in chunks, hashing as it goes.
+
+    Aborts with 413 as soon as MAX_UPLOAD_BYTES is crossed. File I/O runs in
+    the threadpool and the partial file only moves into place once complete.
+    Files are named by their SHA-256, so a repeat upload reuses the stored
+    copy. Returns (filename, size, duplicate).
+    """
+    hasher = hashlib.sha256()
+    total = 0
+    tmp_path = UPLOADS_TMP_DIR / f"{uuid.uuid4().hex}.part"
+    out = await run_in_threadpool(tmp_path.open, "wb")
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="Image too large (max 8MB)")
+            hasher.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+        await run_in_threadpool(out.close)
+
+        if total == 0:
+            raise HTTPException(status_code=400, detail="File was empty")
+
+        filename = f"{hasher.hexdigest()}{ext}"
+        out_path = UPLOADS_DIR / filename
+        if out_path.is_file():
+            # Refresh mtime so the retention sweep treats it as recently used.
+            await run_in_threadpool(os.utime, out_path)
+            return filename, total, True
+        await run_in_threadpool(tmp_path.replace, out_path)
+        return filename, total, False
+    finally:
+        if not out.closed:
+            await run_in_threadpool(out.close)
+        tmp_path.unlink(missing_ok=True)
 
 
-# -------------------------
-# Upload endpoint
-# -------------------------
 @app.post("/api/upload-image")
 async def upload_image(request: Request, file: UploadFile = File(...)):
     sid = get_sid(request)
 
-    if not is_logged_in(request, sid):
+    if not await run_in_threadpool(is_logged_in, request, sid):
         raise HTTPException(status_code=401, detail="Login required")
 
-    allowed, retry_after = rate_limit_check(
-        _upload_rate_windows,
+    allowed, retry_after = await run_in_threadpool(
+        rate_limit_check,
+        UPLOAD_RATE_BUCKET,
         get_rate_key(request, sid),
         UPLOAD_RATE_LIMIT_COUNT,
         UPLOAD_RATE_LIMIT_WINDOW_SECONDS,
@@ -1240,39 +3202,65 @@ async def upload_image(request: Request, file: UploadFile = File(...)):
     if ext not in [".jpg", ".jpeg", ".png", ".webp", ".gif"]:
         ext = ".jpg"
 
-    data = await file.read()
-    if not data:
-        raise HTTPException(status_code=400, detail="File was empty")
-
-    if len(data) > MAX_UPLOAD_BYTES:
-        raise HTTPException(status_code=413, detail="Image too large (max 8MB)")
+    filename, size, duplicate = await save_upload_stream(file, ext)
+    compact_name = await create_compact_variant(filename)
+    await run_in_threadpool(record_upload_reference, sid, filename)
 
-    filename = f"{uuid.uuid4().hex}{ext}"
-    out_path = UPLOADS_DIR / filename
-    out_path.write_bytes(data)
-
-    full_url = str(request.base_url).rstrip("/") + f"/static/uploads/{filename}"
+    uploads_url = str(request.base_url).rstrip("/") + "/static/uploads/"
     logger.info(
-        "Image uploaded | sid=%s ip=%s file=%s bytes=%s",
+        "Image uploaded | sid=%s ip=%s file=%s bytes=%s duplicate=%s compact=%s",
         sid,
         get_client_ip(request),
         filename,
-        len(data),
+        size,
+        duplicate,
+        compact_name,
     )
-    return {"ok": True, "url": full_url}
+    return {
+        "ok": True,
+        "url": uploads_url + filename,
+        "compact_url": uploads_url + compact_name if compact_name else None,
+    }
 
 
 # -------------------------
 # Chat endpoint
 # -------------------------
-@app.post("/api/chat")
-def chat_api(payload: ChatIn, request: Request):
-    sid = get_sid(request)
-    sess = get_session(sid)
+CHAT_MODEL = "gpt-4.1-mini"
+CHAT_FALLBACK_ANSWER = "I had trouble answering that. Please try again."
+CHAT_SCREENSHOT_PROMPT = "Please check this screenshot. Is it suspicious? What should I do?"
+CHAT_SYSTEM_TEXT = (
+    "You are a friendly support helper at Parable, a company that helps people "
+    "stay safe and get the most out of their smartphones. You genuinely care about "
+    "the person you're talking to.\n"
+    "\n"
+    "How to sound:\n"
+    "- Write like a patient friend who's good with phones, not a manual.\n"
+    "- Use everyday language. Skip jargon and acronyms.\n"
+    "- Vary your phrasing naturally. Don't start every sentence the same way.\n"
+    "- A little warmth goes a long way — brief acknowledgments like "
+    "'Good question' or 'That's a common one' feel human. But don't overdo it.\n"
+    "- Keep answers concise. A few clear steps beat a wall of text.\n"
+    "- When you mention a setting, include the path (e.g. Settings > Accessibility > Zoom) "
+    "so they can find it easily.\n"
+    "- If you need more info, ask one simple question.\n"
+    "- If something sounds like a scam or suspicious pop-up, lead with safety: "
+    "'Don't tap anything on that screen yet.' Then explain why and what to do.\n"
+    "\n"
+    "If someone shares a screenshot:\n"
+    "- Describe what you notice in the image so they know you're looking at the right thing.\n"
+    "- If it looks suspicious, say so plainly and explain what tipped you off.\n"
+    "- Give them clear next steps to stay safe.\n"
+    "- If the image is too blurry or cut off, just ask for a clearer one.\n"
+    "\n"
+    "After giving steps, check in naturally — something like 'Let me know if that helps' "
+    "or 'Does that make sense?' Vary it so it doesn't feel scripted.\n"
+)
 
-    message = (payload.message or "").strip()
-    image_url = (payload.image_url or "").strip() or None
 
+async def check_chat_input(
+    request: Request, sid: str, message: str, image_url: Optional[str]
+) -> Optional[JSONResponse]:
     if not message and not image_url:
         return JSONResponse({"ok": False, "error": "Message or image required."}, status_code=400)
 
@@ -1282,8 +3270,9 @@ def chat_api(payload: ChatIn, request: Request):
             status_code=400,
         )
 
-    allowed, retry_after = rate_limit_check(
-        _chat_rate_windows,
+    allowed, retry_after = await run_in_threadpool(
+        rate_limit_check,
+        CHAT_RATE_BUCKET,
         get_rate_key(request, sid),
         CHAT_RATE_LIMIT_COUNT,
         CHAT_RATE_LIMIT_WINDOW_SECONDS,
@@ -1296,101 +3285,163 @@ def chat_api(payload: ChatIn, request: Request):
             },
             status_code=429,
         )
+    return None
 
-    history = sess["history"]
-    platform = sess["platform"]
-    lower_message = message.lower() if message else ""
 
+def apply_platform_hint(sess: Session, message: str) -> Optional[str]:
+    lower_message = message.lower() if message else ""
     if "iphone" in lower_message or "ios" in lower_message:
         sess["platform"] = "iphone"
-        platform = "iphone"
     if "android" in lower_message:
         sess["platform"] = "android"
-        platform = "android"
+    return sess["platform"]
+
+
+def resolve_chat_image_url(request: Request, image_url: Optional[str]) -> Optional[str]:
+    if not image_url:
+        return None
+    base = str(request.base_url).rstrip("/")
+    if image_url.startswith("/"):
+        image_url = base + image_url
+    elif not image_url.startswith(base):
+        return None
+    return prefer_compact_upload(image_url, base)
 
+
+def inline_upload_data_url(image_url: str, base: str) -> Optional[str]:
+    prefix = f"{base}/static/uploads/"
+    if not image_url.startswith(prefix):
+        return None
+    filename = image_url[len(prefix):]
+    if not filename or "/" in filename or filename.startswith("."):
+        return None
+    mime = IMAGE_MIME_TYPES.get(Path(filename).suffix.lower())
+    if not mime:
+        return None
+
+    path = UPLOADS_DIR / filename
     try:
-        system_text = (
-            "You are a friendly support helper at Parable, a company that helps people "
-            "stay safe and get the most out of their smartphones. You genuinely care about "
-            "the person you're talking to.\n"
-            "\n"
-            "How to sound:\n"
-            "- Write like a patient friend who's good with phones, not a manual.\n"
-            "- Use everyday language. Skip jargon and acronyms.\n"
-            "- Vary your phrasing naturally. Don't start every sentence the same way.\n"
-            "- A little warmth goes a long way — brief acknowledgments like "
-            "'Good question' or 'That's a common one' feel human. But don't overdo it.\n"
-            "- Keep answers concise. A few clear steps beat a wall of text.\n"
-            "- When you mention a setting, include the path (e.g. Settings > Accessibility > Zoom) "
-            "so they can find it easily.\n"
-            "- If you need more info, ask one simple question.\n"
-            "- If something sounds like a scam or suspicious pop-up, lead with safety: "
-            "'Don't tap anything on that screen yet.' Then explain why and what to do.\n"
-            "\n"
-            "If someone shares a screenshot:\n"
-            "- Describe what you notice in the image so they know you're looking at the right thing.\n"
-            "- If it looks suspicious, say so plainly and explain what tipped you off.\n"
-            "- Give them clear next steps to stay safe.\n"
-            "- If the image is too blurry or cut off, just ask for a clearer one.\n"
-            "\n"
-            "After giving steps, check in naturally — something like 'Let me know if that helps' "
-            "or 'Does that make sense?' Vary it so it doesn't feel scripted.\n"
+        with path.open("rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size == 0 or size > CHAT_IMAGE_INLINE_MAX_BYTES:
+                return None
+            # Encode straight from the page cache instead of reading a copy first.
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                encoded = base64.b64encode(mapped).decode("ascii")
+    except (FileNotFoundError, ValueError, OSError):
+        return None
+    return f"data:{mime};base64,{encoded}"
+
+
+async def model_image_input(request: Request, image_url: Optional[str]) -> Tuple[Optional[str], str]:
+    """Pick how the model receives an image: an inline data URL or our URL.
+
+    Inline mode saves the provider a fetch back to this server. It falls
+    back to the URL when disabled, when the file is missing, or when it is
+    over CHAT_IMAGE_INLINE_MAX_BYTES.
+    """
+    if not image_url:
+        return None, "none"
+    if CHAT_IMAGE_INLINE:
+        base = str(request.base_url).rstrip("/")
+        data_url = await run_in_threadpool(inline_upload_data_url, image_url, base)
+        if data_url:
+            return data_url, "inline"
+    return image_url, "url"
+
+
+def build_chat_input(
+    message: str,
+    image_url: Optional[str],
+    platform: Optional[str],
+    history: List[Turn],
+) -> List[dict]:
+    user_text = message
+    if not user_text and image_url:
+        user_text = CHAT_SCREENSHOT_PROMPT
+
+    input_messages: List[dict] = [{"role": "system", "content": CHAT_SYSTEM_TEXT}]
+
+    if platform:
+        input_messages.append({"role": "system", "content": f"User is on {platform}."})
+
+    for turn in history[-MAX_HISTORY:]:
+        input_messages.append(turn)
+
+    if image_url:
+        input_messages.append(
+            {
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": user_text},
+                    {"type": "input_image", "image_url": image_url},
+                ],
+            }
         )
+    else:
+        input_messages.append({"role": "user", "content": user_text})
+    return input_messages
 
-        if image_url:
-            base = str(request.base_url).rstrip("/")
-            if image_url.startswith("/"):
-                image_url = base + image_url
-            elif not image_url.startswith(base):
-                image_url = None
 
-        user_text = message
-        if not user_text and image_url:
-            user_text = "Please check this screenshot. Is it suspicious? What should I do?"
+def record_chat_turn(sid: str, sess: Session, message: str, image_url: Optional[str], answer: str) -> None:
+    history = sess["history"]
+    if message:
+        history.append({"role": "user", "content": message})
+    elif image_url:
+        history.append({"role": "user", "content": "[Uploaded a photo]"})
 
-        input_messages: List[dict] = [{"role": "system", "content": system_text}]
+    history.append({"role": "assistant", "content": answer})
+    sess["history"] = history[-MAX_HISTORY:]
+    save_session(sid, sess)
 
-        if platform:
-            input_messages.append({"role": "system", "content": f"User is on {platform}."})
 
-        for turn in history[-MAX_HISTORY:]:
-            input_messages.append(turn)
+def sse_event(data: Dict[str, Any]) -> str:
+    return f"data: {safe_json_dumps(data)}\n\n"
 
-        if image_url:
-            input_messages.append(
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "input_text", "text": user_text},
-                        {"type": "input_image", "image_url": image_url},
-                    ],
-                }
-            )
-        else:
-            input_messages.append({"role": "user", "content": user_text})
+
+@app.post("/api/chat")
+async def chat_api(payload: ChatIn, request: Request):
+    sid = get_sid(request)
+    sess = await run_in_threadpool(get_session, sid)
+
+    message = (payload.message or "").strip()
+    image_url = (payload.image_url or "").strip() or None
+
+    error_resp = await check_chat_input(request, sid, message, image_url)
+    if error_resp is not None:
+        return error_resp
+
+    platform = apply_platform_hint(sess, message)
+
+    try:
+        image_url = resolve_chat_image_url(request, image_url)
+        model_image_url, image_mode = await model_image_input(request, image_url)
+        input_messages = build_chat_input(message, model_image_url, platform, sess["history"])
+        logged_in = await run_in_threadpool(is_logged_in, request, sid)
 
         logger.info(
-            "Chat request | sid=%s ip=%s logged_in=%s has_image=%s platform=%s",
+            "Chat request | sid=%s ip=%s logged_in=%s has_image=%s image_mode=%s platform=%s",
             sid,
             get_client_ip(request),
-            is_logged_in(request, sid),
+            logged_in,
             bool(image_url),
+            image_mode,
             platform,
         )
 
-        ai_response = get_client().responses.create(model="gpt-4.1-mini", input=input_messages)
-        answer = (ai_response.output_text or "").strip() or "I had trouble answering that. Please try again."
-
-        if message:
-            history.append({"role": "user", "content": message})
-        elif image_url:
-            history.append({"role": "user", "content": "[Uploaded a photo]"})
+        started = time.perf_counter()
+        ai_response = await get_client().responses.create(model=CHAT_MODEL, input=input_messages)
+        answer = (ai_response.output_text or "").strip() or CHAT_FALLBACK_ANSWER
+        logger.info(
+            "Chat answered | sid=%s image_mode=%s upstream_ms=%.0f",
+            sid,
+            image_mode,
+            (time.perf_counter() - started) * 1000,
+        )
 
-        history.append({"role": "assistant", "content": answer})
-        sess["history"] = history[-MAX_HISTORY:]
-        save_session(sid, sess)
+        await run_in_threadpool(record_chat_turn, sid, sess, message, image_url, answer)
 
-        resp = JSONResponse({"ok": True, "answer": answer, "logged_in": is_logged_in(request, sid)})
+        resp = JSONResponse({"ok": True, "answer": answer, "logged_in": logged_in})
         set_sid_cookie(resp, sid)
         return resp
 
@@ -1403,25 +3454,243 @@ def chat_api(payload: ChatIn, request: Request):
         return resp
 
 
-# -------------------------
-# Text-to-speech endpoint
-# -------------------------
-@app.post("/api/speak")
-def speak_api(payload: SpeakIn, request: Request):
+@app.post("/api/chat/stream")
+async def chat_stream_api(payload: ChatIn, request: Request):
+    """Same contract as /api/chat, but forwards answer tokens as Server-Sent Events.
+
+    Emits ``delta`` events while the model is generating, then a single ``done``
+    event with the full answer (or an ``error`` event). History is saved only
+    once the answer is complete.
+    """
     sid = get_sid(request)
+    sess = await run_in_threadpool(get_session, sid)
 
-    text = (payload.text or "").strip()
-    if not text:
-        return JSONResponse({"ok": False, "error": "Text required."}, status_code=400)
+    message = (payload.message or "").strip()
+    image_url = (payload.image_url or "").strip() or None
+
+    error_resp = await check_chat_input(request, sid, message, image_url)
+    if error_resp is not None:
+        return error_resp
 
+    platform = apply_platform_hint(sess, message)
+    image_url = resolve_chat_image_url(request, image_url)
+    model_image_url, image_mode = await model_image_input(request, image_url)
+    input_messages = build_chat_input(message, model_image_url, platform, sess["history"])
+    client_ip = get_client_ip(request)
+    logged_in = await run_in_threadpool(is_logged_in, request, sid)
+
+    logger.info(
+        "Chat stream request | sid=%s ip=%s logged_in=%s has_image=%s image_mode=%s platform=%s",
+        sid,
+        client_ip,
+        logged_in,
+        bool(image_url),
+        image_mode,
+        platform,
+    )
+
+    async def event_stream():
+        parts: List[str] = []
+        started = time.perf_counter()
+        first_token_ms: Optional[float] = None
+        try:
+            stream = await get_client().responses.create(model=CHAT_MODEL, input=input_messages, stream=True)
+            async for event in stream:
+                if event.type == "response.output_text.delta" and event.delta:
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                    parts.append(event.delta)
+                    yield sse_event({"type": "delta", "text": event.delta})
+
+            answer = "".join(parts).strip() or CHAT_FALLBACK_ANSWER
+            logger.info(
+                "Chat answered | sid=%s image_mode=%s first_token_ms=%.0f upstream_ms=%.0f",
+                sid,
+                image_mode,
+                first_token_ms or 0,
+                (time.perf_counter() - started) * 1000,
+            )
+            await run_in_threadpool(record_chat_turn, sid, sess, message, image_url, answer)
+        except Exception:
+            logger.exception("AI service error | sid=%s ip=%s", sid, client_ip)
+            yield sse_event({"type": "error", "ok": False, "error": "AI service error. Please try again."})
+            return
+
+        yield sse_event({"type": "done", "ok": True, "answer": answer, "logged_in": logged_in})
+
+    resp = StreamingResponse(event_stream(), media_type="text/event-stream")
+    resp.headers["X-Accel-Buffering"] = "no"
+    set_sid_cookie(resp, sid)
+    return resp
+
+
+# -------------------------
+# Text-to-speech endpoint
+# -------------------------
+TTS_MODEL = "tts-1"
+TTS_VOICE = "nova"
+TTS_MAX_CHARS = 1500
+TTS_CACHE_DIR = STATIC_DIR / "tts"
+TTS_CACHE_URL_PREFIX = "/static/tts"
+TTS_MEMORY_CACHE_MAX_BYTES = env_int("TTS_MEMORY_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+TTS_MEMORY_CACHE_TTL_SECONDS = 24 * 3600
+TTS_DISK_CACHE_TTL_SECONDS = env_int("TTS_DISK_CACHE_TTL_SECONDS", 30 * 24 * 3600)
+TTS_CACHE_CONTROL = "private, max-age=31536000, immutable"
+TTS_STREAM_CHUNK_BYTES = 4096
+TTS_SEGMENT_MAX_CHARS = 400
+TTS_STREAM_TOKEN_TTL_SECONDS = env_int("TTS_STREAM_TOKEN_TTL_SECONDS", 300)
+TTS_STREAM_TOKEN_MAX_ENTRIES = 2000
+
+TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Synthesized audio is content-addressed, so a hit in either tier is always
+# the exact bytes the upstream would return for the same model/voice/text.
+# The stream route therefore caches each segment under its own key; the
+# stitched-together reply gets a separate key from tts_reply_key.
+_tts_memory_cache = LRUTTLCache(4096, TTS_MEMORY_CACHE_TTL_SECONDS, max_bytes=TTS_MEMORY_CACHE_MAX_BYTES)
+# Stream tokens map a short opaque URL to text that was already validated and
+# rate limited, so the text itself never appears in a URL or access log. A
+# token pays for one synthesis: the stream route consumes it on a cache miss.
+_tts_stream_tokens = LRUTTLCache(TTS_STREAM_TOKEN_MAX_ENTRIES, TTS_STREAM_TOKEN_TTL_SECONDS)
+
+
+def clean_tts_text(text: str) -> str:
     # Clean up text so TTS reads it naturally.
     text = re.sub(r"[*_`]{1,3}", "", text)
     text = re.sub(r"\s+", " ", text).strip()
-    if len(text) > 1500:
-        text = text[:1500]
+    return text[:TTS_MAX_CHARS]
 
-    allowed, retry_after = rate_limit_check(
-        _chat_rate_windows,
+
+def tts_cache_key(text: str) -> str:
+    raw = f"{TTS_MODEL}\0{TTS_VOICE}\0{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def tts_reply_key(segments: List[str]) -> str:
+    """Key for the audio the stream route plays for ``segments``.
+
+    A single segment is exactly one upstream response and shares its key;
+    stitched replies are keyed apart so they are never mistaken for one.
+    """
+    if len(segments) == 1:
+        return tts_cache_key(segments[0])
+    raw = "\0".join(["stream", TTS_MODEL, TTS_VOICE, *segments]).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def tts_cache_path(key: str) -> Path:
+    return TTS_CACHE_DIR / f"{key}.mp3"
+
+
+def load_cached_tts(key: str) -> Optional[bytes]:
+    audio = _tts_memory_cache.get(key)
+    if audio is not None:
+        return audio
+    try:
+        audio = tts_cache_path(key).read_bytes()
+    except FileNotFoundError:
+        return None
+    _tts_memory_cache.set(key, audio, size=len(audio))
+    return audio
+
+
+def store_cached_tts(key: str, audio: bytes) -> None:
+    _tts_memory_cache.set(key, audio, size=len(audio))
+    path = tts_cache_path(key)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        tmp_path.write_bytes(audio)
+        tmp_path.replace(path)
+    except OSError:
+        logger.warning("TTS cache write failed | key=%s", key, exc_info=True)
+        tmp_path.unlink(missing_ok=True)
+
+
+def cleanup_tts_cache(now: float) -> int:
+    removed = 0
+    for path in TTS_CACHE_DIR.glob("*.mp3"):
+        try:
+            if now - path.stat().st_mtime > TTS_DISK_CACHE_TTL_SECONDS:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            continue
+    _tts_memory_cache.prune()
+    return removed
+
+
+def tts_etag(key: str) -> str:
+    return f'"{key}"'
+
+
+def tts_audio_response(key: str, audio: Optional[bytes], sid: str, status_code: int = 200) -> Response:
+    resp = Response(content=audio or b"", media_type="audio/mpeg", status_code=status_code)
+    resp.headers["ETag"] = tts_etag(key)
+    resp.headers["Cache-Control"] = TTS_CACHE_CONTROL
+    resp.headers["X-TTS-URL"] = f"{TTS_CACHE_URL_PREFIX}/{key}.mp3"
+    set_sid_cookie(resp, sid)
+    return resp
+
+
+def split_tts_segments(text: str) -> List[str]:
+    """Split text at sentence ends so the first sentence can play early.
+
+    The first sentence stays on its own; the rest are packed into segments of
+    up to TTS_SEGMENT_MAX_CHARS to keep the number of upstream calls small.
+    """
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text) if s]
+    if len(sentences) <= 1:
+        return [text]
+
+    segments = [sentences[0]]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and len(current) + 1 + len(sentence) > TTS_SEGMENT_MAX_CHARS:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+async def synthesize_tts(text: str) -> bytes:
+    tts = await get_client().audio.speech.create(
+        model=TTS_MODEL,
+        voice=TTS_VOICE,
+        input=text,
+        response_format="mp3",
+    )
+    return tts.content
+
+
+async def synthesize_cached_tts(text: str) -> bytes:
+    audio = await synthesize_tts(text)
+    await run_in_threadpool(store_cached_tts, tts_cache_key(text), audio)
+    return audio
+
+
+def load_cached_tts_segments(segments: List[str]) -> List[Optional[bytes]]:
+    return [load_cached_tts(tts_cache_key(segment)) for segment in segments]
+
+
+async def cached_tts_response(request: Request, key: str, sid: str) -> Optional[Response]:
+    # Cached audio costs nothing upstream, so it is served before rate limiting.
+    cached = await run_in_threadpool(load_cached_tts, key)
+    if cached is None:
+        return None
+    # 304 is only defined for GET/HEAD (RFC 9110 13.1.2); POST /api/speak
+    # always gets the body, and the browser cache handles the GET routes.
+    if request.method in ("GET", "HEAD") and etag_matches(request.headers.get("if-none-match"), tts_etag(key)):
+        return tts_audio_response(key, None, sid, status_code=304)
+    return tts_audio_response(key, cached, sid)
+
+
+async def check_tts_rate_limit(request: Request, sid: str) -> Optional[JSONResponse]:
+    allowed, retry_after = await run_in_threadpool(
+        rate_limit_check,
+        CHAT_RATE_BUCKET,
         get_rate_key(request, sid),
         CHAT_RATE_LIMIT_COUNT,
         CHAT_RATE_LIMIT_WINDOW_SECONDS,
@@ -1431,24 +3700,160 @@ def speak_api(payload: SpeakIn, request: Request):
             {"ok": False, "error": f"Too many requests. Wait about {retry_after} seconds."},
             status_code=429,
         )
+    return None
+
+
+@app.post("/api/speak")
+async def speak_api(payload: SpeakIn, request: Request):
+    sid = get_sid(request)
+
+    text = (payload.text or "").strip()
+    if not text:
+        return JSONResponse({"ok": False, "error": "Text required."}, status_code=400)
+
+    text = clean_tts_text(text)
+    key = tts_cache_key(text)
+
+    cached_resp = await cached_tts_response(request, key, sid)
+    if cached_resp is not None:
+        return cached_resp
+
+    limited = await check_tts_rate_limit(request, sid)
+    if limited is not None:
+        return limited
 
     try:
-        tts = get_client().audio.speech.create(
-            model="tts-1",
-            voice="nova",
-            input=text,
-            response_format="mp3",
-        )
-        audio_bytes = tts.read() if hasattr(tts, "read") else tts.content
-        resp = Response(content=audio_bytes, media_type="audio/mpeg")
-        resp.headers["Cache-Control"] = "no-store"
-        set_sid_cookie(resp, sid)
-        return resp
+        audio_bytes = await synthesize_cached_tts(text)
+        return tts_audio_response(key, audio_bytes, sid)
     except Exception:
         logger.exception("TTS service error | sid=%s ip=%s", sid, get_client_ip(request))
         return JSONResponse({"ok": False, "error": "Voice service error."}, status_code=502)
 
 
+@app.post("/api/speak/stream")
+async def speak_stream_token_api(payload: SpeakIn, request: Request):
+    """Reserve a streaming URL for ``text``.
+
+    Validation and rate limiting happen here, once. The returned URL is handed
+    to an <audio> element (which can only issue GETs) and pays for a single
+    synthesis; fetching it again after that only works from the cache. A
+    reply that has been played before gets its content-addressed file URL
+    instead, which the browser and service worker cache.
+    """
+    sid = get_sid(request)
+
+    text = (payload.text or "").strip()
+    if not text:
+        return JSONResponse({"ok": False, "error": "Text required."}, status_code=400)
+
+    text = clean_tts_text(text)
+    key = tts_cache_key(text)
+
+    segments = split_tts_segments(text)
+    reply_key = tts_reply_key(segments)
+    if await run_in_threadpool(tts_cache_path(reply_key).is_file):
+        resp = JSONResponse({"ok": True, "url": f"{TTS_CACHE_URL_PREFIX}/{reply_key}.mp3"})
+        set_sid_cookie(resp, sid)
+        return resp
+
+    cached = await run_in_threadpool(load_cached_tts_segments, segments)
+    if any(audio is None for audio in cached):
+        limited = await check_tts_rate_limit(request, sid)
+        if limited is not None:
+            return limited
+
+    token = secrets.token_urlsafe(18)
+    _tts_stream_tokens.set(token, {"sid": sid, "text": text, "key": key})
+    resp = JSONResponse({"ok": True, "url": f"/api/speak/stream/{token}"})
+    set_sid_cookie(resp, sid)
+    return resp
+
+
+@app.get("/api/speak/stream/{token}")
+async def speak_stream_api(token: str, request: Request, split: bool = True):
+    """Stream MP3 audio as it is synthesized.
+
+    With ``split`` on, the first sentence streams straight from the upstream
+    while the remaining segments are synthesized one step ahead. Each segment
+    is cached under its own key, so a later reply with the same sentences
+    skips the upstream for them, and the full reply is stored under
+    tts_reply_key for replay.
+    """
+    sid = get_sid(request)
+    reserved = _tts_stream_tokens.get(token)
+    if reserved is None or reserved["sid"] != sid:
+        return JSONResponse({"ok": False, "error": "Audio link expired."}, status_code=404)
+
+    text = reserved["text"]
+    key = reserved["key"]
+    segments = split_tts_segments(text) if split else [text]
+
+    if len(segments) == 1:
+        cached_resp = await cached_tts_response(request, key, sid)
+        if cached_resp is not None:
+            return cached_resp
+
+    cached = await run_in_threadpool(load_cached_tts_segments, segments)
+    if any(audio is None for audio in cached):
+        # Consumed without an await after the check, so concurrent fetches of
+        # one token cannot each start their own synthesis.
+        if _tts_stream_tokens.get(token) is None:
+            return JSONResponse({"ok": False, "error": "Audio link expired."}, status_code=404)
+        _tts_stream_tokens.pop(token)
+
+    client_ip = get_client_ip(request)
+
+    async def audio_stream():
+        # Nothing is opened upstream until the body is actually read, and the
+        # async with closes the connection however the generator ends.
+        pending: Dict[int, asyncio.Task] = {}
+        played: List[bytes] = []
+
+        def prefetch(index: int) -> None:
+            if index < len(segments) and cached[index] is None:
+                pending[index] = asyncio.create_task(synthesize_cached_tts(segments[index]))
+
+        try:
+            prefetch(1)
+            if cached[0] is not None:
+                played.append(cached[0])
+                yield cached[0]
+            else:
+                collected: List[bytes] = []
+                async with get_client().audio.speech.with_streaming_response.create(
+                    model=TTS_MODEL,
+                    voice=TTS_VOICE,
+                    input=segments[0],
+                    response_format="mp3",
+                ) as upstream:
+                    async for chunk in upstream.iter_bytes(TTS_STREAM_CHUNK_BYTES):
+                        collected.append(chunk)
+                        yield chunk
+                played.append(b"".join(collected))
+                await run_in_threadpool(store_cached_tts, tts_cache_key(segments[0]), played[0])
+
+            for index in range(1, len(segments)):
+                audio = cached[index]
+                if audio is None:
+                    audio = await pending.pop(index)
+                prefetch(index + 1)
+                played.append(audio)
+                yield audio
+            if len(segments) > 1:
+                await run_in_threadpool(store_cached_tts, tts_reply_key(segments), b"".join(played))
+        except Exception:
+            logger.exception("TTS stream error | sid=%s ip=%s", sid, client_ip)
+        finally:
+            for task in pending.values():
+                task.cancel()
+
+    resp = StreamingResponse(audio_stream(), media_type="audio/mpeg")
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    set_sid_cookie(resp, sid)
+    return resp
+
+
 # -------------------------
 # Health endpoints
 # -------------------------
@@ -1477,26 +3882,153 @@ def health(request: Request):
         "sessions": session_count,
         "authed_sessions": authed_count,
         "vendor_accounts": vendor_accounts,
+        "session_cache": _session_cache.stats(),
+        "auth_cache": _auth_cache.stats(),
+        "tts_cache": _tts_memory_cache.stats(),
+        "vendor_reference_cache": _vendor_reference_cache.stats(),
+        "maintenance": _maintenance_stats,
+        "rate_limits": _rate_limit_backend.stats(),
+        "webhook_queue": webhook_queue_stats(),
+        "dashboard_stream": _dashboard_broker.stats(),
+        "compression": _compression_stats,
     }
 
 
 # -------------------------
-# Simple pages
+# Static assets
 # -------------------------
-@app.get("/", response_class=HTMLResponse)
-def home(request: Request):
-    return chat_page(request)
+# Page CSS/JS live in static/src. At startup each file is copied to
+# static/dist under a content-hash name with .gz (and .br when brotli is
+# installed) siblings, and pages link the fingerprinted URL.
+ASSET_SRC_DIR = STATIC_DIR / "src"
+ASSET_DIST_DIR = STATIC_DIR / "dist"
+ASSET_HASH_LENGTH = 12
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ASSET_KEEP_SECONDS = env_int("ASSET_KEEP_SECONDS", 7 * 24 * 60 * 60)
+PRECOMPRESSED_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+
+def write_asset_file(path: Path, data: bytes) -> None:
+    if path.exists():
+        return
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def build_static_assets() -> Dict[str, str]:
+    """Fingerprint static/src files into static/dist; returns src URL -> dist URL."""
+    urls: Dict[str, str] = {}
+    if not ASSET_SRC_DIR.is_dir():
+        return urls
+
+    ASSET_DIST_DIR.mkdir(parents=True, exist_ok=True)
+    current = set()
+    for source in sorted(ASSET_SRC_DIR.iterdir()):
+        if not source.is_file():
+            continue
+        data = source.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:ASSET_HASH_LENGTH]
+        target = ASSET_DIST_DIR / f"{source.stem}.{digest}{source.suffix}"
+        write_asset_file(target, data)
+        write_asset_file(target.with_name(target.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0))
+        current.update({target.name, target.name + ".gz"})
+        if brotli is not None:
+            write_asset_file(target.with_name(target.name + ".br"), brotli.compress(data, quality=11))
+            current.add(target.name + ".br")
+        urls[f"/static/src/{source.name}"] = f"/static/dist/{target.name}"
+
+    # Older builds stay around for a while so pages rendered before a deploy
+    # can still load their assets.
+    cutoff = time.time() - ASSET_KEEP_SECONDS
+    for path in ASSET_DIST_DIR.iterdir():
+        try:
+            if path.name not in current and path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+    return urls
+
+
+try:
+    _asset_urls = build_static_assets()
+except OSError:
+    logger.exception("Static asset build failed; serving unfingerprinted assets")
+    _asset_urls = {}
+
+
+def link_assets(html: str) -> str:
+    for source_url, dist_url in _asset_urls.items():
+        html = html.replace(f'"{source_url}"', f'"{dist_url}"')
+    return html
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles that serves precompressed siblings and caches dist/ and tts/ forever.
+
+    Any file with a .br or .gz sibling is sent in the encoding the client
+    accepts, which the compression middleware then leaves alone.
+    """
+
+    async def get_response(self, path: str, scope) -> Response:
+        if path.endswith((".br", ".gz")):
+            return await super().get_response(path, scope)
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        response = None
+        for coding, suffix in PRECOMPRESSED_SUFFIXES:
+            if coding in accepted and (STATIC_DIR / (path + suffix)).is_file():
+                response = await super().get_response(path + suffix, scope)
+                if response.status_code == 200:
+                    response.headers["Content-Type"] = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                    response.headers["Content-Encoding"] = coding
+                break
+        if response is None:
+            response = await super().get_response(path, scope)
+
+        response.headers["Vary"] = "Accept-Encoding"
+        # Both are content-addressed: a name never refers to different bytes.
+        if path.startswith(("dist/", "tts/")) and response.status_code in (200, 304):
+            response.headers["Cache-Control"] = ASSET_CACHE_CONTROL
+        return response
+
+
+app.mount("/static", AssetStaticFiles(directory=str(STATIC_DIR)), name="static")
 
 
-@app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request):
-    sid = get_sid(request)
-    if not is_logged_in(request, sid):
-        resp = RedirectResponse(url="/", status_code=302)
-        set_sid_cookie(resp, sid)
-        return resp
+# -------------------------
+# Page templates
+# -------------------------
+class PageTemplate:
+    """HTML split once at import into static byte segments and named slots.
 
-    html = """
+    Rendering is a single join of precomputed bytes; pages without slots
+    are encoded exactly once.
+    """
+
+    def __init__(self, source: str, slots: Tuple[str, ...] = ()):
+        pattern = "|".join(re.escape(f"__{slot}__") for slot in slots)
+        pieces = re.split(f"({pattern})", source) if slots else [source]
+        self.segments: List[bytes] = [piece.encode("utf-8") for piece in pieces[0::2]]
+        self.slots: List[str] = [piece[2:-2] for piece in pieces[1::2]]
+        self._static = self.segments[0] if not self.slots else None
+
+    def render(self, **values: str) -> bytes:
+        if self._static is not None:
+            return self._static
+        parts = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            parts.append(values[slot].encode("utf-8"))
+            parts.append(segment)
+        return b"".join(parts)
+
+
+def script_json(value: Any) -> str:
+    # json.dumps alone would let "</script>" in a query param close the tag.
+    return json.dumps(value).replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
+
+DASHBOARD_HTML = """
 <!doctype html>
 <html lang="en">
 <head>
@@ -1504,219 +4036,7 @@ def dashboard(request: Request):
   <meta name="viewport" content="width=device-width, initial-scale=1, maximum-scale=1, user-scalable=no, viewport-fit=cover" />
   <title>Parable Dashboard</title>
   <meta name="theme-color" content="#ea580c">
-  <style>
-    :root {
-      --navy: #020617;
-      --orange: #ea580c;
-      --orange-dark: #c2410c;
-      --bg: #f4f6fb;
-      --card: #ffffff;
-      --soft: #fff7ed;
-      --line: #e5e7eb;
-      --text: #111827;
-      --muted: #475569;
-      --success: #166534;
-      --warning: #b45309;
-      --danger: #b91c1c;
-      --neutral: #64748b;
-    }
-    * { box-sizing: border-box; }
-    html, body {
-      margin: 0;
-      padding: 0;
-      width: 100%;
-      max-width: 100%;
-      min-height: 100%;
-      overflow-x: hidden;
-    }
-    body {
-      font-family: system-ui, -apple-system, "Segoe UI", Arial, sans-serif;
-      background: radial-gradient(1200px 600px at 50% 0%, #ffffff 0%, var(--bg) 55%);
-      color: var(--text);
-      -webkit-text-size-adjust: 100%;
-    }
-    .page {
-      width: 100%;
-      min-height: 100dvh;
-      padding: 18px;
-      display: flex;
-      justify-content: center;
-    }
-    .wrap { width: 100%; max-width: 1120px; }
-    .card {
-      background: var(--card);
-      border-radius: 24px;
-      padding: 24px;
-      border: 2px solid rgba(234, 88, 12, 0.45);
-      box-shadow: 0 14px 40px rgba(2, 6, 23, 0.10);
-    }
-    .topbar {
-      display: flex;
-      align-items: center;
-      gap: 12px;
-      flex-wrap: wrap;
-      margin-bottom: 18px;
-    }
-    .brand {
-      font-size: 20px;
-      font-weight: 800;
-      color: var(--navy);
-    }
-    .top-actions {
-      margin-left: auto;
-      display: flex;
-      gap: 10px;
-      flex-wrap: wrap;
-    }
-    .btn, .btn-outline, .mini-btn {
-      display: inline-flex;
-      align-items: center;
-      justify-content: center;
-      min-height: 50px;
-      padding: 12px 16px;
-      border-radius: 14px;
-      font-size: 18px;
-      font-weight: 800;
-      text-decoration: none;
-      cursor: pointer;
-      border: 1px solid rgba(234, 88, 12, 0.35);
-    }
-    .btn { background: var(--orange); color: #ffffff; }
-    .btn-outline, .mini-btn { background: #ffffff; color: var(--navy); }
-    h1 {
-      margin: 0 0 10px;
-      font-size: 40px;
-      line-height: 1.15;
-      color: var(--navy);
-    }
-    .lead {
-      margin: 0 0 18px;
-      font-size: 21px;
-      line-height: 1.6;
-      color: var(--muted);
-    }
-    .welcome {
-      margin-bottom: 22px;
-      padding: 18px 20px;
-      border-radius: 18px;
-      background: var(--soft);
-      border: 1px solid rgba(234, 88, 12, 0.25);
-      font-size: 22px;
-      font-weight: 700;
-      color: var(--navy);
-    }
-    .grid {
-      display: grid;
-      grid-template-columns: repeat(2, minmax(0, 1fr));
-      gap: 18px;
-      margin: 22px 0;
-    }
-    .tile {
-      display: block;
-      text-decoration: none;
-      color: inherit;
-      background: #ffffff;
-      border: 1px solid var(--line);
-      border-radius: 24px;
-      padding: 26px 22px;
-      box-shadow: 0 8px 22px rgba(2, 6, 23, 0.05);
-      min-height: 250px;
-      transition: transform 0.18s ease, border-color 0.18s ease, box-shadow 0.18s ease;
-    }
-    .tile:hover {
-      transform: translateY(-3px);
-      border-color: rgba(234, 88, 12, 0.45);
-      box-shadow: 0 16px 34px rgba(2, 6, 23, 0.10);
-    }
-    .tile-icon {
-      width: 64px;
-      height: 64px;
-      border-radius: 18px;
-      display: flex;
-      align-items: center;
-      justify-content: center;
-      font-size: 30px;
-      margin-bottom: 18px;
-      background: linear-gradient(135deg, rgba(234, 88, 12, 0.12), rgba(234, 88, 12, 0.22));
-      color: var(--orange-dark);
-    }
-    .tile-title {
-      margin: 0 0 10px;
-      font-size: 30px;
-      font-weight: 800;
-      color: var(--navy);
-      line-height: 1.2;
-    }
-    .tile-text {
-      margin: 0;
-      font-size: 19px;
-      line-height: 1.55;
-      color: var(--muted);
-      white-space: pre-line;
-    }
-    .status-chip {
-      display: inline-flex;
-      align-items: center;
-      gap: 8px;
-      margin-bottom: 12px;
-      padding: 8px 12px;
-      border-radius: 999px;
-      font-size: 15px;
-      font-weight: 800;
-      border: 1px solid var(--line);
-      background: #ffffff;
-      color: var(--neutral);
-    }
-    .tile[data-state="protected"] .status-chip,
-    .tile[data-state="active"] .status-chip {
-      color: var(--success);
-      border-color: rgba(22, 101, 52, 0.25);
-      background: rgba(22, 101, 52, 0.07);
-    }
-    .tile[data-state="warning"] .status-chip {
-      color: var(--warning);
-      border-color: rgba(180, 83, 9, 0.25);
-      background: rgba(180, 83, 9, 0.07);
-    }
-    .tile[data-state="critical"],
-    .tile[data-state="expired"],
-    .tile[data-state="offline"] {
-      border-color: rgba(185, 28, 28, 0.25);
-    }
-    .tile[data-state="critical"] .status-chip,
-    .tile[data-state="expired"] .status-chip,
-    .tile[data-state="offline"] .status-chip {
-      color: var(--danger);
-      border-color: rgba(185, 28, 28, 0.25);
-      background: rgba(185, 28, 28, 0.07);
-    }
-    .tile-actions {
-      display: flex;
-      gap: 10px;
-      margin-top: 16px;
-      flex-wrap: wrap;
-    }
-    .footer-note {
-      margin-top: 24px;
-      font-size: 18px;
-      color: var(--muted);
-      line-height: 1.6;
-      text-align: center;
-    }
-    @media (max-width: 900px) {
-      .grid { grid-template-columns: 1fr; }
-      .tile { min-height: auto; }
-    }
-    @media (max-width: 760px) {
-      .page { padding: 12px; }
-      .card { padding: 18px; border-radius: 18px; }
-      h1 { font-size: 32px; }
-      .lead, .welcome, .tile-text, .btn, .btn-outline, .mini-btn { font-size: 19px; }
-      .tile-title { font-size: 26px; }
-      .top-actions { width: 100%; margin-left: 0; }
-      .btn, .btn-outline { width: 100%; }
-    }
-  </style>
+  <link rel="stylesheet" href="/static/src/dashboard.css">
 </head>
 <body>
   <div class="page">
@@ -1786,123 +4106,13 @@ def dashboard(request: Request):
     </div>
   </div>
 
-  <script>
-    function formatTime(ts) {
-      if (!ts) return "Unknown";
-      try {
-        return new Date(ts * 1000).toLocaleString();
-      } catch (e) {
-        return "Unknown";
-      }
-    }
-
-    function yesNoUnknown(value) {
-      if (value === true) return "Yes";
-      if (value === false) return "No";
-      return "Unknown";
-    }
-
-    function titleCase(text) {
-      const raw = (text || "unknown").replace(/_/g, " ");
-      return raw.charAt(0).toUpperCase() + raw.slice(1);
-    }
-
-    function setState(el, state) {
-      el.setAttribute("data-state", state || "unknown");
-    }
-
-    async function loadDashboardCards() {
-      try {
-        const [securityRes, identityRes] = await Promise.all([
-          fetch("/api/dashboard/security", { credentials: "same-origin" }),
-          fetch("/api/dashboard/identity", { credentials: "same-origin" })
-        ]);
-
-        const security = await securityRes.json();
-        const identity = await identityRes.json();
-
-        const securityTile = document.getElementById("securityTile");
-        const securityChip = document.getElementById("securityChip");
-        const securityText = document.getElementById("securityText");
-        const securityPortalBtn = document.getElementById("securityPortalBtn");
-
-        const securityState = security.status || "unknown";
-        setState(securityTile, securityState);
-        securityChip.textContent = titleCase(security.vendor || "Vendor") + " \u2022 " + titleCase(securityState);
-        securityText.textContent = [
-          "Vendor: " + (security.vendor || "Unknown"),
-          "Threats found: " + (security.threats_found ?? 0),
-          "Definitions current: " + yesNoUnknown(security.definitions_current),
-          "Subscription active: " + yesNoUnknown(security.subscription_active),
-          "Covered devices: " + (security.covered_devices ?? 0),
-          "Last seen: " + formatTime(security.last_seen)
-        ].join("\\n");
-        if (security.portal_url) {
-          securityPortalBtn.href = security.portal_url;
-          securityPortalBtn.style.display = "inline-flex";
-        }
-
-        const identityTile = document.getElementById("identityTile");
-        const identityChip = document.getElementById("identityChip");
-        const identityText = document.getElementById("identityText");
-        const identityPortalBtn = document.getElementById("identityPortalBtn");
-
-        let identityState = "unknown";
-        if (identity.alerts_open > 0) {
-          identityState = "warning";
-        } else if (identity.monitoring_active === true) {
-          identityState = "active";
-        }
-        setState(identityTile, identityState);
-        identityChip.textContent = titleCase(identity.vendor || "Vendor") + " \u2022 " + titleCase(identityState);
-        identityText.textContent = [
-          "Monitoring active: " + yesNoUnknown(identity.monitoring_active),
-          "Alerts open: " + (identity.alerts_open ?? 0),
-          "Risk summary: " + (identity.risk_summary || "No summary available"),
-          "ID Lock / Freeze: " + titleCase(identity.id_lock_status || "unknown"),
-          "Subscription active: " + yesNoUnknown(identity.subscription_active),
-          "Last checked: " + formatTime(identity.last_checked)
-        ].join("\\n");
-        if (identity.portal_url) {
-          identityPortalBtn.href = identity.portal_url;
-          identityPortalBtn.style.display = "inline-flex";
-        }
-      } catch (e) {
-        console.error("Dashboard load failed", e);
-      }
-    }
-
-    async function logout() {
-      try {
-        await fetch("/api/logout", { method: "POST", credentials: "same-origin" });
-      } catch (e) {
-        console.error("Logout failed", e);
-      }
-      window.location.href = "/appchat";
-    }
-
-    document.getElementById("logoutBtn").addEventListener("click", logout);
-    window.addEventListener("load", loadDashboardCards);
-  </script>
+  <script src="/static/src/dashboard.js"></script>
 </body>
 </html>
 """
-    resp = HTMLResponse(html)
-    set_sid_cookie(resp, sid)
-    return resp
 
 
-# -------------------------
-# Chat UI
-# -------------------------
-@app.get("/appchat", response_class=HTMLResponse)
-@app.get("/chat", response_class=HTMLResponse)
-def chat_page(request: Request):
-    sid = get_sid(request)
-    logged_in = is_logged_in(request, sid)
-    topic = (request.query_params.get("topic") or "").strip()
-
-    html = """
+CHAT_PAGE_HTML = """
 <!doctype html>
 <html lang="en">
 <head>
@@ -1914,361 +4124,7 @@ def chat_page(request: Request):
   <meta name="apple-mobile-web-app-capable" content="yes">
   <meta name="apple-mobile-web-app-status-bar-style" content="default">
   <link rel="apple-touch-icon" href="/static/icon-192.png">
-  <style>
-    :root {
-      --navy: #020617;
-      --orange: #ea580c;
-      --bg: #f4f6fb;
-      --card: #ffffff;
-      --soft: #f8fafc;
-      --line: #e5e7eb;
-      --danger: #b91c1c;
-      --text: #111827;
-      --muted: #475569;
-    }
-    * { box-sizing: border-box; }
-    html, body {
-      margin: 0;
-      padding: 0;
-      width: 100%;
-      max-width: 100%;
-      height: 100%;
-      overflow-x: hidden;
-    }
-    body {
-      font-family: system-ui, -apple-system, "Segoe UI", Arial, sans-serif;
-      background: radial-gradient(1200px 600px at 50% 0%, #ffffff 0%, var(--bg) 55%);
-      color: var(--text);
-      -webkit-text-size-adjust: 100%;
-      overscroll-behavior-x: none;
-      font-size: 20px;
-      line-height: 1.6;
-    }
-    img { max-width: 100%; height: auto; }
-    .page {
-      width: 100%;
-      max-width: 100%;
-      height: 100vh;
-      height: 100dvh;
-      overflow: hidden;
-      padding: 8px;
-      padding-top: max(8px, env(safe-area-inset-top));
-      padding-bottom: max(8px, env(safe-area-inset-bottom));
-      padding-left: max(8px, env(safe-area-inset-left));
-      padding-right: max(8px, env(safe-area-inset-right));
-      display: flex;
-      justify-content: center;
-      align-items: stretch;
-    }
-    .wrap {
-      width: 100%;
-      max-width: 620px;
-      margin: 0 auto;
-      display: flex;
-      flex: 1 1 0;
-      min-height: 0;
-    }
-    .card {
-      width: 100%;
-      background: var(--card);
-      border-radius: 22px;
-      padding: 18px;
-      box-shadow: 0 14px 40px rgba(2, 6, 23, 0.10);
-      border: 2px solid rgba(234, 88, 12, 0.55);
-      position: relative;
-      overflow: hidden;
-      display: flex;
-      flex-direction: column;
-      flex: 1 1 0;
-      min-height: 0;
-    }
-    .card::before {
-      content: "";
-      position: absolute;
-      inset: 10px;
-      border-radius: 16px;
-      border: 1px solid rgba(234, 88, 12, 0.22);
-      pointer-events: none;
-    }
-    h1 {
-      margin: 0 0 8px;
-      font-size: 38px;
-      line-height: 1.15;
-      color: var(--navy);
-      overflow-wrap: break-word;
-      word-break: break-word;
-    }
-    .sub {
-      margin: 0;
-      color: var(--muted);
-      font-size: 21px;
-      line-height: 1.6;
-      overflow-wrap: break-word;
-      word-break: break-word;
-    }
-    .welcome {
-      margin: 0 0 12px;
-      padding: 14px 16px;
-      background: #fff7ed;
-      border: 1px solid rgba(234, 88, 12, 0.25);
-      border-radius: 16px;
-      color: var(--navy);
-      font-weight: 800;
-      font-size: 22px;
-      text-align: center;
-    }
-    .topbar {
-      display: flex;
-      align-items: flex-start;
-      gap: 12px;
-      margin-bottom: 10px;
-      flex-wrap: wrap;
-      flex-shrink: 0;
-    }
-    .topbar-main {
-      min-width: 0;
-      flex: 1 1 auto;
-    }
-    .topbar-actions {
-      margin-left: auto;
-      display: flex;
-      align-items: center;
-      gap: 10px;
-      flex-wrap: wrap;
-      justify-content: flex-end;
-    }
-    .status {
-      font-size: 18px;
-      color: var(--muted);
-      overflow-wrap: break-word;
-      word-break: break-word;
-    }
-    .smallbtn {
-      min-height: 50px;
-      padding: 12px 16px;
-      border-radius: 12px;
-      border: 1px solid var(--line);
-      background: #ffffff;
-      cursor: pointer;
-      font-weight: 700;
-      font-size: 18px;
-      color: var(--text);
-    }
-    .chatbox {
-      width: 100%;
-      min-height: 120px;
-      flex: 1 1 auto;
-      overflow-y: auto;
-      overflow-x: hidden;
-      -webkit-overflow-scrolling: touch;
-      background: linear-gradient(180deg, #ffffff 0%, #fbfbfd 100%);
-      border: 1px solid var(--line);
-      border-radius: 16px;
-      padding: 14px;
-      word-break: break-word;
-      overflow-wrap: break-word;
-      font-size: 20px;
-      line-height: 1.65;
-    }
-    .row {
-      display: flex;
-      margin: 12px 0;
-      width: 100%;
-      max-width: 100%;
-      flex-shrink: 0;
-    }
-    .bubble {
-      padding: 14px 16px;
-      border-radius: 16px;
-      max-width: 88%;
-      white-space: pre-wrap;
-      line-height: 1.6;
-      font-size: 20px;
-      overflow-wrap: break-word;
-      word-wrap: break-word;
-      word-break: break-word;
-    }
-    .you { justify-content: flex-end; }
-    .you .bubble { background: var(--navy); color: #ffffff; }
-    .bot { justify-content: flex-start; }
-    .bot .bubble {
-      background: var(--soft);
-      color: var(--text);
-      border: 1px solid rgba(234, 88, 12, 0.22);
-    }
-    .quick {
-      display: flex;
-      gap: 10px;
-      flex-wrap: wrap;
-      margin: 10px 0 0;
-      width: 100%;
-      max-width: 100%;
-      flex-shrink: 0;
-    }
-    .q {
-      padding: 12px 16px;
-      border-radius: 999px;
-      border: 1px solid var(--line);
-      background: #ffffff;
-      color: var(--navy);
-      cursor: pointer;
-      font-weight: 700;
-      font-size: 18px;
-      max-width: 100%;
-    }
-    .q:hover { border-color: var(--orange); }
-    .controls {
-      display: flex;
-      gap: 10px;
-      margin-top: 10px;
-      align-items: stretch;
-      flex-wrap: wrap;
-      width: 100%;
-      max-width: 100%;
-      flex-shrink: 0;
-    }
-    .controls > * { min-width: 0; }
-    input#msg, input.login-input {
-      flex: 1 1 240px;
-      min-width: 0;
-      width: 100%;
-      max-width: 100%;
-      padding: 16px;
-      border-radius: 16px;
-      border: 1px solid #d1d5db;
-      outline: none;
-      font-size: 20px;
-      line-height: 1.4;
-    }
-    input#msg:focus, input.login-input:focus {
-      border-color: rgba(234, 88, 12, 0.8);
-      box-shadow: 0 0 0 4px rgba(234, 88, 12, 0.15);
-    }
-    button.action {
-      min-width: 118px;
-      min-height: 56px;
-      padding: 14px 18px;
-      border-radius: 14px;
-      border: 1px solid rgba(234, 88, 12, 0.35);
-      background: var(--orange);
-      color: #ffffff;
-      cursor: pointer;
-      font-weight: 800;
-      font-size: 19px;
-      flex-shrink: 0;
-    }
-    button.action:disabled {
-      opacity: 0.45;
-      cursor: not-allowed;
-    }
-    .iconbtn {
-      min-width: 58px;
-      min-height: 56px;
-      padding: 12px 14px;
-      border-radius: 14px;
-      border: 1px solid rgba(234, 88, 12, 0.35);
-      background: #ffffff;
-      cursor: pointer;
-      font-weight: 800;
-      font-size: 22px;
-      color: var(--navy);
-      flex-shrink: 0;
-    }
-    .overlay {
-      position: fixed;
-      inset: 0;
-      background: rgba(2, 6, 23, 0.55);
-      display: none;
-      align-items: center;
-      justify-content: center;
-      padding: 16px;
-      z-index: 9999;
-    }
-    .overlay.show { display: flex; }
-    .login-card {
-      width: min(460px, 100%);
-      max-width: 100%;
-      background: #ffffff;
-      border-radius: 20px;
-      padding: 22px;
-      box-shadow: 0 20px 50px rgba(2, 6, 23, 0.25);
-      border: 2px solid rgba(234, 88, 12, 0.35);
-    }
-    .login-card h2 {
-      margin: 0 0 8px;
-      color: var(--navy);
-      font-size: 30px;
-      line-height: 1.2;
-    }
-    .login-card p {
-      margin: 0 0 14px;
-      color: var(--muted);
-      font-size: 19px;
-      line-height: 1.6;
-    }
-    .login-grid { display: grid; gap: 12px; }
-    .login-actions {
-      display: flex;
-      gap: 10px;
-      margin-top: 14px;
-      flex-wrap: wrap;
-    }
-    .error {
-      color: var(--danger);
-      font-size: 17px;
-      min-height: 24px;
-      margin-top: 8px;
-      overflow-wrap: break-word;
-      word-break: break-word;
-    }
-    .preview {
-      margin-top: 12px;
-      display: none;
-      gap: 10px;
-      align-items: center;
-      flex-wrap: wrap;
-      padding: 12px;
-      border: 1px dashed rgba(234, 88, 12, 0.35);
-      border-radius: 14px;
-      background: #ffffff;
-      width: 100%;
-      max-width: 100%;
-      overflow: hidden;
-      flex-shrink: 0;
-    }
-    .preview img {
-      max-height: 80px;
-      max-width: 100%;
-      border-radius: 10px;
-      border: 1px solid var(--line);
-      flex-shrink: 0;
-    }
-    .muted {
-      color: #64748b;
-      font-size: 16px;
-      line-height: 1.5;
-      overflow-wrap: break-word;
-      word-break: break-word;
-    }
-    @media (max-width: 640px) {
-      .page {
-        padding: 6px;
-        padding-top: max(6px, env(safe-area-inset-top));
-        padding-bottom: max(6px, env(safe-area-inset-bottom));
-        padding-left: max(6px, env(safe-area-inset-left));
-        padding-right: max(6px, env(safe-area-inset-right));
-      }
-      .card { padding: 12px; border-radius: 16px; }
-      h1 { font-size: 30px; }
-      .sub, .welcome, .status, .bubble, .q, .smallbtn, .login-card p, .muted { font-size: 18px; }
-      .chatbox { min-height: 100px; padding: 12px; }
-      .bubble { max-width: 94%; }
-      .controls { gap: 8px; }
-      input#msg { flex: 1 1 100%; }
-      button.action { min-width: 100px; }
-      .topbar-actions { width: 100%; margin-left: 0; justify-content: flex-end; }
-    }
-  </style>
+  <link rel="stylesheet" href="/static/src/chat.css">
 </head>
 <body>
   <div class="page">
@@ -2290,8 +4146,8 @@ def chat_page(request: Request):
         <div id="chatbox" class="chatbox"></div>
 
         <div class="quick">
-          <button class="q" type="button" onclick="quick('I am on iPhone')">I'm on iPhone</button>
-          <button class="q" type="button" onclick="quick('I am on Android')">I'm on Android</button>
+          <button class="q" type="button" data-quick="I am on iPhone">I'm on iPhone</button>
+          <button class="q" type="button" data-quick="I am on Android">I'm on Android</button>
         </div>
 
         <div id="preview" class="preview">
@@ -2359,606 +4215,105 @@ def chat_page(request: Request):
     </div>
   </div>
 
-<script>
-  const chatbox = document.getElementById("chatbox");
-  const input = document.getElementById("msg");
-  const btn = document.getElementById("btn");
-  const micBtn = document.getElementById("mic");
-  const card = document.getElementById("card");
-  const usageStatus = document.getElementById("usageStatus");
-  const attachBtn = document.getElementById("attach");
-  const photoInput = document.getElementById("photoInput");
-  const preview = document.getElementById("preview");
-  const previewImg = document.getElementById("previewImg");
-  const clearPhoto = document.getElementById("clearPhoto");
-  const loginOverlay = document.getElementById("loginOverlay");
-  const openLoginBtn = document.getElementById("openLoginBtn");
-  const loginSubmit = document.getElementById("loginSubmit");
-  const loginClose = document.getElementById("loginClose");
-  const loginUser = document.getElementById("loginUser");
-  const loginPass = document.getElementById("loginPass");
-  const loginError = document.getElementById("loginError");
-  const loginStatus = document.getElementById("loginStatus");
-
-  let greeted = false;
-  let recognition = null;
-  let preferVoice = null;
-  let selectedVoice = null;
-  let micReady = false;
-  let loggedIn = __LOGGED_IN__;
-  let initialTopic = __SAFE_TOPIC__;
-  let selectedFile = null;
-  let uploadedUrl = null;
-
-  btn.disabled = true;
-  micBtn.disabled = true;
-
-  function getOrCreateSid() {
-    const key = "parable_sid";
-    let sid = localStorage.getItem(key);
-    if (!sid || sid.length < 10) {
-      sid = (crypto.randomUUID
-        ? crypto.randomUUID().replace(/-/g, "")
-        : (Date.now() + "-" + Math.random()).replace(/[^a-zA-Z0-9-_]/g, ""));
-      localStorage.setItem(key, sid);
-    }
-    return sid;
-  }
-
-  function updateUsageUi(data) {
-    if (!data) return;
-    usageStatus.textContent = data.logged_in ? "Logged in account active." : "Chat is ready.";
-  }
-
-  async function loadUsage() {
-    try {
-      const res = await fetch("/api/me", {
-        headers: { "X-Parable-SID": getOrCreateSid() },
-        credentials: "same-origin"
-      });
-      const data = await res.json();
-      if (res.ok) {
-        loggedIn = data.logged_in;
-        updateLoginUi();
-        updateUsageUi(data);
-      }
-    } catch (e) {
-      console.error("Status load failed", e);
-    }
-  }
-
-  function scrollChatToBottom() {
-    chatbox.scrollTop = chatbox.scrollHeight;
-  }
-
-  function addBubble(text, who) {
-    const row = document.createElement("div");
-    row.className = "row " + who;
-    const bubble = document.createElement("div");
-    bubble.className = "bubble";
-    bubble.textContent = text;
-    row.appendChild(bubble);
-    chatbox.appendChild(row);
-    scrollChatToBottom();
-    if (who === "bot" && preferVoice === true) {
-      speak(text);
-    }
-  }
-
-  function greetOnce() {
-    if (greeted) return;
-    greeted = true;
-    addBubble("You can type, speak, or upload a photo.", "bot");
-    btn.disabled = false;
-    micBtn.disabled = false;
-    input.focus();
-  }
-
-  function pickVoice() {
-    const voices = window.speechSynthesis.getVoices();
-    if (!voices || voices.length === 0) return null;
-    // Prefer neural / natural voices — these sound human, not robotic.
-    // Avoid legacy voices like Microsoft Zira, David, etc.
-    const preferred = [
-      "Microsoft Aria Online",
-      "Microsoft Jenny Online",
-      "Microsoft Guy Online",
-      "Microsoft Ana Online",
-      "Microsoft Andrew Online",
-      "Microsoft Emma Online",
-      "Google US English",
-      "Samantha",
-      "Karen",
-      "Daniel"
-    ];
-    for (const name of preferred) {
-      const v = voices.find(x => x.name && x.name.includes(name));
-      if (v) return v;
-    }
-    // Pick any "Online" or "Natural" voice before falling back to legacy
-    const neural = voices.find(v =>
-      (v.lang || "").startsWith("en") &&
-      (/online|natural|neural/i.test(v.name))
-    );
-    if (neural) return neural;
-    return voices.find(v => (v.lang || "").startsWith("en")) || voices[0];
-  }
-
-  // Web Audio path — works in iOS WKWebView / Android WebView where
-  // HTMLAudioElement.play() outside a direct user gesture is blocked.
-  var audioCtx = null;
-  var currentSource = null;
-
-  function getAudioCtx() {
-    if (!audioCtx) {
-      var Ctor = window.AudioContext || window.webkitAudioContext;
-      if (!Ctor) return null;
-      audioCtx = new Ctor();
-    }
-    return audioCtx;
-  }
-
-  function unlockAudio() {
-    var ctx = getAudioCtx();
-    if (!ctx) return;
-    if (ctx.state === "suspended" && typeof ctx.resume === "function") {
-      ctx.resume().catch(function () {});
-    }
-    try {
-      var buf = ctx.createBuffer(1, 1, 22050);
-      var src = ctx.createBufferSource();
-      src.buffer = buf;
-      src.connect(ctx.destination);
-      if (typeof src.start === "function") { src.start(0); }
-      else if (typeof src.noteOn === "function") { src.noteOn(0); }
-    } catch (e) {}
-  }
-
-  // Called by the Android native shell from inside the mic-tap gesture,
-  // since the native hook preventDefaults the web mic handler.
-  window.nativeVoiceUnlock = function () {
-    preferVoice = true;
-    unlockAudio();
-  };
-
-  function speakFallback(text) {
-    if (!("speechSynthesis" in window)) return;
-    window.speechSynthesis.cancel();
-    if (!selectedVoice) { selectedVoice = pickVoice(); }
-    var t = (text || "").trim();
-    if (t.length > 500) { t = t.slice(0, 500) + "..."; }
-    var u = new SpeechSynthesisUtterance(t);
-    if (selectedVoice) { u.voice = selectedVoice; }
-    u.rate = 0.95;
-    u.pitch = 1.0;
-    u.volume = 1.0;
-    window.speechSynthesis.speak(u);
-  }
-
-  function debugBubble(msg) {
-    var row = document.createElement("div");
-    row.className = "row bot";
-    var bubble = document.createElement("div");
-    bubble.className = "bubble";
-    bubble.style.fontSize = "14px";
-    bubble.style.opacity = "0.7";
-    bubble.textContent = "[debug] " + msg;
-    row.appendChild(bubble);
-    chatbox.appendChild(row);
-    scrollChatToBottom();
-  }
-
-  async function speak(text) {
-    var t = (text || "").trim();
-    if (!t) return;
-    if (t.length > 1500) { t = t.slice(0, 1500); }
-
-    debugBubble("speak() called, preferVoice=" + preferVoice);
-
-    // Step 1: fetch TTS audio from server
-    var blob;
-    try {
-      var res = await fetch("/api/speak", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "X-Parable-SID": getOrCreateSid()
-        },
-        credentials: "same-origin",
-        body: JSON.stringify({ text: t })
-      });
-      debugBubble("fetch status=" + res.status + " type=" + res.headers.get("content-type"));
-      if (!res.ok) {
-        debugBubble("fetch failed, trying fallback");
-        speakFallback(t);
-        return;
-      }
-      blob = await res.blob();
-      debugBubble("blob size=" + blob.size + " type=" + blob.type);
-    } catch (e) {
-      debugBubble("fetch error: " + e.message);
-      speakFallback(t);
-      return;
-    }
+<script id="pageConfig" type="application/json">{"loggedIn": __LOGGED_IN__, "topic": __SAFE_TOPIC__}</script>
+<script src="/static/src/chat.js"></script>
+</body>
+</html>
+"""
 
-    // Step 2: try HTMLAudioElement (works when mediaPlaybackRequiresUserGesture=false)
-    try {
-      var url = URL.createObjectURL(blob);
-      var audio = new Audio(url);
-      audio.onended = function () { URL.revokeObjectURL(url); };
-      audio.onerror = function () {
-        debugBubble("Audio element error: " + (audio.error ? audio.error.message : "unknown"));
-      };
-      var playResult = audio.play();
-      if (playResult && typeof playResult.then === "function") {
-        playResult.then(function () {
-          debugBubble("Audio element playing OK");
-        }).catch(function (err) {
-          debugBubble("Audio element blocked: " + err.message + ", trying AudioContext");
-          tryAudioContext(blob, t);
-        });
-      } else {
-        debugBubble("Audio element play() returned sync (old browser)");
-      }
-    } catch (e) {
-      debugBubble("Audio element error: " + e.message + ", trying AudioContext");
-      tryAudioContext(blob, t);
-    }
-  }
-
-  async function tryAudioContext(blob, fallbackText) {
-    var ctx = getAudioCtx();
-    if (!ctx) {
-      debugBubble("no AudioContext, using speechSynthesis");
-      speakFallback(fallbackText);
-      return;
-    }
-    try {
-      debugBubble("AudioContext state=" + ctx.state);
-      if (ctx.state === "suspended") {
-        try { await ctx.resume(); } catch (e) {}
-        debugBubble("AudioContext after resume=" + ctx.state);
-      }
-      var arrayBuf = await blob.arrayBuffer();
-      var decoded = await new Promise(function (resolve, reject) {
-        try {
-          var p = ctx.decodeAudioData(arrayBuf, resolve, reject);
-          if (p && typeof p.then === "function") { p.then(resolve, reject); }
-        } catch (e) { reject(e); }
-      });
-      debugBubble("decoded: duration=" + decoded.duration.toFixed(1) + "s");
-      try { if (currentSource) { currentSource.stop(); } } catch (e) {}
-      var source = ctx.createBufferSource();
-      source.buffer = decoded;
-      source.connect(ctx.destination);
-      currentSource = source;
-      source.start(0);
-      debugBubble("AudioContext source started");
-    } catch (e) {
-      debugBubble("AudioContext failed: " + e.message + ", using speechSynthesis");
-      speakFallback(fallbackText);
-    }
-  }
-
-  if ("speechSynthesis" in window) {
-    window.speechSynthesis.onvoiceschanged = () => {
-      selectedVoice = pickVoice();
-    };
-  }
-
-  async function askMicPermission() {
-    try {
-      if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
-        micReady = false;
-        return false;
-      }
-      const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-      stream.getTracks().forEach(track => track.stop());
-      micReady = true;
-      return true;
-    } catch (err) {
-      console.error("Microphone permission error:", err);
-      micReady = false;
-      return false;
-    }
-  }
 
-  async function startMic() {
-    const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
-    if (!SpeechRecognition) {
-      addBubble("Voice input is not supported in this browser.", "bot");
-      return;
-    }
-    if (!micReady) {
-      const ok = await askMicPermission();
-      if (!ok) {
-        addBubble("Microphone permission was blocked. Please allow microphone access and try again.", "bot");
-        return;
-      }
-    }
-    if (!recognition) {
-      recognition = new SpeechRecognition();
-      recognition.lang = "en-US";
-      recognition.interimResults = false;
-      recognition.maxAlternatives = 1;
-      recognition.onstart = function () {
-        micBtn.disabled = true;
-        micBtn.textContent = "\U0001f3a4 Listening...";
-      };
-      recognition.onend = function () {
-        micBtn.disabled = false;
-        micBtn.textContent = "\U0001f3a4 Speak";
-      };
-      recognition.onerror = function (event) {
-        console.error("Speech recognition error:", event.error);
-        let message = "Microphone error. Please try again.";
-        if (event.error === "not-allowed") {
-          message = "Microphone permission was denied. Please allow mic access and try again.";
-          micReady = false;
-        } else if (event.error === "no-speech") {
-          message = "I did not hear anything. Try speaking again.";
-        } else if (event.error === "audio-capture") {
-          message = "No microphone was found or it is unavailable.";
-        }
-        addBubble(message, "bot");
-        micBtn.disabled = false;
-        micBtn.textContent = "\U0001f3a4 Speak";
-      };
-      recognition.onresult = function (event) {
-        const transcript = event.results[0][0].transcript;
-        input.value = transcript;
-        send();
-      };
-    }
-    try {
-      recognition.start();
-    } catch (err) {
-      console.error("Recognition start error:", err);
-      addBubble("Could not start microphone. Please try again.", "bot");
-    }
-  }
-
-  function showLogin() {
-    loginError.textContent = "";
-    loginOverlay.classList.add("show");
-    loginUser.focus();
-  }
-
-  function hideLogin() {
-    loginOverlay.classList.remove("show");
-  }
-
-  function updateLoginUi() {
-    loginStatus.textContent = loggedIn ? "Logged in" : "Not logged in";
-    openLoginBtn.textContent = loggedIn ? "Dashboard" : "Log in";
-  }
-
-  async function submitLogin() {
-    const username = loginUser.value.trim();
-    const password = loginPass.value;
-    loginError.textContent = "";
-    if (!username || !password) {
-      loginError.textContent = "Enter username and password.";
-      return;
-    }
-    try {
-      const res = await fetch("/api/login", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "X-Parable-SID": getOrCreateSid()
-        },
-        credentials: "same-origin",
-        body: JSON.stringify({ username, password })
-      });
-      const data = await res.json();
-      if (!res.ok) {
-        loginError.textContent = data.error || "Login failed.";
-        return;
-      }
-      loggedIn = true;
-      updateLoginUi();
-      hideLogin();
-      loginPass.value = "";
-      loadUsage();
-      if (data.redirect) {
-        window.location.href = data.redirect;
-        return;
-      }
-      addBubble("You are logged in.", "bot");
-    } catch (e) {
-      loginError.textContent = "Login error. Try again.";
-    }
-  }
-
-  function showPreview(file) {
-    const url = URL.createObjectURL(file);
-    previewImg.src = url;
-    preview.style.display = "flex";
-  }
-
-  function clearSelectedPhoto() {
-    selectedFile = null;
-    uploadedUrl = null;
-    photoInput.value = "";
-    previewImg.src = "";
-    preview.style.display = "none";
-  }
-
-  async function uploadSelectedPhotoIfNeeded() {
-    if (!selectedFile) return null;
-    if (uploadedUrl) return uploadedUrl;
-
-    const fd = new FormData();
-    fd.append("file", selectedFile);
-
-    const res = await fetch("/api/upload-image", {
-      method: "POST",
-      headers: { "X-Parable-SID": getOrCreateSid() },
-      credentials: "same-origin",
-      body: fd
-    });
-
-    if (res.status === 401) {
-      addBubble("Please log in to upload photos.", "bot");
-      showLogin();
-      return null;
-    }
+DASHBOARD_PAGE = PageTemplate(link_assets(DASHBOARD_HTML))
+CHAT_PAGE = PageTemplate(link_assets(CHAT_PAGE_HTML), slots=("LOGGED_IN", "LOGIN_STATUS", "LOGIN_BUTTON", "SAFE_TOPIC"))
 
-    const data = await res.json();
-    if (!res.ok || !data.ok) {
-      addBubble(data.error || data.detail || "Upload failed.", "bot");
-      return null;
-    }
 
-    uploadedUrl = data.url;
-    return uploadedUrl;
-  }
-
-  async function send() {
-    const message = input.value.trim();
-    greetOnce();
-    if (!message && !selectedFile) return;
-
-    const label = message || "[Photo sent]";
-    addBubble(label, "you");
-
-    if (selectedFile) {
-      const imgRow = document.createElement("div");
-      imgRow.className = "row you";
-      const img = document.createElement("img");
-      img.src = URL.createObjectURL(selectedFile);
-      img.style.maxWidth = "160px";
-      img.style.maxHeight = "180px";
-      img.style.objectFit = "cover";
-      img.style.borderRadius = "12px";
-      img.style.border = "1px solid #e5e7eb";
-      imgRow.appendChild(img);
-      chatbox.appendChild(imgRow);
-      scrollChatToBottom();
+def chat_page_values(logged_in: bool, topic: str) -> Dict[str, str]:
+    return {
+        "LOGGED_IN": "true" if logged_in else "false",
+        "LOGIN_STATUS": "Logged in" if logged_in else "Not logged in",
+        "LOGIN_BUTTON": "Dashboard" if logged_in else "Log in",
+        "SAFE_TOPIC": script_json(topic),
     }
 
-    input.value = "";
-    input.focus();
-    btn.disabled = true;
-
-    try {
-      const photoUrl = await uploadSelectedPhotoIfNeeded();
-      if (selectedFile && !photoUrl) {
-        btn.disabled = false;
-        return;
-      }
-      const res = await fetch("/api/chat", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "X-Parable-SID": getOrCreateSid()
-        },
-        credentials: "same-origin",
-        body: JSON.stringify({ message: message || "", image_url: photoUrl })
-      });
-      const data = await res.json();
-      addBubble(data.answer || data.error || ("HTTP " + res.status), "bot");
-      updateUsageUi(data);
-      if (photoUrl) {
-        clearSelectedPhoto();
-      }
-    } catch (e) {
-      addBubble("Network or server error.", "bot");
-    } finally {
-      btn.disabled = false;
-    }
-  }
 
-  function quick(text) {
-    input.value = text;
-    send();
-  }
+# The common no-topic case is served from fully rendered variants.
+_chat_page_variants: Dict[bool, bytes] = {
+    logged_in: CHAT_PAGE.render(**chat_page_values(logged_in, "")) for logged_in in (False, True)
+}
 
-  btn.addEventListener("click", () => {
-    if (preferVoice) { unlockAudio(); }
-    send();
-  });
 
-  input.addEventListener("keydown", (e) => {
-    if (e.key === "Enter") {
-      send();
-    }
-  });
-
-  micBtn.addEventListener("click", async () => {
-    greetOnce();
-    preferVoice = true;
-    // Unlock the AudioContext inside the user gesture so deferred
-    // TTS playback works in iOS WKWebView and Android WebView.
-    unlockAudio();
-    if ("speechSynthesis" in window) {
-      var warmup = new SpeechSynthesisUtterance("");
-      warmup.volume = 0;
-      window.speechSynthesis.speak(warmup);
-    }
-    await startMic();
-  });
+def render_chat_page(logged_in: bool, topic: str) -> bytes:
+    if not topic:
+        return _chat_page_variants[logged_in]
+    return CHAT_PAGE.render(**chat_page_values(logged_in, topic))
 
-  openLoginBtn.addEventListener("click", () => {
-    if (loggedIn) {
-      window.location.href = "/dashboard";
-      return;
-    }
-    showLogin();
-  });
 
-  loginSubmit.addEventListener("click", submitLogin);
-  loginClose.addEventListener("click", hideLogin);
+# -------------------------
+# Service worker
+# -------------------------
+# Served from the site root so its scope covers every page.
+# The template lives outside STATIC_DIR: with its placeholders unfilled it is
+# not valid JavaScript and must not be reachable under /static.
+SERVICE_WORKER_SOURCE = BASE_DIR / "templates" / "sw.js"
+SERVICE_WORKER_SHELL_URLS = ["/chat", "/manifest.webmanifest", "/static/icon-192.png", "/static/icon-512.png"]
+# Pages carry the signed-in state in their HTML. The service worker only
+# stores pages marked "0", so a shell rendered for a user never outlives
+# their session in the cache.
+PAGE_LOGGED_IN_HEADER = "X-Parable-Logged-In"
+
+
+def build_service_worker() -> bytes:
+    precache = SERVICE_WORKER_SHELL_URLS + sorted(_asset_urls.values())
+    source = SERVICE_WORKER_SOURCE.read_text(encoding="utf-8")
+    version = hashlib.sha256((source + json.dumps(precache)).encode("utf-8")).hexdigest()[:12]
+    template = PageTemplate(source, slots=("CACHE_VERSION", "PRECACHE_URLS"))
+    return template.render(CACHE_VERSION=version, PRECACHE_URLS=json.dumps(precache))
+
+
+SERVICE_WORKER_SCRIPT = build_service_worker()
+
+
+@app.get("/sw.js")
+def service_worker():
+    resp = Response(content=SERVICE_WORKER_SCRIPT, media_type="text/javascript")
+    # Browsers cap SW script caching at 24h anyway; always revalidate so a
+    # deploy's new cache version is picked up on the next visit.
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
 
-  loginPass.addEventListener("keydown", (e) => {
-    if (e.key === "Enter") {
-      submitLogin();
-    }
-  });
-
-  attachBtn.addEventListener("click", () => {
-    greetOnce();
-    photoInput.click();
-  });
-
-  photoInput.addEventListener("change", () => {
-    const f = photoInput.files && photoInput.files[0];
-    if (!f) return;
-    selectedFile = f;
-    uploadedUrl = null;
-    showPreview(f);
-  });
-
-  clearPhoto.addEventListener("click", clearSelectedPhoto);
-
-  card.addEventListener("click", () => {
-    greetOnce();
-    input.focus();
-  });
-
-  window.addEventListener("load", () => {
-    updateLoginUi();
-    greetOnce();
-    loadUsage();
-    if (initialTopic) {
-      setTimeout(() => {
-        input.value = initialTopic;
-        send();
-      }, 450);
-    }
-  });
-</script>
-</body>
-</html>
-"""
 
-    html = (
-        html.replace("__LOGGED_IN__", "true" if logged_in else "false")
-        .replace("__LOGIN_STATUS__", "Logged in" if logged_in else "Not logged in")
-        .replace("__LOGIN_BUTTON__", "Dashboard" if logged_in else "Log in")
-        .replace("__SAFE_TOPIC__", json.dumps(topic))
-    )
-    resp = HTMLResponse(html)
+# -------------------------
+# Simple pages
+# -------------------------
+@app.get("/", response_class=HTMLResponse)
+def home(request: Request):
+    return chat_page(request)
+
+
+@app.get("/dashboard", response_class=HTMLResponse)
+def dashboard(request: Request):
+    sid = get_sid(request)
+    if not is_logged_in(request, sid):
+        resp = RedirectResponse(url="/", status_code=302)
+        set_sid_cookie(resp, sid)
+        return resp
+
+    resp = HTMLResponse(DASHBOARD_PAGE.render())
+    resp.headers[PAGE_LOGGED_IN_HEADER] = "1"
+    set_sid_cookie(resp, sid)
+    return resp
+
+
+# -------------------------
+# Chat UI
+# -------------------------
+@app.get("/appchat", response_class=HTMLResponse)
+@app.get("/chat", response_class=HTMLResponse)
+def chat_page(request: Request):
+    sid = get_sid(request)
+    logged_in = is_logged_in(request, sid)
+    topic = (request.query_params.get("topic") or "").strip()
+
+    resp = HTMLResponse(render_chat_page(logged_in, topic))
+    resp.headers[PAGE_LOGGED_IN_HEADER] = "1" if logged_in else "0"
     set_sid_cookie(resp, sid)
     return resp
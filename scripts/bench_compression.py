@@ -0,0 +1,94 @@
+"""Compare identity, gzip and brotli sizes of the rendered pages and assets.
+
+Runs offline: pages are rendered from the app's templates and encoded with
+the StreamCompressor settings CompressionMiddleware uses; static assets use
+the levels build_static_assets writes their .gz/.br siblings with. The numbers
+match what a client that negotiates each encoding receives.
+
+    python scripts/bench_compression.py
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# main refuses to import without credentials; the bench never logs in.
+os.environ.setdefault("PARABLE_USERNAME", "bench")
+os.environ.setdefault("PARABLE_PASSWORD", "bench")
+
+import main  # noqa: E402
+
+ROUNDS = 20
+
+
+def compress_once(data: bytes, coding: str, precompressed: bool) -> bytes:
+    if not precompressed:
+        return main.StreamCompressor(coding).compress(data, final=True)
+    if coding == "br":
+        return main.brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def encode(data: bytes, coding: str, precompressed: bool) -> Tuple[int, float]:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        size = len(compress_once(data, coding, precompressed))
+    return size, (time.perf_counter() - started) / ROUNDS * 1000
+
+
+def collect_bodies() -> List[Tuple[str, bytes, bool]]:
+    bodies = [
+        ("/chat (logged out)", main.render_chat_page(False, ""), False),
+        ("/chat (logged in)", main.render_chat_page(True, ""), False),
+        ("/chat?topic=...", main.render_chat_page(False, "How do I turn on two-factor login?"), False),
+        ("/dashboard", main.DASHBOARD_PAGE.render(), False),
+        ("/sw.js", main.build_service_worker(), False),
+    ]
+    for source in sorted(main.ASSET_SRC_DIR.iterdir()):
+        if source.is_file():
+            bodies.append((f"/static/src/{source.name}", source.read_bytes(), True))
+    return bodies
+
+
+def format_row(name: str, identity: int, results: Dict[str, Optional[Tuple[int, float]]]) -> str:
+    cells = [f"{name:<40}", f"{identity:>9}"]
+    for coding in ("gzip", "br"):
+        result = results.get(coding)
+        if result is None:
+            cells.append(f"{'n/a':>22}")
+            continue
+        size, millis = result
+        cells.append(f"{size:>9} {size / identity:>6.1%} {millis:>5.2f}ms")
+    return "  ".join(cells)
+
+
+def main_cli() -> None:
+    codings = ["gzip"] + (["br"] if main.brotli is not None else [])
+    print(f"{'body':<40}  {'identity':>9}  {'gzip (ratio, time)':>22}  {'br (ratio, time)':>22}")
+
+    totals = {"identity": 0, "gzip": 0, "br": 0}
+    for name, body, precompressed in collect_bodies():
+        results = {coding: encode(body, coding, precompressed) for coding in codings}
+        print(format_row(name, len(body), results))
+        totals["identity"] += len(body)
+        for coding, (size, _) in results.items():
+            totals[coding] += size
+
+    summary = [f"total identity={totals['identity']}"]
+    for coding in codings:
+        summary.append(f"{coding}={totals[coding]} ({totals[coding] / totals['identity']:.1%})")
+    if main.brotli is None:
+        summary.append("br skipped: brotli is not installed")
+    print(" | ".join(summary))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,105 @@
+"""Compare inline (base64 data URL) and URL image modes for chat requests.
+
+Runs offline over a sample set of uploads. For each size it reports:
+
+- inline: time to build the data URL with inline_upload_data_url, and the
+  size of the model request body that carries it;
+- url: the request body size, plus the time this app takes to serve the
+  file when the provider fetches it back (in process, so no network).
+
+Network time cannot be measured offline. Pass --fetch-rtt-ms to add the
+provider's round trip back to this server to the URL column, and
+--uplink-mbps to add the time to send the larger inline body to the inline
+column.
+
+    python scripts/bench_image_modes.py [--fetch-rtt-ms 80] [--uplink-mbps 50] [upload filenames...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# main refuses to import without credentials; the bench never logs in.
+os.environ.setdefault("PARABLE_USERNAME", "bench")
+os.environ.setdefault("PARABLE_PASSWORD", "bench")
+
+import main  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+BASE = "http://testserver"
+ROUNDS = 20
+# base64 cost depends only on length, so random bytes stand in for photos.
+SAMPLE_SIZES = (100 * 1024, 500 * 1024, 1024 * 1024, 2 * 1024 * 1024, 4 * 1024 * 1024)
+
+
+def timed(fn: Callable[[], object]) -> float:
+    samples = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def request_bytes(image_input: str) -> int:
+    return len(json.dumps(main.build_chat_input("What is this?", image_input, None, [])))
+
+
+def write_samples() -> List[str]:
+    names = []
+    for size in SAMPLE_SIZES:
+        name = f"bench-{uuid.uuid4().hex}.jpg"
+        (main.UPLOADS_DIR / name).write_bytes(os.urandom(size))
+        names.append(name)
+    return names
+
+
+def bench_file(client: TestClient, name: str) -> Tuple[int, float, int, float, int]:
+    image_url = f"{BASE}/static/uploads/{name}"
+    data_url = main.inline_upload_data_url(image_url, BASE)
+    if data_url is None:
+        raise SystemExit(f"{name}: not inlinable (missing, unknown type or over CHAT_IMAGE_INLINE_MAX_BYTES)")
+
+    inline_ms = timed(lambda: main.inline_upload_data_url(image_url, BASE))
+    fetch_ms = timed(lambda: client.get(f"/static/uploads/{name}", headers={"Accept-Encoding": "identity"}))
+    size = (main.UPLOADS_DIR / name).stat().st_size
+    return size, inline_ms, request_bytes(data_url), fetch_ms, request_bytes(image_url)
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="filenames under static/uploads (default: generated samples)")
+    parser.add_argument("--fetch-rtt-ms", type=float, default=0.0, help="network round trip added to URL mode")
+    parser.add_argument("--uplink-mbps", type=float, default=0.0, help="upload bandwidth to the model provider")
+    args = parser.parse_args()
+
+    generated = [] if args.files else write_samples()
+    names = args.files or generated
+    try:
+        with TestClient(main.app) as client:
+            print(f"{'file bytes':>10}  {'inline ms':>9}  {'inline body':>11}  {'url ms':>7}  {'url body':>8}")
+            for name in names:
+                size, inline_ms, inline_body, fetch_ms, url_body = bench_file(client, name)
+                url_ms = fetch_ms + args.fetch_rtt_ms
+                if args.uplink_mbps > 0:
+                    # Only the bytes inline mode adds over URL mode.
+                    inline_ms += (inline_body - url_body) * 8 / (args.uplink_mbps * 1000)
+                print(f"{size:>10}  {inline_ms:>9.2f}  {inline_body:>11}  {url_ms:>7.2f}  {url_body:>8}")
+    finally:
+        for name in generated:
+            (main.UPLOADS_DIR / name).unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main_cli()
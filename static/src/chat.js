@@ -0,0 +1,725 @@
+const chatbox = document.getElementById("chatbox");
+const input = document.getElementById("msg");
+const btn = document.getElementById("btn");
+const micBtn = document.getElementById("mic");
+const card = document.getElementById("card");
+const usageStatus = document.getElementById("usageStatus");
+const attachBtn = document.getElementById("attach");
+const photoInput = document.getElementById("photoInput");
+const preview = document.getElementById("preview");
+const previewImg = document.getElementById("previewImg");
+const clearPhoto = document.getElementById("clearPhoto");
+const loginOverlay = document.getElementById("loginOverlay");
+const openLoginBtn = document.getElementById("openLoginBtn");
+const loginSubmit = document.getElementById("loginSubmit");
+const loginClose = document.getElementById("loginClose");
+const loginUser = document.getElementById("loginUser");
+const loginPass = document.getElementById("loginPass");
+const loginError = document.getElementById("loginError");
+const loginStatus = document.getElementById("loginStatus");
+
+let greeted = false;
+let recognition = null;
+let preferVoice = null;
+let selectedVoice = null;
+let micReady = false;
+const pageConfig = JSON.parse(document.getElementById("pageConfig").textContent);
+let loggedIn = pageConfig.loggedIn;
+let initialTopic = pageConfig.topic;
+let selectedFile = null;
+let uploadedUrl = null;
+
+btn.disabled = true;
+micBtn.disabled = true;
+
+function getOrCreateSid() {
+  const key = "parable_sid";
+  let sid = localStorage.getItem(key);
+  if (!sid || sid.length < 10) {
+    sid = (crypto.randomUUID
+      ? crypto.randomUUID().replace(/-/g, "")
+      : (Date.now() + "-" + Math.random()).replace(/[^a-zA-Z0-9-_]/g, ""));
+    localStorage.setItem(key, sid);
+  }
+  return sid;
+}
+
+function updateUsageUi(data) {
+  if (!data) return;
+  usageStatus.textContent = data.logged_in ? "Logged in account active." : "Chat is ready.";
+}
+
+async function loadUsage() {
+  try {
+    const res = await fetch("/api/me", {
+      headers: { "X-Parable-SID": getOrCreateSid() },
+      credentials: "same-origin"
+    });
+    const data = await res.json();
+    if (res.ok) {
+      loggedIn = data.logged_in;
+      updateLoginUi();
+      updateUsageUi(data);
+    }
+  } catch (e) {
+    console.error("Status load failed", e);
+  }
+}
+
+function scrollChatToBottom() {
+  chatbox.scrollTop = chatbox.scrollHeight;
+}
+
+function addBubble(text, who) {
+  const row = document.createElement("div");
+  row.className = "row " + who;
+  const bubble = document.createElement("div");
+  bubble.className = "bubble";
+  bubble.textContent = text;
+  row.appendChild(bubble);
+  chatbox.appendChild(row);
+  scrollChatToBottom();
+  if (who === "bot" && preferVoice === true) {
+    speak(text);
+  }
+}
+
+function addStreamingBubble() {
+  const row = document.createElement("div");
+  row.className = "row bot";
+  const bubble = document.createElement("div");
+  bubble.className = "bubble";
+  bubble.textContent = "...";
+  row.appendChild(bubble);
+  chatbox.appendChild(row);
+  scrollChatToBottom();
+  return bubble;
+}
+
+async function readChatStream(res) {
+  const bubble = addStreamingBubble();
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let text = "";
+  let result = null;
+
+  while (true) {
+    const step = await reader.read();
+    if (step.done) break;
+    buffer += decoder.decode(step.value, { stream: true });
+    let sep = buffer.indexOf("\n\n");
+    while (sep !== -1) {
+      const block = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      sep = buffer.indexOf("\n\n");
+      if (!block.startsWith("data:")) continue;
+      const event = JSON.parse(block.slice(5));
+      if (event.type === "delta") {
+        text += event.text;
+        bubble.textContent = text;
+        scrollChatToBottom();
+      } else {
+        result = event;
+      }
+    }
+  }
+
+  if (!result) {
+    result = { ok: false, error: "Network or server error." };
+  }
+  bubble.textContent = result.answer || result.error || text;
+  scrollChatToBottom();
+  if (result.ok && preferVoice === true) {
+    speak(result.answer);
+  }
+  return result;
+}
+
+function greetOnce() {
+  if (greeted) return;
+  greeted = true;
+  addBubble("You can type, speak, or upload a photo.", "bot");
+  btn.disabled = false;
+  micBtn.disabled = false;
+  input.focus();
+}
+
+function pickVoice() {
+  const voices = window.speechSynthesis.getVoices();
+  if (!voices || voices.length === 0) return null;
+  // Prefer neural / natural voices — these sound human, not robotic.
+  // Avoid legacy voices like Microsoft Zira, David, etc.
+  const preferred = [
+    "Microsoft Aria Online",
+    "Microsoft Jenny Online",
+    "Microsoft Guy Online",
+    "Microsoft Ana Online",
+    "Microsoft Andrew Online",
+    "Microsoft Emma Online",
+    "Google US English",
+    "Samantha",
+    "Karen",
+    "Daniel"
+  ];
+  for (const name of preferred) {
+    const v = voices.find(x => x.name && x.name.includes(name));
+    if (v) return v;
+  }
+  // Pick any "Online" or "Natural" voice before falling back to legacy
+  const neural = voices.find(v =>
+    (v.lang || "").startsWith("en") &&
+    (/online|natural|neural/i.test(v.name))
+  );
+  if (neural) return neural;
+  return voices.find(v => (v.lang || "").startsWith("en")) || voices[0];
+}
+
+// Web Audio path — works in iOS WKWebView / Android WebView where
+// HTMLAudioElement.play() outside a direct user gesture is blocked.
+var audioCtx = null;
+var currentSource = null;
+
+function getAudioCtx() {
+  if (!audioCtx) {
+    var Ctor = window.AudioContext || window.webkitAudioContext;
+    if (!Ctor) return null;
+    audioCtx = new Ctor();
+  }
+  return audioCtx;
+}
+
+function unlockAudio() {
+  var ctx = getAudioCtx();
+  if (!ctx) return;
+  if (ctx.state === "suspended" && typeof ctx.resume === "function") {
+    ctx.resume().catch(function () {});
+  }
+  try {
+    var buf = ctx.createBuffer(1, 1, 22050);
+    var src = ctx.createBufferSource();
+    src.buffer = buf;
+    src.connect(ctx.destination);
+    if (typeof src.start === "function") { src.start(0); }
+    else if (typeof src.noteOn === "function") { src.noteOn(0); }
+  } catch (e) {}
+}
+
+// Called by the Android native shell from inside the mic-tap gesture,
+// since the native hook preventDefaults the web mic handler.
+window.nativeVoiceUnlock = function () {
+  preferVoice = true;
+  unlockAudio();
+};
+
+function speakFallback(text) {
+  if (!("speechSynthesis" in window)) return;
+  window.speechSynthesis.cancel();
+  if (!selectedVoice) { selectedVoice = pickVoice(); }
+  var t = (text || "").trim();
+  if (t.length > 500) { t = t.slice(0, 500) + "..."; }
+  var u = new SpeechSynthesisUtterance(t);
+  if (selectedVoice) { u.voice = selectedVoice; }
+  u.rate = 0.95;
+  u.pitch = 1.0;
+  u.volume = 1.0;
+  window.speechSynthesis.speak(u);
+}
+
+function debugBubble(msg) {
+  var row = document.createElement("div");
+  row.className = "row bot";
+  var bubble = document.createElement("div");
+  bubble.className = "bubble";
+  bubble.style.fontSize = "14px";
+  bubble.style.opacity = "0.7";
+  bubble.textContent = "[debug] " + msg;
+  row.appendChild(bubble);
+  chatbox.appendChild(row);
+  scrollChatToBottom();
+}
+
+async function speak(text) {
+  var t = (text || "").trim();
+  if (!t) return;
+  if (t.length > 1500) { t = t.slice(0, 1500); }
+
+  debugBubble("speak() called, preferVoice=" + preferVoice);
+
+  // Step 0: stream straight into an audio element so playback starts on
+  // the first chunk. If the browser blocks it, fall through to the
+  // buffered fetch + AudioContext path below, reusing the same URL so the
+  // speech is only synthesized and rate limited once.
+  var streamUrl = null;
+  try {
+    streamUrl = await requestStreamUrl(t);
+  } catch (e) {
+    debugBubble("stream url error: " + e.message);
+  }
+  if (streamUrl && await tryStreamingAudio(streamUrl)) return;
+
+  // Step 1: fetch TTS audio from server. A stream link is single-use once
+  // synthesis starts, so if the blocked element already spent it (404) the
+  // buffered request goes through /api/speak instead.
+  var blob;
+  try {
+    var res = null;
+    if (streamUrl) {
+      res = await fetch(streamUrl, { credentials: "same-origin" });
+      if (res.status === 404) { res = null; }
+    }
+    if (!res) {
+      res = await fetch("/api/speak", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-Parable-SID": getOrCreateSid()
+        },
+        credentials: "same-origin",
+        body: JSON.stringify({ text: t })
+      });
+    }
+    debugBubble("fetch status=" + res.status + " type=" + res.headers.get("content-type"));
+    if (!res.ok) {
+      debugBubble("fetch failed, trying fallback");
+      speakFallback(t);
+      return;
+    }
+    blob = await res.blob();
+    debugBubble("blob size=" + blob.size + " type=" + blob.type);
+  } catch (e) {
+    debugBubble("fetch error: " + e.message);
+    speakFallback(t);
+    return;
+  }
+
+  // Step 2: try HTMLAudioElement (works when mediaPlaybackRequiresUserGesture=false)
+  try {
+    var url = URL.createObjectURL(blob);
+    var audio = new Audio(url);
+    audio.onended = function () { URL.revokeObjectURL(url); };
+    audio.onerror = function () {
+      debugBubble("Audio element error: " + (audio.error ? audio.error.message : "unknown"));
+    };
+    var playResult = audio.play();
+    if (playResult && typeof playResult.then === "function") {
+      playResult.then(function () {
+        debugBubble("Audio element playing OK");
+      }).catch(function (err) {
+        debugBubble("Audio element blocked: " + err.message + ", trying AudioContext");
+        tryAudioContext(blob, t);
+      });
+    } else {
+      debugBubble("Audio element play() returned sync (old browser)");
+    }
+  } catch (e) {
+    debugBubble("Audio element error: " + e.message + ", trying AudioContext");
+    tryAudioContext(blob, t);
+  }
+}
+
+async function requestStreamUrl(text) {
+  // The text goes in a POST body; the server hands back a short-lived URL
+  // for the audio element, which can only issue GETs.
+  var res = await fetch("/api/speak/stream", {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "X-Parable-SID": getOrCreateSid()
+    },
+    credentials: "same-origin",
+    body: JSON.stringify({ text: text })
+  });
+  if (!res.ok) {
+    debugBubble("stream url status=" + res.status);
+    return null;
+  }
+  var data = await res.json();
+  return data.url || null;
+}
+
+async function tryStreamingAudio(url) {
+  var audio = new Audio();
+  audio.preload = "none";
+  audio.onerror = function () {
+    debugBubble("Streaming audio error: " + (audio.error ? audio.error.message : "unknown"));
+  };
+  audio.src = url;
+  try {
+    var playResult = audio.play();
+    if (playResult && typeof playResult.then === "function") {
+      await playResult;
+    }
+    debugBubble("Streaming audio playing OK");
+    return true;
+  } catch (e) {
+    // Drop the src so any request the element already opened is aborted;
+    // the buffered path below fetches the same URL instead.
+    audio.removeAttribute("src");
+    audio.load();
+    debugBubble("Streaming audio blocked: " + e.message + ", trying buffered audio");
+    return false;
+  }
+}
+
+async function tryAudioContext(blob, fallbackText) {
+  var ctx = getAudioCtx();
+  if (!ctx) {
+    debugBubble("no AudioContext, using speechSynthesis");
+    speakFallback(fallbackText);
+    return;
+  }
+  try {
+    debugBubble("AudioContext state=" + ctx.state);
+    if (ctx.state === "suspended") {
+      try { await ctx.resume(); } catch (e) {}
+      debugBubble("AudioContext after resume=" + ctx.state);
+    }
+    var arrayBuf = await blob.arrayBuffer();
+    var decoded = await new Promise(function (resolve, reject) {
+      try {
+        var p = ctx.decodeAudioData(arrayBuf, resolve, reject);
+        if (p && typeof p.then === "function") { p.then(resolve, reject); }
+      } catch (e) { reject(e); }
+    });
+    debugBubble("decoded: duration=" + decoded.duration.toFixed(1) + "s");
+    try { if (currentSource) { currentSource.stop(); } } catch (e) {}
+    var source = ctx.createBufferSource();
+    source.buffer = decoded;
+    source.connect(ctx.destination);
+    currentSource = source;
+    source.start(0);
+    debugBubble("AudioContext source started");
+  } catch (e) {
+    debugBubble("AudioContext failed: " + e.message + ", using speechSynthesis");
+    speakFallback(fallbackText);
+  }
+}
+
+if ("speechSynthesis" in window) {
+  window.speechSynthesis.onvoiceschanged = () => {
+    selectedVoice = pickVoice();
+  };
+}
+
+async function askMicPermission() {
+  try {
+    if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+      micReady = false;
+      return false;
+    }
+    const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+    stream.getTracks().forEach(track => track.stop());
+    micReady = true;
+    return true;
+  } catch (err) {
+    console.error("Microphone permission error:", err);
+    micReady = false;
+    return false;
+  }
+}
+
+async function startMic() {
+  const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
+  if (!SpeechRecognition) {
+    addBubble("Voice input is not supported in this browser.", "bot");
+    return;
+  }
+  if (!micReady) {
+    const ok = await askMicPermission();
+    if (!ok) {
+      addBubble("Microphone permission was blocked. Please allow microphone access and try again.", "bot");
+      return;
+    }
+  }
+  if (!recognition) {
+    recognition = new SpeechRecognition();
+    recognition.lang = "en-US";
+    recognition.interimResults = false;
+    recognition.maxAlternatives = 1;
+    recognition.onstart = function () {
+      micBtn.disabled = true;
+      micBtn.textContent = "🎤 Listening...";
+    };
+    recognition.onend = function () {
+      micBtn.disabled = false;
+      micBtn.textContent = "🎤 Speak";
+    };
+    recognition.onerror = function (event) {
+      console.error("Speech recognition error:", event.error);
+      let message = "Microphone error. Please try again.";
+      if (event.error === "not-allowed") {
+        message = "Microphone permission was denied. Please allow mic access and try again.";
+        micReady = false;
+      } else if (event.error === "no-speech") {
+        message = "I did not hear anything. Try speaking again.";
+      } else if (event.error === "audio-capture") {
+        message = "No microphone was found or it is unavailable.";
+      }
+      addBubble(message, "bot");
+      micBtn.disabled = false;
+      micBtn.textContent = "🎤 Speak";
+    };
+    recognition.onresult = function (event) {
+      const transcript = event.results[0][0].transcript;
+      input.value = transcript;
+      send();
+    };
+  }
+  try {
+    recognition.start();
+  } catch (err) {
+    console.error("Recognition start error:", err);
+    addBubble("Could not start microphone. Please try again.", "bot");
+  }
+}
+
+function showLogin() {
+  loginError.textContent = "";
+  loginOverlay.classList.add("show");
+  loginUser.focus();
+}
+
+function hideLogin() {
+  loginOverlay.classList.remove("show");
+}
+
+function updateLoginUi() {
+  loginStatus.textContent = loggedIn ? "Logged in" : "Not logged in";
+  openLoginBtn.textContent = loggedIn ? "Dashboard" : "Log in";
+}
+
+async function submitLogin() {
+  const username = loginUser.value.trim();
+  const password = loginPass.value;
+  loginError.textContent = "";
+  if (!username || !password) {
+    loginError.textContent = "Enter username and password.";
+    return;
+  }
+  try {
+    const res = await fetch("/api/login", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-Parable-SID": getOrCreateSid()
+      },
+      credentials: "same-origin",
+      body: JSON.stringify({ username, password })
+    });
+    const data = await res.json();
+    if (!res.ok) {
+      loginError.textContent = data.error || "Login failed.";
+      return;
+    }
+    loggedIn = true;
+    updateLoginUi();
+    hideLogin();
+    loginPass.value = "";
+    loadUsage();
+    if (data.redirect) {
+      window.location.href = data.redirect;
+      return;
+    }
+    addBubble("You are logged in.", "bot");
+  } catch (e) {
+    loginError.textContent = "Login error. Try again.";
+  }
+}
+
+function showPreview(file) {
+  const url = URL.createObjectURL(file);
+  previewImg.src = url;
+  preview.style.display = "flex";
+}
+
+function clearSelectedPhoto() {
+  selectedFile = null;
+  uploadedUrl = null;
+  photoInput.value = "";
+  previewImg.src = "";
+  preview.style.display = "none";
+}
+
+async function uploadSelectedPhotoIfNeeded() {
+  if (!selectedFile) return null;
+  if (uploadedUrl) return uploadedUrl;
+
+  const fd = new FormData();
+  fd.append("file", selectedFile);
+
+  const res = await fetch("/api/upload-image", {
+    method: "POST",
+    headers: { "X-Parable-SID": getOrCreateSid() },
+    credentials: "same-origin",
+    body: fd
+  });
+
+  if (res.status === 401) {
+    addBubble("Please log in to upload photos.", "bot");
+    showLogin();
+    return null;
+  }
+
+  const data = await res.json();
+  if (!res.ok || !data.ok) {
+    addBubble(data.error || data.detail || "Upload failed.", "bot");
+    return null;
+  }
+
+  uploadedUrl = data.url;
+  return uploadedUrl;
+}
+
+async function send() {
+  const message = input.value.trim();
+  greetOnce();
+  if (!message && !selectedFile) return;
+
+  const label = message || "[Photo sent]";
+  addBubble(label, "you");
+
+  if (selectedFile) {
+    const imgRow = document.createElement("div");
+    imgRow.className = "row you";
+    const img = document.createElement("img");
+    img.src = URL.createObjectURL(selectedFile);
+    img.style.maxWidth = "160px";
+    img.style.maxHeight = "180px";
+    img.style.objectFit = "cover";
+    img.style.borderRadius = "12px";
+    img.style.border = "1px solid #e5e7eb";
+    imgRow.appendChild(img);
+    chatbox.appendChild(imgRow);
+    scrollChatToBottom();
+  }
+
+  input.value = "";
+  input.focus();
+  btn.disabled = true;
+
+  try {
+    const photoUrl = await uploadSelectedPhotoIfNeeded();
+    if (selectedFile && !photoUrl) {
+      btn.disabled = false;
+      return;
+    }
+    const res = await fetch("/api/chat/stream", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream",
+        "X-Parable-SID": getOrCreateSid()
+      },
+      credentials: "same-origin",
+      body: JSON.stringify({ message: message || "", image_url: photoUrl })
+    });
+    const contentType = res.headers.get("content-type") || "";
+    let data;
+    if (res.ok && res.body && contentType.indexOf("text/event-stream") !== -1) {
+      data = await readChatStream(res);
+    } else {
+      data = await res.json();
+      addBubble(data.answer || data.error || ("HTTP " + res.status), "bot");
+    }
+    updateUsageUi(data);
+    if (photoUrl) {
+      clearSelectedPhoto();
+    }
+  } catch (e) {
+    addBubble("Network or server error.", "bot");
+  } finally {
+    btn.disabled = false;
+  }
+}
+
+function quick(text) {
+  input.value = text;
+  send();
+}
+
+document.querySelectorAll("button[data-quick]").forEach((el) => {
+  el.addEventListener("click", () => quick(el.dataset.quick));
+});
+
+btn.addEventListener("click", () => {
+  if (preferVoice) { unlockAudio(); }
+  send();
+});
+
+input.addEventListener("keydown", (e) => {
+  if (e.key === "Enter") {
+    send();
+  }
+});
+
+micBtn.addEventListener("click", async () => {
+  greetOnce();
+  preferVoice = true;
+  // Unlock the AudioContext inside the user gesture so deferred
+  // TTS playback works in iOS WKWebView and Android WebView.
+  unlockAudio();
+  if ("speechSynthesis" in window) {
+    var warmup = new SpeechSynthesisUtterance("");
+    warmup.volume = 0;
+    window.speechSynthesis.speak(warmup);
+  }
+  await startMic();
+});
+
+openLoginBtn.addEventListener("click", () => {
+  if (loggedIn) {
+    window.location.href = "/dashboard";
+    return;
+  }
+  showLogin();
+});
+
+loginSubmit.addEventListener("click", submitLogin);
+loginClose.addEventListener("click", hideLogin);
+
+loginPass.addEventListener("keydown", (e) => {
+  if (e.key === "Enter") {
+    submitLogin();
+  }
+});
+
+attachBtn.addEventListener("click", () => {
+  greetOnce();
+  photoInput.click();
+});
+
+photoInput.addEventListener("change", () => {
+  const f = photoInput.files && photoInput.files[0];
+  if (!f) return;
+  selectedFile = f;
+  uploadedUrl = null;
+  showPreview(f);
+});
+
+clearPhoto.addEventListener("click", clearSelectedPhoto);
+
+card.addEventListener("click", () => {
+  greetOnce();
+  input.focus();
+});
+
+window.addEventListener("load", () => {
+  updateLoginUi();
+  greetOnce();
+  loadUsage();
+  if (initialTopic) {
+    setTimeout(() => {
+      input.value = initialTopic;
+      send();
+    }, 450);
+  }
+});
+
+if ("serviceWorker" in navigator) {
+  window.addEventListener("load", () => {
+    navigator.serviceWorker.register("/sw.js").catch((e) => {
+      console.error("Service worker registration failed", e);
+    });
+  });
+}
@@ -0,0 +1,145 @@
+function formatTime(ts) {
+  if (!ts) return "Unknown";
+  try {
+    return new Date(ts * 1000).toLocaleString();
+  } catch (e) {
+    return "Unknown";
+  }
+}
+
+function yesNoUnknown(value) {
+  if (value === true) return "Yes";
+  if (value === false) return "No";
+  return "Unknown";
+}
+
+function titleCase(text) {
+  const raw = (text || "unknown").replace(/_/g, " ");
+  return raw.charAt(0).toUpperCase() + raw.slice(1);
+}
+
+function setState(el, state) {
+  el.setAttribute("data-state", state || "unknown");
+}
+
+let dashboardSummary = { security: {}, identity: {} };
+
+function renderDashboard(summary) {
+  dashboardSummary = {
+    security: summary.security || {},
+    identity: summary.identity || {}
+  };
+  renderSecurityCard(dashboardSummary.security);
+  renderIdentityCard(dashboardSummary.identity);
+}
+
+function applyDashboardChanges(changes) {
+  if (changes.security) {
+    dashboardSummary.security = Object.assign({}, dashboardSummary.security, changes.security);
+    renderSecurityCard(dashboardSummary.security);
+  }
+  if (changes.identity) {
+    dashboardSummary.identity = Object.assign({}, dashboardSummary.identity, changes.identity);
+    renderIdentityCard(dashboardSummary.identity);
+  }
+}
+
+function subscribeDashboard() {
+  if (!window.EventSource) return;
+  const source = new EventSource("/api/dashboard/stream", { withCredentials: true });
+  source.onmessage = (e) => {
+    let data;
+    try {
+      data = JSON.parse(e.data);
+    } catch (err) {
+      return;
+    }
+    if (data.type === "summary") {
+      renderDashboard(data.summary || {});
+    } else if (data.type === "update") {
+      applyDashboardChanges(data.changes || {});
+    }
+  };
+}
+
+function renderSecurityCard(security) {
+  const securityTile = document.getElementById("securityTile");
+  const securityChip = document.getElementById("securityChip");
+  const securityText = document.getElementById("securityText");
+  const securityPortalBtn = document.getElementById("securityPortalBtn");
+
+  const securityState = security.status || "unknown";
+  setState(securityTile, securityState);
+  securityChip.textContent = titleCase(security.vendor || "Vendor") + " \u2022 " + titleCase(securityState);
+  securityText.textContent = [
+    "Vendor: " + (security.vendor || "Unknown"),
+    "Threats found: " + (security.threats_found ?? 0),
+    "Definitions current: " + yesNoUnknown(security.definitions_current),
+    "Subscription active: " + yesNoUnknown(security.subscription_active),
+    "Covered devices: " + (security.covered_devices ?? 0),
+    "Last seen: " + formatTime(security.last_seen)
+  ].join("\n");
+  if (security.portal_url) {
+    securityPortalBtn.href = security.portal_url;
+    securityPortalBtn.style.display = "inline-flex";
+  }
+}
+
+function renderIdentityCard(identity) {
+  const identityTile = document.getElementById("identityTile");
+  const identityChip = document.getElementById("identityChip");
+  const identityText = document.getElementById("identityText");
+  const identityPortalBtn = document.getElementById("identityPortalBtn");
+
+  let identityState = "unknown";
+  if (identity.alerts_open > 0) {
+    identityState = "warning";
+  } else if (identity.monitoring_active === true) {
+    identityState = "active";
+  }
+  setState(identityTile, identityState);
+  identityChip.textContent = titleCase(identity.vendor || "Vendor") + " \u2022 " + titleCase(identityState);
+  identityText.textContent = [
+    "Monitoring active: " + yesNoUnknown(identity.monitoring_active),
+    "Alerts open: " + (identity.alerts_open ?? 0),
+    "Risk summary: " + (identity.risk_summary || "No summary available"),
+    "ID Lock / Freeze: " + titleCase(identity.id_lock_status || "unknown"),
+    "Subscription active: " + yesNoUnknown(identity.subscription_active),
+    "Last checked: " + formatTime(identity.last_checked)
+  ].join("\n");
+  if (identity.portal_url) {
+    identityPortalBtn.href = identity.portal_url;
+    identityPortalBtn.style.display = "inline-flex";
+  }
+}
+
+async function loadDashboardCards() {
+  try {
+    const res = await fetch("/api/dashboard/summary", { credentials: "same-origin" });
+    renderDashboard(await res.json());
+  } catch (e) {
+    console.error("Dashboard load failed", e);
+  }
+}
+
+async function logout() {
+  try {
+    await fetch("/api/logout", { method: "POST", credentials: "same-origin" });
+  } catch (e) {
+    console.error("Logout failed", e);
+  }
+  window.location.href = "/appchat";
+}
+
+document.getElementById("logoutBtn").addEventListener("click", logout);
+window.addEventListener("load", () => {
+  loadDashboardCards().then(subscribeDashboard);
+});
+
+if ("serviceWorker" in navigator) {
+  window.addEventListener("load", () => {
+    navigator.serviceWorker.register("/sw.js").catch((e) => {
+      console.error("Service worker registration failed", e);
+    });
+  });
+}
@@ -0,0 +1,164 @@
+// Served from /sw.js by the app, which fills in CACHE_VERSION and
+// PRECACHE_URLS. The version changes whenever this file or any
+// fingerprinted asset changes, so a deploy rotates the caches.
+const CACHE_VERSION = "__CACHE_VERSION__";
+const PRECACHE_URLS = __PRECACHE_URLS__;
+
+const CACHE_PREFIX = "parable-";
+const SHELL_CACHE = CACHE_PREFIX + "shell-" + CACHE_VERSION;
+const ASSET_CACHE = CACHE_PREFIX + "assets-" + CACHE_VERSION;
+const API_CACHE = CACHE_PREFIX + "api-" + CACHE_VERSION;
+// Speech is content-addressed, so it stays valid across deploys. Replies
+// that were played before are requested from /static/tts/<key>.mp3.
+const TTS_CACHE = CACHE_PREFIX + "tts-v1";
+const CURRENT_CACHES = [SHELL_CACHE, ASSET_CACHE, API_CACHE, TTS_CACHE];
+
+const TTS_MAX_ENTRIES = 60;
+const OFFLINE_URL = "/chat";
+const SHELL_PAGES = ["/", "/chat", "/appchat", "/dashboard"];
+// Set by the server on pages; only signed-out renders are stored.
+const LOGGED_IN_HEADER = "X-Parable-Logged-In";
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      // Without cookies the precached /chat is the signed-out shell.
+      .then((cache) => cache.addAll(PRECACHE_URLS.map((url) => new Request(url, { credentials: "omit" }))))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((names) => Promise.all(
+        names
+          .filter((name) => name.startsWith(CACHE_PREFIX) && !CURRENT_CACHES.includes(name))
+          .map((name) => caches.delete(name))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (request.method === "POST" && url.pathname === "/api/logout") {
+    // Dashboard data belongs to the signed-in user; drop it on logout,
+    // along with any page a previous worker version stored signed in.
+    event.waitUntil(Promise.all([caches.delete(API_CACHE), forgetSignedInPages()]));
+    return;
+  }
+  if (request.method === "POST" && url.pathname === "/api/speak") {
+    event.respondWith(cachedSpeech(request));
+    return;
+  }
+  if (request.method !== "GET") return;
+
+  if (url.pathname.startsWith("/static/dist/")) {
+    event.respondWith(cacheFirst(request, ASSET_CACHE));
+  } else if (url.pathname.startsWith("/static/tts/")) {
+    event.respondWith(cacheFirst(request, TTS_CACHE, TTS_MAX_ENTRIES));
+  } else if (url.pathname === "/api/dashboard/summary") {
+    event.respondWith(staleWhileRevalidate(event, API_CACHE));
+  } else if (request.mode === "navigate") {
+    event.respondWith(networkFirstPage(request, url));
+  } else if (PRECACHE_URLS.includes(url.pathname)) {
+    event.respondWith(cacheFirst(request, SHELL_CACHE));
+  }
+});
+
+async function trimCache(cache, maxEntries) {
+  const keys = await cache.keys();
+  for (let i = 0; i < keys.length - maxEntries; i++) {
+    await cache.delete(keys[i]);
+  }
+}
+
+async function cacheFirst(request, cacheName, maxEntries) {
+  const cached = await caches.match(request);
+  if (cached) return cached;
+
+  const response = await fetch(request);
+  // 206 partial responses (media range requests) cannot be stored.
+  if (response.status === 200) {
+    const cache = await caches.open(cacheName);
+    await cache.put(request, response.clone());
+    if (maxEntries) await trimCache(cache, maxEntries);
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event, cacheName) {
+  const request = event.request;
+  const cache = await caches.open(cacheName);
+  const cached = await cache.match(request);
+
+  const network = fetch(request).then(async (response) => {
+    if (response.status === 200) {
+      await cache.put(request, response.clone());
+    } else if (response.status === 401) {
+      await cache.delete(request);
+    }
+    return response;
+  });
+
+  if (cached) {
+    event.waitUntil(network.catch(() => undefined));
+    return cached;
+  }
+  return network;
+}
+
+async function networkFirstPage(request, url) {
+  try {
+    const response = await fetch(request);
+    if (
+      response.status === 200 &&
+      !response.redirected &&
+      SHELL_PAGES.includes(url.pathname) &&
+      response.headers.get(LOGGED_IN_HEADER) === "0"
+    ) {
+      const cache = await caches.open(SHELL_CACHE);
+      await cache.put(url.pathname, response.clone());
+    }
+    return response;
+  } catch (e) {
+    const cached = await caches.match(url.pathname);
+    return cached || caches.match(OFFLINE_URL);
+  }
+}
+
+async function forgetSignedInPages() {
+  const cache = await caches.open(SHELL_CACHE);
+  await Promise.all(SHELL_PAGES.map(async (page) => {
+    const cached = await cache.match(page);
+    if (cached && cached.headers.get(LOGGED_IN_HEADER) !== "0") {
+      await cache.delete(page);
+    }
+  }));
+}
+
+async function cachedSpeech(request) {
+  // POST bodies cannot be cache keys, so speech is keyed by its text.
+  let key;
+  try {
+    const body = await request.clone().json();
+    key = new Request("/api/speak?text=" + encodeURIComponent((body.text || "").trim()));
+  } catch (e) {
+    return fetch(request);
+  }
+
+  const cache = await caches.open(TTS_CACHE);
+  const cached = await cache.match(key);
+  if (cached) return cached;
+
+  const response = await fetch(request);
+  if (response.status === 200) {
+    await cache.put(key, response.clone());
+    await trimCache(cache, TTS_MAX_ENTRIES);
+  }
+  return response;
+}
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# main refuses to import without portal credentials.
+os.environ.setdefault("PARABLE_USERNAME", "test-user")
+os.environ.setdefault("PARABLE_PASSWORD", "test-password")
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+import main
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.sqlite3'}")
+    main.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def test_dashboard_queries_use_indexes(sqlite_engine):
+    assert main.check_dashboard_query_plans(sqlite_engine) == {}
+
+
+@pytest.mark.parametrize(
+    "index, query",
+    [
+        ("ix_vendor_alerts_sid_resolved_severity", "open_critical_alerts"),
+        ("ix_vendor_alerts_sid_resolved_vendor", "open_vendor_alerts"),
+    ],
+)
+def test_dropped_alert_index_is_reported(sqlite_engine, index, query):
+    with sqlite_engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {index}"))
+    assert query in main.check_dashboard_query_plans(sqlite_engine)
+
+
+def test_plan_problems_flags_table_scans():
+    assert main.plan_problems(["SCAN vendor_alerts"]) == ["SCAN vendor_alerts"]
+    assert main.plan_problems(["USE TEMP B-TREE FOR ORDER BY"]) == ["USE TEMP B-TREE FOR ORDER BY"]
+    assert main.plan_problems(["SEARCH vendor_alerts USING INDEX ix_vendor_alerts_sid_resolved_severity (sid=?)"]) == []
+    assert main.plan_problems(
+        ["SEARCH vendor_alerts USING INDEX ix_vendor_alerts_sid (sid=?)"],
+        ("ix_vendor_alerts_sid_resolved_severity",),
+    )